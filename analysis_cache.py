@@ -0,0 +1,246 @@
+import hashlib
+import json
+import os
+import struct
+import threading
+import numpy as np
+
+# Format binaire du cache d'analyse :
+#   [magic 4o][version uint32][taille en-tête uint32][en-tête JSON][colonnes alignées sur 64o]
+# L'en-tête décrit les scalaires et, pour chaque colonne, son dtype, sa forme et son offset
+# (relatif au début de la zone de données). Les colonnes sont relues par np.memmap :
+# un hit de cache ne lit sur disque que les frames réellement consultées.
+CACHE_MAGIC = b"KMXA"
+CACHE_VERSION = 2
+_PREFIX = struct.Struct("<4sII")
+_ALIGN = 64
+
+
+def _align(offset):
+    return (offset + _ALIGN - 1) // _ALIGN * _ALIGN
+
+
+def write_analysis_cache(path, meta, arrays):
+    """Écrit les scalaires (meta) et les colonnes numpy (arrays) dans un fichier cache binaire."""
+    columns = {}
+    payload = []
+    offset = 0
+    for name, arr in arrays.items():
+        arr = np.ascontiguousarray(arr)
+        columns[name] = {"dtype": arr.dtype.str, "shape": list(arr.shape), "offset": offset}
+        payload.append((offset, arr))
+        offset = _align(offset + arr.nbytes)
+
+    header_bytes = json.dumps({"meta": meta, "columns": columns}).encode("utf-8")
+    data_start = _align(_PREFIX.size + len(header_bytes))
+
+    # Écriture dans un fichier temporaire puis remplacement atomique :
+    # un lecteur concurrent ne voit jamais un cache à moitié écrit.
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(_PREFIX.pack(CACHE_MAGIC, CACHE_VERSION, len(header_bytes)))
+            f.write(header_bytes)
+            for col_offset, arr in payload:
+                f.seek(data_start + col_offset)
+                f.write(arr.tobytes())
+            f.truncate(data_start + offset)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def read_analysis_cache(path):
+    """Relit un fichier cache. Retourne (meta, arrays) avec des colonnes memory-mappées en lecture seule."""
+    with open(path, "rb") as f:
+        prefix = f.read(_PREFIX.size)
+        if len(prefix) != _PREFIX.size:
+            raise ValueError("Fichier cache tronqué")
+        magic, version, header_len = _PREFIX.unpack(prefix)
+        if magic != CACHE_MAGIC:
+            raise ValueError("Signature de cache invalide")
+        if version != CACHE_VERSION:
+            raise ValueError(f"Version de cache {version} incompatible (attendu {CACHE_VERSION})")
+        header = json.loads(f.read(header_len).decode("utf-8"))
+
+    data_start = _align(_PREFIX.size + header_len)
+    file_size = os.path.getsize(path)
+    arrays = {}
+    for name, col in header["columns"].items():
+        dtype = np.dtype(col["dtype"])
+        shape = tuple(col["shape"])
+        nbytes = dtype.itemsize * int(np.prod(shape, dtype=np.int64))
+        start = data_start + col["offset"]
+        if start + nbytes > file_size:
+            raise ValueError(f"Colonne '{name}' hors limites")
+        if nbytes == 0:
+            # np.memmap refuse les zones vides
+            arrays[name] = np.zeros(shape, dtype=dtype)
+        else:
+            arrays[name] = np.memmap(path, dtype=dtype, mode="r", offset=start, shape=shape)
+    return header["meta"], arrays
+
+
+# Cache central adressé par contenu : une entrée par (hash des octets audio, paramètres d'analyse).
+# Il ne dépend ni du chemin ni de la date de modification du fichier, fonctionne sur les
+# bibliothèques en lecture seule et sur les partages réseau, et reste borné en taille (LRU).
+DEFAULT_CACHE_DIR = os.environ.get("KYMATIX_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".kymatix", "analysis_cache"))
+DEFAULT_CACHE_MAX_BYTES = int(float(os.environ.get("KYMATIX_CACHE_MAX_MB", 2048)) * 1024 * 1024)
+_HASH_CHUNK = 1 << 20
+
+
+class AnalysisCache:
+    """Cache d'analyses partagé : clé = contenu audio + paramètres, éviction LRU au-delà de max_bytes."""
+
+    # Extension des entrées : chaque type d'entrée a son propre budget LRU dans le même dossier
+    SUFFIX = ".analysis.bin"
+
+    def __init__(self, root=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_CACHE_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # Hash de contenu mémorisé par (chemin, taille, mtime) : un fichier n'est lu qu'une fois par session
+        self._content_hashes = {}
+        self._stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+    def content_hash(self, audio_path):
+        """Empreinte BLAKE2 des octets du fichier audio."""
+        st = os.stat(audio_path)
+        memo_key = (os.path.realpath(audio_path), st.st_size, st.st_mtime_ns)
+        with self._lock:
+            digest = self._content_hashes.get(memo_key)
+        if digest is None:
+            h = hashlib.blake2b(digest_size=20)
+            with open(audio_path, "rb") as f:
+                for chunk in iter(lambda: f.read(_HASH_CHUNK), b""):
+                    h.update(chunk)
+            digest = h.hexdigest()
+            with self._lock:
+                self._content_hashes[memo_key] = digest
+        return digest
+
+    def key(self, audio_path, params):
+        """Clé d'entrée : hash du contenu + paramètres d'analyse (triés) + version du format."""
+        params_str = json.dumps(params, sort_keys=True, default=str)
+        unique_str = f"{self.content_hash(audio_path)}|{params_str}|v{CACHE_VERSION}"
+        return hashlib.blake2b(unique_str.encode("utf-8"), digest_size=20).hexdigest()
+
+    def path_for(self, key):
+        return os.path.join(self.root, key[:2], f"{key}{self.SUFFIX}")
+
+    def load(self, key):
+        """Retourne (meta, arrays) ou None. Un hit rafraîchit la date d'accès de l'entrée (LRU)."""
+        path = self.path_for(key)
+        if not os.path.exists(path):
+            with self._lock:
+                self._stats["misses"] += 1
+            return None
+        try:
+            result = read_analysis_cache(path)
+        except ValueError:
+            # Entrée corrompue ou d'une autre version de format : on la traite comme absente
+            self._remove(path)
+            with self._lock:
+                self._stats["misses"] += 1
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        with self._lock:
+            self._stats["hits"] += 1
+        return result
+
+    def store(self, key, meta, arrays):
+        """Écrit l'entrée (remplacement atomique) puis applique la limite de taille."""
+        path = self.path_for(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        write_analysis_cache(path, meta, arrays)
+        with self._lock:
+            self._stats["stores"] += 1
+        self.evict()
+        return path
+
+    def _entries(self):
+        entries = []
+        if not os.path.isdir(self.root):
+            return entries
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                if not name.endswith(self.SUFFIX):
+                    continue
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+            return True
+        except OSError:
+            # Entrée encore memory-mappée ailleurs (Windows) : elle sera évincée plus tard
+            return False
+
+    def evict(self, max_bytes=None):
+        """Supprime les entrées les moins récemment utilisées jusqu'à repasser sous max_bytes."""
+        limit = self.max_bytes if max_bytes is None else max_bytes
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        evicted = 0
+        for _, size, path in entries:
+            if total <= limit:
+                break
+            if self._remove(path):
+                total -= size
+                evicted += 1
+        with self._lock:
+            self._stats["evictions"] += evicted
+        return evicted
+
+    def clear(self):
+        return self.evict(max_bytes=0)
+
+    def stats(self):
+        """Compteurs de la session (hits, misses, stores, evictions) et occupation disque."""
+        entries = self._entries()
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats.update({
+            "hit_rate": stats["hits"] / lookups if lookups else 0.0,
+            "entries": len(entries),
+            "size_bytes": sum(size for _, size, _ in entries),
+            "max_bytes": self.max_bytes,
+            "root": self.root,
+        })
+        return stats
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_analysis_cache():
+    """Instance partagée par tous les analyseurs du processus (GUI, rendu, playlist)."""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = AnalysisCache()
+        return _default_cache
+
+
+def configure_analysis_cache(root=None, max_bytes=None):
+    """Change le dossier et/ou la taille maximale du cache partagé."""
+    cache = get_analysis_cache()
+    with _default_cache_lock:
+        if root is not None:
+            cache.root = root
+        if max_bytes is not None:
+            cache.max_bytes = int(max_bytes)
+    cache.evict()
+    return cache
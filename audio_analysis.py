@@ -1,199 +1,414 @@
 from dataclasses import dataclass
-from typing import List, Dict, Tuple, Optional, Any
+from typing import List, Dict, Tuple, Optional, Any, Callable
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
 import numpy as np
-import json
 import os
-import hashlib
+import time
 import librosa
 from scipy import signal
 from scipy.ndimage import gaussian_filter1d
+from analysis_cache import AnalysisCache, configure_analysis_cache, get_analysis_cache
+from pcm_store import get_pcm_store
+from feature_timeline import write_feature_timeline
+from audio_features import (AdvancedAudioFeatures, FREQUENCY_BANDS, DISPLAY_BINS, DISPLAY_FMIN, DISPLAY_FMAX,
+                            DISPLAY_DB_RANGE, STEM_NAMES, STEM_CHANNELS, stem_uniform_name, BeatGrid, FeatureTableQueries)
+
+# Version des algorithmes d'analyse : à incrémenter quand un résultat change, pour invalider le cache central
+ANALYZER_VERSION = 3
+
+# Passe rapide (aperçu GUI) : 11 kHz, fenêtres 4x plus courtes, même durée de frame (~11.6 ms)
+COARSE_SR = 11025
+COARSE_HOP_LENGTH = 128
+
+# Nombre maximal de points MFCC passés à la segmentation en mode flux
+STREAMING_SEGMENT_POINTS = 4096
+
+def build_band_matrix(freqs: np.ndarray) -> np.ndarray:
+    """Matrice (7 x n_bins) de moyennage par bande : bandes = M @ spectre."""
+    matrix = np.zeros((len(FREQUENCY_BANDS), len(freqs)), dtype=np.float32)
+    for i, (low, high) in enumerate(FREQUENCY_BANDS.values()):
+        mask = (freqs >= low) & (freqs < high)
+        count = np.count_nonzero(mask)
+        if count:
+            matrix[i, mask] = 1.0 / count
+    return matrix
+
+def build_display_matrix(freqs: np.ndarray, n_bins: int = DISPLAY_BINS,
+                         fmin: float = DISPLAY_FMIN, fmax: float = DISPLAY_FMAX) -> np.ndarray:
+    """Matrice (n_bins x n_freqs) vers une échelle log, appliquée aux spectres de puissance.
+    
+    Somme de la puissance des bins FFT de chaque bande, divisée par la bande équivalente de bruit
+    de la fenêtre de Hann (1.5 bin) : un sinus garde sa magnitude crête quelle que soit la largeur
+    de bande. Interpolation linéaire quand la bande est plus étroite qu'un bin (basses).
+    """
+    matrix = np.zeros((n_bins, len(freqs)), dtype=np.float32)
+    edges = np.geomspace(fmin, fmax, n_bins + 1)
+    for i in range(n_bins):
+        low, high = edges[i], edges[i + 1]
+        if low >= freqs[-1]:
+            break   # Au-delà de Nyquist : bins laissés vides
+        mask = (freqs >= low) & (freqs < high)
+        if mask.any():
+            matrix[i, mask] = 1.0 / 1.5
+        else:
+            center = np.sqrt(low * high)
+            j = int(np.clip(np.searchsorted(freqs, center) - 1, 0, len(freqs) - 2))
+            frac = (center - freqs[j]) / (freqs[j + 1] - freqs[j])
+            matrix[i, j], matrix[i, j + 1] = 1.0 - frac, frac
+    return matrix
+
+def quantize_display_spectrum(magnitude: np.ndarray, ref: float) -> np.ndarray:
+    """Magnitudes -> uint8 : 0 à -DISPLAY_DB_RANGE dB sous ref (sinus pleine échelle), 255 à 0 dB"""
+    db = 20.0 * np.log10(np.maximum(magnitude, 1e-10) / ref)
+    return np.round(np.clip(1.0 + db / DISPLAY_DB_RANGE, 0.0, 1.0) * 255.0).astype(np.uint8)
+
+def estimate_tempo(onset_envelope: np.ndarray, sr: int, hop_length: int, chunk_frames: int = 4096) -> float:
+    """Tempo global identique à librosa.feature.tempo, avec le tempogramme moyenné par tranches.
+    
+    librosa matérialise un tempogramme (~690 x n_frames en float64) : plusieurs Go sur un long morceau.
+    """
+    win_length = librosa.time_to_frames(8.0, sr=sr, hop_length=hop_length).item()
+    n_frames = len(onset_envelope)
+    padded = np.pad(onset_envelope, win_length // 2, mode="linear_ramp", end_values=0)
+    ac_window = signal.get_window('hann', win_length, fftbins=True)[:, None]
+    
+    tg_sum = np.zeros(win_length)
+    for start in range(0, n_frames, chunk_frames):
+        stop = min(start + chunk_frames, n_frames)
+        frames = librosa.util.frame(padded[start:stop + win_length - 1], frame_length=win_length, hop_length=1)
+        tg = librosa.util.normalize(librosa.autocorrelate(frames * ac_window, axis=0), norm=np.inf, axis=0)
+        tg_sum += tg.sum(axis=1)
+    
+    mean_tg = (tg_sum / max(n_frames, 1))[:, None]
+    return float(librosa.feature.tempo(tg=mean_tg, sr=sr, hop_length=hop_length, aggregate=None)[0])
 
 @dataclass
-class AdvancedAudioFeatures:
-    """Features audio détaillées pour génération procédurale"""
-    # Bandes de fréquences (0-1)
-    sub_bass: float = 0.0      # 20-60 Hz
-    bass: float = 0.0           # 60-250 Hz
-    low_mid: float = 0.0        # 250-500 Hz
-    mid: float = 0.0            # 500-2000 Hz
-    high_mid: float = 0.0       # 2000-4000 Hz
-    presence: float = 0.0       # 4000-6000 Hz
-    brilliance: float = 0.0     # 6000+ Hz
-    
-    # Caractéristiques rythmiques
-    beat_strength: float = 0.0
-    tempo: float = 120.0
-    onset_detected: bool = False
-    
-    # Caractéristiques spectrales
-    spectral_centroid: float = 0.0
-    spectral_bandwidth: float = 0.0
-    spectral_rolloff: float = 0.0
-    spectral_flux: float = 0.0
-    
-    # Caractéristiques harmoniques
-    harmonicity: float = 0.0
-    pitch: float = 0.0
-    
-    # Énergie globale
-    rms_energy: float = 0.0
-    zcr: float = 0.0  # Zero Crossing Rate
-    
-    # Méta-données de segment
-    segment_type: str = "neutral"  # intro, verse, chorus, bridge, outro
-    intensity: float = 0.5  # 0-1
-    glitch_intensity: float = 0.0  # 0-1, pour effets de drops/glitch
-
-
-# Définition centralisée des bandes de fréquences (Hz)
-FREQUENCY_BANDS = {
-    'sub_bass': (20, 60),
-    'bass': (60, 250),
-    'low_mid': (250, 500),
-    'mid': (500, 2000),
-    'high_mid': (2000, 4000),
-    'presence': (4000, 6000),
-    'brilliance': (6000, 20000)
-}
-
-class AdvancedAudioAnalyzer:
+class AnalysisStage:
+    """Étape du graphe d'analyse : une fonction et les étapes dont elle lit les résultats"""
+    name: str
+    label: str
+    run: Callable[[], None]
+    deps: Tuple[str, ...] = ()
+
+def run_stage_graph(stages: List[AnalysisStage], workers: int = 1, logger=print) -> Dict[str, float]:
+    """Exécute un DAG d'étapes : chaque étape tourne une seule fois, dès que ses dépendances sont prêtes.
+    
+    Les étapes indépendantes tournent en parallèle dans un pool de threads : les noyaux lourds
+    (FFT, BLAS, scipy, sklearn) relâchent le GIL et les tableaux (signal, STFT) sont partagés sans copie.
+    Retourne le temps mural de chaque étape.
+    """
+    pending = {stage.name: stage for stage in stages}
+    unknown = {dep for stage in stages for dep in stage.deps} - set(pending)
+    if unknown:
+        raise ValueError(f"Dépendances d'analyse inconnues: {sorted(unknown)}")
+    
+    def timed(stage):
+        start = time.perf_counter()
+        stage.run()
+        return time.perf_counter() - start
+    
+    timings = {}
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        running = {}
+        while pending or running:
+            ready = [stage for stage in pending.values() if all(dep in timings for dep in stage.deps)]
+            for stage in ready:
+                del pending[stage.name]
+                running[pool.submit(timed, stage)] = stage
+            if not running:
+                raise ValueError(f"Dépendances cycliques entre étapes: {sorted(pending)}")
+            
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                stage = running.pop(future)
+                timings[stage.name] = future.result()
+                logger(f"{stage.label} ({timings[stage.name]:.2f}s)")
+    return timings
+
+def estimate_downbeat_offset(beat_frames, accent, beats_per_bar: int = 4) -> int:
+    """Index (modulo beats_per_bar) du premier temps : la position de mesure la plus accentuée"""
+    beat_frames = np.asarray(beat_frames, dtype=np.int64)
+    beat_frames = beat_frames[beat_frames < len(accent)]
+    if len(beat_frames) < beats_per_bar:
+        return 0
+    values = np.asarray(accent)[beat_frames]
+    scores = [values[k::beats_per_bar].mean() for k in range(beats_per_bar)]
+    return int(np.argmax(scores))
+
+class AdvancedAudioAnalyzer(FeatureTableQueries):
     """Analyseur audio ultra-détaillé pour génération procédurale"""
     
-    def __init__(self, audio_path: str, hop_length: int = 512, audio_preset: str = "Flat", logger=print):
+    # Front-end STFT/Mel (valeurs par défaut de librosa)
+    n_fft = 2048
+    n_mels = 128
+    
+    def __init__(self, audio_path: str, hop_length: int = 512, audio_preset: str = "Flat", logger=print, use_cache: bool = True,
+                 streaming: bool = False, block_seconds: float = 30.0, workers: Optional[int] = None,
+                 cache: Optional[AnalysisCache] = None, use_pcm_store: bool = True, keep_spectrogram: bool = False,
+                 stems: Optional[Dict[str, str]] = None, stem_processes: Optional[int] = None):
         self.audio_path = audio_path
         self.hop_length = hop_length
+        self.audio_preset = audio_preset
         self.logger = logger
+        # Mode flux : lecture par blocs, la STFT complète n'est jamais conservée en mémoire
+        self.streaming = streaming
+        # Cache central partagé (adressé par contenu) sauf si un cache dédié est fourni
+        self.cache = cache or get_analysis_cache()
+        # Audio décodé partagé avec la preview et le rendu VST (None : décodage direct)
+        self.pcm_store = get_pcm_store() if use_pcm_store else None
+        # Stems {nom: chemin} du même morceau, alignés sur le début du mix
+        self.stems = dict(stems or {})
+        for name in self.stems:
+            if not name.isidentifier():
+                raise ValueError(f"Nom de stem invalide (identifiant attendu): {name!r}")
         
+        # Les stems partent dans des processus dédiés pendant l'analyse du mix
+        stem_jobs = self._submit_stem_jobs(stem_processes) if self.stems and use_cache else None
+        try:
+            self._analyze_mix(audio_preset, use_cache, streaming, block_seconds, workers, keep_spectrogram)
+        except BaseException:
+            if stem_jobs is not None:
+                stem_jobs[0].shutdown(wait=False, cancel_futures=True)
+            raise
+        if self.stems:
+            self._attach_stems(stem_jobs, use_cache, workers)
+
+    def _analyze_mix(self, audio_preset, use_cache, streaming, block_seconds, workers, keep_spectrogram):
+        """Analyse du fichier principal (ou relecture depuis le cache)"""
         # Tentative de chargement depuis le cache
-        if self._load_from_cache():
+        self.loaded_from_cache = use_cache and self._load_from_cache()
+        if self.loaded_from_cache:
             self.logger("⚡ Analyse chargée depuis le cache !")
-            self._precompute_frequency_masks()
             return
 
-        self.logger("🎵 Chargement de l'audio...")
-        self.y, self.sr = librosa.load(audio_path, sr=44100)
-        
-        if audio_preset != "Flat":
-            self.logger(f"🎚️ Application du preset audio: {audio_preset}")
-            self._apply_eq(audio_preset)
-            
-        self.duration = librosa.get_duration(y=self.y, sr=self.sr)
-        
-        self.logger("📊 Analyse globale...")
-        self._analyze_global_features()
-        
-        self.logger("🎼 Analyse spectrale détaillée...")
-        self._compute_spectral_features()
-        
-        self.logger("🥁 Détection de beats et tempo...")
-        self._analyze_rhythm()
-        
-        self.logger("🎹 Segmentation musicale...")
-        self._segment_audio()
+        if streaming:
+            self.sr = 44100
+            stages = [
+                AnalysisStage('stream', f"🌊 Analyse en flux par blocs de {block_seconds:.0f}s",
+                              lambda: self._analyze_streaming(audio_preset, block_seconds)),
+                AnalysisStage('beats', "🥁 Détection de beats et onsets", self._detect_beats_and_onsets, ('stream',)),
+                AnalysisStage('grid', "📐 Grille de beats et mesures", self._build_beat_grid, ('beats',)),
+                AnalysisStage('rhythm', "🥁 Force des beats", self._analyze_rhythm, ('beats',)),
+                AnalysisStage('segments', "🎹 Segmentation musicale", self._segment_audio, ('stream',)),
+                AnalysisStage('drops', "⚡ Détection des drops", self._analyze_drops, ('stream',)),
+            ]
+        else:
+            stages = [
+                AnalysisStage('load', "🎵 Chargement de l'audio", lambda: self._load_audio(audio_preset)),
+                AnalysisStage('spectrogram', "📈 Spectrogramme (STFT + Mel)", self._compute_spectrograms, ('load',)),
+                AnalysisStage('energy', "📊 Énergie RMS et ZCR", self._analyze_energy, ('load',)),
+                AnalysisStage('onsets', "📊 Enveloppes d'onset", self._analyze_onsets, ('spectrogram',)),
+                AnalysisStage('beats', "🥁 Détection de beats et tempo", self._detect_beats_and_onsets, ('onsets',)),
+                AnalysisStage('grid', "📐 Grille de beats et mesures", self._build_beat_grid, ('beats', 'energy')),
+                AnalysisStage('harmony', "🎹 Chromagramme", self._analyze_harmony, ('spectrogram',)),
+                AnalysisStage('spectral', "🎼 Analyse spectrale détaillée", self._compute_spectral_features, ('spectrogram',)),
+                AnalysisStage('rhythm', "🥁 Tempogramme et force des beats", self._analyze_rhythm, ('beats',)),
+                AnalysisStage('segments', "🎹 Segmentation musicale", self._segment_audio, ('spectrogram', 'energy')),
+                AnalysisStage('drops', "⚡ Détection des drops", self._analyze_drops, ('energy', 'spectral')),
+                AnalysisStage('display', "🌈 Spectre d'affichage", self._compute_display_spectrum, ('spectrogram',)),
+            ]
+        # Table de features par frame : les requêtes deviennent de simples indexations
+        stages.append(AnalysisStage(
+            'table', "📋 Table de features",
+            lambda: self._build_feature_table(self.band_energies if streaming else None),
+            tuple(stage.name for stage in stages)
+        ))
         
-        self.logger("⚡ Détection des drops...")
-        self._analyze_drops()
+        workers = workers or os.cpu_count() or 1
+        self.logger(f"⚙️ Analyse ({len(stages)} étapes, {workers} workers)...")
+        self.stage_timings = run_stage_graph(stages, workers, self.logger)
         
-        # Pré-calcul des masques de fréquences (Optimisation CPU)
-        self._precompute_frequency_masks()
+        # La STFT complète (~200 Mo pour 10 min) n'est plus utile une fois les features extraites
+        if not keep_spectrogram:
+            self.D = None
 
         # Sauvegarde dans le cache
-        self._save_to_cache()
+        if use_cache:
+            self._save_to_cache()
         self.logger("✅ Analyse terminée!")
 
-    def _get_cache_path(self):
-        """Génère un chemin de cache unique basé sur le chemin du fichier et sa date de modif."""
+    def _submit_stem_jobs(self, stem_processes):
+        """Lance l'analyse des stems dans un pool de processus. Retourne (pool, futures) ou None.
+
+        Les workers ne renvoient rien : leurs analyses arrivent par le cache partagé (adressé par contenu),
+        relu ensuite par memory-map dans ce processus.
+        """
+        processes = min(stem_processes or os.cpu_count() or 1, len(self.stems))
+        if processes <= 1:
+            return None
+        pool = ProcessPoolExecutor(max_workers=processes)
+        futures = {name: pool.submit(_analyze_stem, path, self.hop_length, self.streaming, self.cache.root, self.cache.max_bytes)
+                   for name, path in self.stems.items()}
+        return pool, futures
+
+    def _attach_stems(self, stem_jobs, use_cache, workers):
+        """Ajoute à la table de features les canaux de chaque stem, alignés sur les frames du mix"""
+        if stem_jobs is not None:
+            pool, futures = stem_jobs
+            with pool:
+                for name, future in futures.items():
+                    try:
+                        future.result()
+                    except Exception as e:
+                        # Le stem sera analysé ci-dessous, dans ce processus
+                        self.logger(f"⚠️ Analyse du stem '{name}' en processus dédié impossible: {e}")
+
+        # Milieu de chaque frame : pas d'erreur d'arrondi sur l'index de frame du stem
+        frame_times = (np.arange(self.n_frames) + 0.5) * self.hop_length / self.sr
+        channels = []
+        for name, path in self.stems.items():
+            stem = AdvancedAudioAnalyzer(path, hop_length=self.hop_length, logger=lambda msg: None, use_cache=use_cache,
+                                         streaming=self.streaming, workers=1 if stem_jobs else workers,
+                                         cache=self.cache, use_pcm_store=False)
+            batch = stem.get_features_batch(frame_times)
+            # Stem plus court que le mix : silence au-delà de sa fin
+            inside = frame_times < stem.duration
+            for feature in STEM_CHANNELS:
+                channel = f"{name}.{feature}"
+                self.feature_table[channel] = np.where(inside, batch[feature], 0).astype(np.float32)
+                channels.append(channel)
+            self.logger(f"🎚️ Stem '{name}' {'chargé depuis le cache' if stem.loaded_from_cache else 'analysé'}")
+        self.stem_channels = tuple(channels)
+
+    def _get_cache_key(self):
+        """Clé du cache central : contenu du fichier audio + tous les paramètres qui influencent l'analyse."""
+        params = {
+            "analyzer": ANALYZER_VERSION,
+            "sr": 44100,
+            "hop_length": self.hop_length,
+            "audio_preset": self.audio_preset,
+            "bands": [list(edges) for edges in FREQUENCY_BANDS.values()],
+            "mode": "stream" if self.streaming else "full",
+        }
         try:
-            mtime = os.path.getmtime(self.audio_path)
-            unique_str = f"{self.audio_path}_{mtime}_{self.hop_length}"
-            file_hash = hashlib.md5(unique_str.encode('utf-8')).hexdigest()
-            return os.path.join(os.path.dirname(self.audio_path), f".{os.path.basename(self.audio_path)}.{file_hash}.analysis.json")
-        except Exception:
+            return self.cache.key(self.audio_path, params)
+        except OSError:
             return None
 
     def _save_to_cache(self):
-        """Sérialise et sauvegarde les données d'analyse."""
-        cache_path = self._get_cache_path()
-        if not cache_path: return
-
-        data = {
-            "duration": self.duration,
-            "sr": self.sr,
-            "tempo": self.tempo,
-            "beat_frames": self.beat_frames.tolist() if isinstance(self.beat_frames, np.ndarray) else list(self.beat_frames),
-            "onset_times": self.onset_times.tolist() if isinstance(self.onset_times, np.ndarray) else list(self.onset_times),
-            "rms": self.rms.tolist(),
-            "zcr": self.zcr.tolist(),
-            "spectral_centroid": self.spectral_centroid.tolist(),
-            "spectral_bandwidth": self.spectral_bandwidth.tolist(),
-            "spectral_rolloff": self.spectral_rolloff.tolist(),
-            "spectral_flux": self.spectral_flux.tolist(),
-            "beat_strength": self.beat_strength.tolist(),
-            "segment_times": self.segment_times.tolist() if isinstance(self.segment_times, np.ndarray) else list(self.segment_times),
-            "segment_types": self.segment_types,
-            "drop_curve": self.drop_curve.tolist() if isinstance(self.drop_curve, np.ndarray) else list(self.drop_curve),
-            # Note: On ne sauvegarde pas self.y (trop lourd) ni self.D (recalculable si besoin, ou on accepte de ne pas l'avoir pour get_spectrum)
+        """Sérialise les données d'analyse dans le cache binaire (colonnes float32)."""
+        cache_key = self._get_cache_key()
+        if not cache_key: return
+
+        meta = {
+            "duration": float(self.duration),
+            "sr": int(self.sr),
+            "tempo": float(self.tempo),
+            "segment_types": list(self.segment_types),
+            "downbeat_offset": int(self.beat_grid.downbeat_offset),
+        }
+        # Courbes par frame en float32, indices de frames en int32.
+        # Le spectre d'affichage compact et le chromagramme sont inclus : sans eux,
+        # l'overlay spectrogramme et harmonicity retourneraient des zéros après un hit.
+        # La STFT complète n'est pas conservée.
+        arrays = {
+            "rms": np.asarray(self.rms, dtype=np.float32),
+            "zcr": np.asarray(self.zcr, dtype=np.float32),
+            "onset_env": np.asarray(self.onset_env, dtype=np.float32),
+            "spectral_centroid": np.asarray(self.spectral_centroid, dtype=np.float32),
+            "spectral_bandwidth": np.asarray(self.spectral_bandwidth, dtype=np.float32),
+            "spectral_rolloff": np.asarray(self.spectral_rolloff, dtype=np.float32),
+            "spectral_flux": np.asarray(self.spectral_flux, dtype=np.float32),
+            "beat_strength": np.asarray(self.beat_strength, dtype=np.float32),
+            "drop_curve": np.asarray(self.drop_curve, dtype=np.float32),
+            "onset_times": np.asarray(self.onset_times, dtype=np.float32),
+            "segment_times": np.asarray(self.segment_times, dtype=np.float32),
+            "beat_frames": np.asarray(self.beat_frames, dtype=np.int32),
+            "segment_boundaries": np.asarray(self.segment_boundaries, dtype=np.int32),
+            "display_spectrum": self.display_spectrum,
+            "chroma": np.asarray(self.chroma, dtype=np.float32),
+            # Table de features pré-calculée
+            "band_energies": self.band_energies,
+            "intensity": self.feature_table['intensity'],
+            "harmonicity": self.feature_table['harmonicity'],
+            "onset_flags": self.feature_table['onset_detected'].astype(np.uint8),
+            "segment_index": self.feature_table['segment_index'],
         }
-        
-        # Pour self.D (Spectrogramme), c'est lourd. On peut choisir de ne pas le cacher 
-        # et de le laisser vide ou de le recalculer rapidement si besoin.
-        # Pour cette optimisation, on va ignorer self.D et self.chroma pour garder le cache léger,
-        # et on les initialisera à vide. Les features scalaires sont les plus importantes.
 
         try:
-            with open(cache_path, 'w') as f:
-                json.dump(data, f)
+            self.cache.store(cache_key, meta, arrays)
         except Exception as e:
             self.logger(f"⚠️ Impossible de sauvegarder le cache: {e}")
 
     def _load_from_cache(self):
-        """Charge les données depuis le cache si disponible."""
-        cache_path = self._get_cache_path()
-        if not cache_path or not os.path.exists(cache_path):
+        """Charge les données depuis le cache si disponible (colonnes memory-mappées)."""
+        cache_key = self._get_cache_key()
+        if not cache_key:
             return False
 
         try:
-            with open(cache_path, 'r') as f:
-                data = json.load(f)
-            
-            self.duration = data["duration"]
-            self.sr = data["sr"]
-            self.tempo = data["tempo"]
-            self.beat_frames = np.array(data["beat_frames"])
-            self.onset_times = np.array(data["onset_times"])
-            self.rms = np.array(data["rms"])
-            self.zcr = np.array(data["zcr"])
-            self.spectral_centroid = np.array(data["spectral_centroid"])
-            self.spectral_bandwidth = np.array(data["spectral_bandwidth"])
-            self.spectral_rolloff = np.array(data["spectral_rolloff"])
-            self.spectral_flux = np.array(data["spectral_flux"])
-            self.beat_strength = np.array(data["beat_strength"])
-            self.segment_times = np.array(data["segment_times"])
-            self.segment_types = data["segment_types"]
-            self.drop_curve = np.array(data["drop_curve"])
-            
-            # Reconstruction partielle pour éviter les erreurs
-            self.onset_env = np.zeros_like(self.rms) # Non critique
+            entry = self.cache.load(cache_key)
+            if entry is None:
+                return False
+            meta, arrays = entry
+
+            self.duration = meta["duration"]
+            self.sr = meta["sr"]
+            self.tempo = meta["tempo"]
+            self.segment_types = meta["segment_types"]
+
+            self.rms = arrays["rms"]
+            self.zcr = arrays["zcr"]
+            self.onset_env = arrays["onset_env"]
+            self.spectral_centroid = arrays["spectral_centroid"]
+            self.spectral_bandwidth = arrays["spectral_bandwidth"]
+            self.spectral_rolloff = arrays["spectral_rolloff"]
+            self.spectral_flux = arrays["spectral_flux"]
+            self.beat_strength = arrays["beat_strength"]
+            self.drop_curve = arrays["drop_curve"]
+            self.onset_times = arrays["onset_times"]
+            self.segment_times = arrays["segment_times"]
+            self.beat_frames = arrays["beat_frames"]
+            self.segment_boundaries = arrays["segment_boundaries"]
+            self.display_spectrum = arrays["display_spectrum"]
+            self.chroma = arrays["chroma"]
+            self.D = None
+
+            self.beat_times = librosa.frames_to_time(self.beat_frames, sr=self.sr, hop_length=self.hop_length)
+            self.beat_grid = BeatGrid(self.beat_times, downbeat_offset=meta["downbeat_offset"], tempo=self.tempo)
+            self.freqs = librosa.fft_frequencies(sr=self.sr, n_fft=self.n_fft)
             self.y = np.array([]) # On ne charge pas l'audio brut
-            self.D = np.zeros((1025, len(self.rms))) # Placeholder
-            self.freqs = np.linspace(0, self.sr/2, 1025)
-            self.chroma = np.zeros((12, len(self.rms))) # Placeholder
-            
+
+            self.band_energies = arrays["band_energies"]
+            self._assemble_feature_table(
+                intensity=arrays["intensity"],
+                harmonicity=arrays["harmonicity"],
+                onset_detected=arrays["onset_flags"].astype(bool),
+                segment_index=arrays["segment_index"],
+            )
+
             return True
         except Exception as e:
             self.logger(f"⚠️ Cache corrompu ou incompatible: {e}")
             return False
     
-    def _apply_eq(self, preset):
-        """Applique un EQ simple pour accentuer certaines fréquences avant analyse"""
+    def _eq_filter(self, preset):
+        """Filtre (sos) du preset d'EQ, ou None si le preset n'ajoute pas de bande"""
         if preset == "Bass Boost":
             # Boost des basses fréquences (< 150Hz)
-            sos = signal.butter(10, 150, 'lp', fs=self.sr, output='sos')
-            filtered = signal.sosfilt(sos, self.y)
-            self.y = self.y + filtered * 2.0
+            return signal.butter(10, 150, 'lp', fs=self.sr, output='sos')
         elif preset == "Vocal Boost":
             # Boost des fréquences vocales (300Hz - 3400Hz)
-            sos = signal.butter(10, [300, 3400], 'bp', fs=self.sr, output='sos')
+            return signal.butter(10, [300, 3400], 'bp', fs=self.sr, output='sos')
+        return None
+
+    def _load_audio(self, audio_preset, sr=44100, res_type='soxr_hq'):
+        """Décodage complet du fichier (mono, 44.1 kHz par défaut) et EQ éventuel"""
+        if self.pcm_store is not None:
+            self.y, self.sr = self.pcm_store.get(self.audio_path, sr=sr, res_type=res_type)
+        else:
+            self.y, self.sr = librosa.load(self.audio_path, sr=sr, res_type=res_type)
+        
+        if audio_preset != "Flat":
+            self.logger(f"🎚️ Application du preset audio: {audio_preset}")
+            self._apply_eq(audio_preset)
+            
+        self.duration = librosa.get_duration(y=self.y, sr=self.sr)
+
+    def _apply_eq(self, preset):
+        """Applique un EQ simple pour accentuer certaines fréquences avant analyse"""
+        sos = self._eq_filter(preset)
+        if sos is not None:
             filtered = signal.sosfilt(sos, self.y)
             self.y = self.y + filtered * 2.0
             
@@ -201,54 +416,231 @@ class AdvancedAudioAnalyzer:
         if np.max(np.abs(self.y)) > 0:
             self.y = self.y / np.max(np.abs(self.y))
     
-    def _analyze_global_features(self):
-        """Analyse des caractéristiques globales"""
-        # Tempo et beats
+    def _read_blocks(self, block_samples, sos=None, gain=1.0):
+        """Lit l'audio par blocs (soundfile) : mono, 44.1 kHz, EQ optionnel avec état de filtre conservé"""
+        import soundfile as sf
+        with sf.SoundFile(self.audio_path) as f:
+            resampler = None
+            if f.samplerate != self.sr:
+                import soxr
+                resampler = soxr.ResampleStream(f.samplerate, self.sr, 1, dtype='float32', quality='HQ')
+            zi = np.zeros((sos.shape[0], 2)) if sos is not None else None
+            
+            while True:
+                block = f.read(block_samples, dtype='float32', always_2d=True)
+                last = len(block) < block_samples
+                mono = block.mean(axis=1, dtype=np.float32)
+                if resampler:
+                    mono = resampler.resample_chunk(mono, last=last)
+                if sos is not None:
+                    filtered, zi = signal.sosfilt(sos, mono, zi=zi)
+                    mono = mono + filtered.astype(np.float32) * 2.0
+                if len(mono):
+                    yield mono * gain if gain != 1.0 else mono
+                if last:
+                    break
+
+    def _analyze_streaming(self, audio_preset, block_seconds):
+        """Analyse en flux : STFT calculée bloc par bloc et réduite immédiatement en courbes compactes.
+        
+        La mémoire crête est bornée par la taille de bloc ; seules les courbes par frame
+        (bandes, spectrales, chroma, MFCC, enveloppes d'onset) sont conservées.
+        """
+        n_fft = 2048
+        hop = self.hop_length
+        block_samples = max(int(block_seconds * self.sr) // hop, 1) * hop
+        
+        sos, gain = None, 1.0
+        if audio_preset != "Flat":
+            self.logger(f"🎚️ Application du preset audio: {audio_preset}")
+            sos = self._eq_filter(audio_preset)
+            # Première passe légère : crête du signal égalisé pour la normalisation
+            peak = 0.0
+            for block in self._read_blocks(block_samples, sos):
+                peak = max(peak, float(np.max(np.abs(block))))
+            gain = 1.0 / peak if peak > 0 else 1.0
+        
+        self.freqs = librosa.fft_frequencies(sr=self.sr, n_fft=n_fft)
+        display_matrix = build_display_matrix(self.freqs)
+        window = signal.get_window('hann', n_fft, fftbins=True).astype(np.float32)
+        mel_basis = librosa.filters.mel(sr=self.sr, n_fft=n_fft)
+        tuning = None
+        
+        curves = {name: [] for name in (
+            'rms', 'zcr', 'centroid', 'bandwidth', 'rolloff', 'flux',
+            'onset', 'beat', 'chroma', 'mfcc', 'bands', 'display'
+        )}
+        prev_mag = None
+        prev_mel_db = None
+        mel_peak = -np.inf
+        n_samples = 0
+        
+        # Signal centré comme librosa.stft (center=True) : n_fft//2 zéros de chaque côté
+        pending = np.zeros(n_fft // 2, dtype=np.float32)
+        blocks = self._read_blocks(block_samples, sos, gain)
+        finished = False
+        while not finished:
+            block = next(blocks, None)
+            if block is None:
+                finished = True
+                block = np.zeros(n_fft // 2, dtype=np.float32)
+            else:
+                n_samples += len(block)
+            pending = np.concatenate([pending, block])
+            
+            n_frames = 1 + (len(pending) - n_fft) // hop if len(pending) >= n_fft else 0
+            if n_frames <= 0:
+                continue
+            frames = np.lib.stride_tricks.sliding_window_view(pending, n_fft)[::hop][:n_frames].T
+            
+            # Courbes temporelles (mêmes fenêtres que librosa.feature.rms / zero_crossing_rate)
+            curves['rms'].append(np.sqrt(np.mean(frames ** 2, axis=0)))
+            curves['zcr'].append(np.mean(librosa.zero_crossings(frames, axis=0, pad=False), axis=0))
+            
+            mag = np.abs(np.fft.rfft(frames * window[:, None], axis=0)).astype(np.float32)
+            power = mag ** 2
+            
+            curves['centroid'].append(librosa.feature.spectral_centroid(S=mag, sr=self.sr)[0])
+            curves['bandwidth'].append(librosa.feature.spectral_bandwidth(S=mag, sr=self.sr)[0])
+            curves['rolloff'].append(librosa.feature.spectral_rolloff(S=mag, sr=self.sr, roll_percent=0.85)[0])
+            curves['bands'].append(self._band_energies(mag))
+            curves['display'].append(quantize_display_spectrum(np.sqrt(display_matrix @ power), n_fft / 4.0))
+            
+            # Flux spectral : continuité avec la dernière frame du bloc précédent
+            ref = np.concatenate([mag[:, :1] if prev_mag is None else prev_mag, mag[:, :-1]], axis=1)
+            curves['flux'].append(np.sqrt(np.sum((mag - ref) ** 2, axis=0)))
+            if prev_mag is None:
+                curves['flux'][-1][0] = 0.0
+            prev_mag = mag[:, -1:]
+            
+            # Chroma : accord estimé sur le premier bloc puis conservé
+            if tuning is None:
+                tuning = librosa.estimate_tuning(S=power, sr=self.sr)
+            curves['chroma'].append(librosa.feature.chroma_stft(S=power, sr=self.sr, tuning=tuning))
+            
+            # Mel dB : le plancher top_db (80 dB sous le max global de librosa) suit ici le max courant
+            mel_db = librosa.power_to_db(mel_basis @ power, top_db=None)
+            mel_peak = max(mel_peak, float(mel_db.max()))
+            ref = mel_db[:, :1] if prev_mel_db is None else prev_mel_db
+            prev_mel_db = mel_db[:, -1:]
+            mel_db = np.maximum(mel_db, mel_peak - 80.0)
+            ref = np.maximum(ref, mel_peak - 80.0)
+            
+            # MFCC et enveloppes d'onset (moyenne, et médiane pour le suivi de beats)
+            curves['mfcc'].append(librosa.feature.mfcc(S=mel_db, n_mfcc=13))
+            diff = np.maximum(0.0, np.diff(np.concatenate([ref, mel_db], axis=1), axis=1))
+            if len(curves['onset']) == 0:
+                diff = diff[:, 1:]
+            curves['onset'].append(np.mean(diff, axis=0))
+            curves['beat'].append(np.median(diff, axis=0))
+            
+            pending = pending[n_frames * hop:]
+        
+        total_frames = 1 + n_samples // hop
+        self.duration = n_samples / self.sr
+        self.y = np.array([]) # Le signal complet n'est jamais conservé
+        self.D = None # Spectre complet non conservé
+        
+        def join(name):
+            return np.concatenate(curves[name], axis=-1)[..., :total_frames]
+        
+        self.rms = join('rms')
+        self.zcr = join('zcr')
+        self.spectral_centroid = join('centroid')
+        self.spectral_bandwidth = join('bandwidth')
+        self.spectral_rolloff = join('rolloff')
+        self.spectral_flux = join('flux')
+        self.chroma = join('chroma')
+        self.mfcc = join('mfcc')
+        self.band_energies = join('bands')
+        self.display_spectrum = np.ascontiguousarray(join('display').T)
+        self._smooth_spectral_features()
+        
+        # Alignement des enveloppes comme librosa.onset.onset_strength (lag=1, centrage n_fft//(2*hop))
+        pad = np.zeros(1 + n_fft // (2 * hop), dtype=np.float32)
+        self.onset_env = np.concatenate([pad, join('onset')])[:total_frames]
+        self.beat_env = np.concatenate([pad, join('beat')])[:total_frames]
+
+    def _compute_display_spectrum(self):
+        """Spectre d'affichage compact (n_frames x DISPLAY_BINS, uint8) calculé une fois depuis la STFT"""
+        matrix = build_display_matrix(self.freqs)
+        self.display_spectrum = np.zeros((self.D.shape[1], DISPLAY_BINS), dtype=np.uint8)
+        # Par tranches : le spectre de puissance complet doublerait la mémoire de la STFT
+        for start in range(0, self.D.shape[1], 4096):
+            block = self.D[:, start:start + 4096]
+            # Référence : magnitude d'un sinus pleine échelle avec la fenêtre de Hann (somme / 2)
+            self.display_spectrum[start:start + 4096] = quantize_display_spectrum(
+                np.sqrt(matrix @ (block * block)), self.n_fft / 4.0).T
+
+    def _compute_spectrograms(self):
+        """Front-end spectral partagé : une seule STFT (et un Mel dérivé) pour toutes les features"""
+        # STFT magnitude : source unique de toutes les features spectrales
+        self.D = np.abs(librosa.stft(self.y, n_fft=self.n_fft, hop_length=self.hop_length))
+        self.freqs = librosa.fft_frequencies(sr=self.sr, n_fft=self.n_fft)
+        
+        # Mel en dB dérivé du spectre de puissance (mêmes paramètres que les valeurs par défaut de librosa)
+        self.mel_db = librosa.power_to_db(librosa.feature.melspectrogram(S=self.D**2, sr=self.sr, n_mels=self.n_mels))
+    
+    def _analyze_onsets(self):
+        """Enveloppes d'onset (la médiane est celle qu'utilise beat_track par défaut)"""
+        self.beat_env = librosa.onset.onset_strength(S=self.mel_db, sr=self.sr, hop_length=self.hop_length, aggregate=np.median)
+        self.onset_env = librosa.onset.onset_strength(S=self.mel_db, sr=self.sr, hop_length=self.hop_length)
+    
+    def _analyze_harmony(self):
+        """Chromagram pour analyse harmonique"""
+        self.chroma = librosa.feature.chroma_stft(S=self.D**2, sr=self.sr, hop_length=self.hop_length)
+    
+    def _analyze_energy(self):
+        """Caractéristiques temporelles (sans STFT)"""
+        # RMS Energy
+        self.rms = librosa.feature.rms(y=self.y, frame_length=self.n_fft, hop_length=self.hop_length)[0]
+        
+        # Zero Crossing Rate
+        self.zcr = librosa.feature.zero_crossing_rate(y=self.y, frame_length=self.n_fft, hop_length=self.hop_length)[0]
+    
+    def _detect_beats_and_onsets(self):
+        """Tempo, beats et onsets à partir des enveloppes d'onset (pas de STFT)"""
+        # Tempo et beats (tempo estimé à mémoire bornée puis fourni au beat tracker)
         tempo, self.beat_frames = librosa.beat.beat_track(
-            y=self.y, 
+            onset_envelope=self.beat_env,
             sr=self.sr,
-            hop_length=self.hop_length
+            hop_length=self.hop_length,
+            bpm=estimate_tempo(self.beat_env, self.sr, self.hop_length)
         )
         self.tempo = float(tempo[0]) if np.ndim(tempo) > 0 else float(tempo)
         self.beat_times = librosa.frames_to_time(self.beat_frames, sr=self.sr, hop_length=self.hop_length)
         
         # Onset detection (attaques de notes)
-        self.onset_env = librosa.onset.onset_strength(y=self.y, sr=self.sr, hop_length=self.hop_length)
         self.onset_frames = librosa.onset.onset_detect(
             onset_envelope=self.onset_env,
             sr=self.sr,
             hop_length=self.hop_length
         )
         self.onset_times = librosa.frames_to_time(self.onset_frames, sr=self.sr, hop_length=self.hop_length)
-        
-        # Chromagram pour analyse harmonique
-        self.chroma = librosa.feature.chroma_stft(y=self.y, sr=self.sr, hop_length=self.hop_length)
-        
-        # RMS Energy
-        self.rms = librosa.feature.rms(y=self.y, hop_length=self.hop_length)[0]
-        
-        # Zero Crossing Rate
-        self.zcr = librosa.feature.zero_crossing_rate(y=self.y, hop_length=self.hop_length)[0]
+    
+    def _build_beat_grid(self):
+        """Grille de beats : premier temps = position de mesure où onsets et énergie sont les plus forts"""
+        onset = self.onset_env / (np.max(self.onset_env) + 1e-6)
+        n = min(len(onset), len(self.rms))
+        accent = onset[:n] + self.rms[:n] / (np.max(self.rms) + 1e-6)
+        self.beat_grid = BeatGrid(self.beat_times, downbeat_offset=estimate_downbeat_offset(self.beat_frames, accent),
+                                  tempo=self.tempo)
     
     def _compute_spectral_features(self):
         """Calcul des features spectrales détaillées"""
-        # STFT pour analyse fréquentielle
-        self.D = np.abs(librosa.stft(self.y, hop_length=self.hop_length))
-        self.freqs = librosa.fft_frequencies(sr=self.sr)
-        
         # Spectral Centroid (centre de masse du spectre)
         self.spectral_centroid = librosa.feature.spectral_centroid(
-            y=self.y, sr=self.sr, hop_length=self.hop_length
+            S=self.D, sr=self.sr, hop_length=self.hop_length
         )[0]
         
         # Spectral Bandwidth (largeur du spectre)
         self.spectral_bandwidth = librosa.feature.spectral_bandwidth(
-            y=self.y, sr=self.sr, hop_length=self.hop_length
+            S=self.D, sr=self.sr, hop_length=self.hop_length
         )[0]
         
         # Spectral Rolloff (fréquence en dessous de laquelle se trouve 85% de l'énergie)
         self.spectral_rolloff = librosa.feature.spectral_rolloff(
-            y=self.y, sr=self.sr, hop_length=self.hop_length, roll_percent=0.85
+            S=self.D, sr=self.sr, hop_length=self.hop_length, roll_percent=0.85
         )[0]
         
         # Spectral Flux (changement spectral)
@@ -257,19 +649,23 @@ class AdvancedAudioAnalyzer:
             np.sqrt(np.sum(np.diff(self.D, axis=1)**2, axis=0))
         ])
         
-        # Lissage des features
+        self._smooth_spectral_features()
+    
+    def _smooth_spectral_features(self):
+        """Lissage des features"""
         self.spectral_centroid = gaussian_filter1d(self.spectral_centroid, sigma=2)
         self.spectral_bandwidth = gaussian_filter1d(self.spectral_bandwidth, sigma=2)
         self.spectral_flux = gaussian_filter1d(self.spectral_flux, sigma=2)
     
     def _analyze_rhythm(self):
         """Analyse rythmique détaillée"""
-        # Tempogram pour variations de tempo
-        self.tempogram = librosa.feature.tempogram(
-            onset_envelope=self.onset_env,
-            sr=self.sr,
-            hop_length=self.hop_length
-        )
+        # Tempogram pour variations de tempo (384 x n_frames : non calculé en mode flux, mémoire non bornée)
+        if not self.streaming:
+            self.tempogram = librosa.feature.tempogram(
+                onset_envelope=self.onset_env,
+                sr=self.sr,
+                hop_length=self.hop_length
+            )
         
         # Beat strength (force des beats)
         self.beat_strength = np.zeros(len(self.onset_env))
@@ -283,13 +679,22 @@ class AdvancedAudioAnalyzer:
     def _segment_audio(self):
         """Segmentation automatique de la musique"""
         # Utiliser la matrice de récurrence pour détecter les structures
-        mfcc = librosa.feature.mfcc(y=self.y, sr=self.sr, n_mfcc=13, hop_length=self.hop_length)
+        frame_step = 1
+        if self.streaming:
+            # MFCC déjà calculés bloc par bloc, moyennés par paquets : coût borné quelle que soit la durée
+            frame_step = max(1, int(np.ceil(self.mfcc.shape[1] / STREAMING_SEGMENT_POINTS)))
+            n = self.mfcc.shape[1] // frame_step * frame_step
+            if n == 0:
+                frame_step, n = 1, self.mfcc.shape[1]
+            mfcc = self.mfcc[:, :n].reshape(self.mfcc.shape[0], -1, frame_step).mean(axis=2)
+        else:
+            mfcc = librosa.feature.mfcc(S=self.mel_db, sr=self.sr, n_mfcc=13)
         
         # Détection des frontières de segments
         self.segment_boundaries = librosa.segment.agglomerative(
             mfcc, 
             k=8  # Nombre de segments
-        )
+        ) * frame_step
         
         self.segment_times = librosa.frames_to_time(
             self.segment_boundaries,
@@ -341,94 +746,162 @@ class AdvancedAudioAnalyzer:
         self.drop_curve = np.where(self.drop_curve > 0.2, self.drop_curve * 2.0, 0.0)
         self.drop_curve = np.clip(self.drop_curve, 0.0, 1.0)
 
-    def _precompute_frequency_masks(self):
-        """Pré-calcule les masques booléens pour les bandes de fréquences afin d'éviter le recalcul par frame."""
-        self.freq_masks = {}
-        if hasattr(self, 'freqs'):
-            for band, (low, high) in FREQUENCY_BANDS.items():
-                # On stocke le masque booléen une seule fois
-                self.freq_masks[band] = (self.freqs >= low) & (self.freqs < high)
-
-    def get_features_at_time(self, time: float) -> AdvancedAudioFeatures:
-        """Extrait toutes les features à un instant donné"""
-        # Optimisation: Calcul direct sans appel à librosa pour performance temps réel
-        frame = int(time * self.sr / self.hop_length)
-        frame = min(frame, len(self.onset_env) - 1)
-        
-        # Extraction des bandes de fréquences
-        if frame < self.D.shape[1]:
-            freq_bins = self.D[:, frame]
-            
-            # Définition des bandes
-            # Utilisation des masques pré-calculés (Gain de perf significatif)
-            sub_bass = np.mean(freq_bins[self.freq_masks['sub_bass']]) if 'sub_bass' in self.freq_masks else 0.0
-            bass = np.mean(freq_bins[self.freq_masks['bass']]) if 'bass' in self.freq_masks else 0.0
-            low_mid = np.mean(freq_bins[self.freq_masks['low_mid']]) if 'low_mid' in self.freq_masks else 0.0
-            mid = np.mean(freq_bins[self.freq_masks['mid']]) if 'mid' in self.freq_masks else 0.0
-            high_mid = np.mean(freq_bins[self.freq_masks['high_mid']]) if 'high_mid' in self.freq_masks else 0.0
-            presence = np.mean(freq_bins[self.freq_masks['presence']]) if 'presence' in self.freq_masks else 0.0
-            brilliance = np.mean(freq_bins[self.freq_masks['brilliance']]) if 'brilliance' in self.freq_masks else 0.0
-            
-            # Normalisation
-            max_val = np.max(freq_bins) + 1e-6
-            sub_bass /= max_val
-            bass /= max_val
-            low_mid /= max_val
-            mid /= max_val
-            high_mid /= max_val
-            presence /= max_val
-            brilliance /= max_val
-        else:
-            sub_bass = bass = low_mid = mid = high_mid = presence = brilliance = 0.0
-        
-        # Détection de beat
-        onset_detected = any(abs(time - onset_time) < 0.05 for onset_time in self.onset_times)
-        
-        # Déterminer le type de segment actuel
-        segment_type = "neutral"
-        for i, seg_time in enumerate(self.segment_times[:-1]):
-            if time >= seg_time and time < self.segment_times[i + 1]:
-                if i < len(self.segment_types):
-                    segment_type = self.segment_types[i]
-                break
-        
-        # Calcul de l'intensité globale
-        intensity = min(self.rms[frame] / (np.max(self.rms) + 1e-6), 1.0) if frame < len(self.rms) else 0.5
-        
-        # Valeur de glitch
-        glitch = 0.0
-        if frame < len(self.drop_curve):
-            glitch = float(self.drop_curve[frame])
-
-        return AdvancedAudioFeatures(
-            sub_bass=float(sub_bass),
-            bass=float(bass),
-            low_mid=float(low_mid),
-            mid=float(mid),
-            high_mid=float(high_mid),
-            presence=float(presence),
-            brilliance=float(brilliance),
-            beat_strength=float(self.beat_strength[frame]) if frame < len(self.beat_strength) else 0.0,
-            tempo=float(self.tempo),
+    def _build_feature_table(self, band_energies=None):
+        """Pré-calcule une table de features par frame (struct-of-arrays) à partir des courbes d'analyse."""
+        n_frames = len(self.onset_env)
+
+        # Énergie des 7 bandes en un seul produit matriciel, normalisée par le max de chaque frame
+        # (déjà calculée bloc par bloc en mode flux)
+        if band_energies is None:
+            band_energies = self._band_energies(self.D[:, :n_frames])
+        self.band_energies = self._fit_curve(band_energies, n_frames)
+
+        # Intensité globale (RMS normalisé sur tout le morceau)
+        rms = self._fit_curve(self.rms, n_frames)
+        intensity = np.minimum(rms / (np.max(self.rms) + 1e-6), 1.0).astype(np.float32)
+
+        # Onset à moins de 50 ms de la frame
+        frame_times = librosa.frames_to_time(np.arange(n_frames), sr=self.sr, hop_length=self.hop_length)
+        onset_detected = np.zeros(n_frames, dtype=bool)
+        if len(self.onset_times) > 0:
+            idx = np.searchsorted(self.onset_times, frame_times)
+            prev_dist = np.abs(frame_times - self.onset_times[np.clip(idx - 1, 0, len(self.onset_times) - 1)])
+            next_dist = np.abs(self.onset_times[np.clip(idx, 0, len(self.onset_times) - 1)] - frame_times)
+            onset_detected = np.minimum(prev_dist, next_dist) < 0.05
+
+        # Index de segment par frame (-1 = neutre)
+        segment_index = np.searchsorted(self.segment_times, frame_times, side='right') - 1
+        n_segments = min(len(self.segment_times) - 1, len(self.segment_types))
+        segment_index[(segment_index < 0) | (segment_index >= n_segments)] = -1
+
+        harmonicity = self._fit_curve(np.max(self.chroma, axis=0), n_frames) if self.chroma.shape[1] > 0 else np.zeros(n_frames, dtype=np.float32)
+
+        self._assemble_feature_table(
+            intensity=intensity,
+            harmonicity=harmonicity,
             onset_detected=onset_detected,
-            spectral_centroid=float(self.spectral_centroid[frame]) if frame < len(self.spectral_centroid) else 0.0,
-            spectral_bandwidth=float(self.spectral_bandwidth[frame]) if frame < len(self.spectral_bandwidth) else 0.0,
-            spectral_rolloff=float(self.spectral_rolloff[frame]) if frame < len(self.spectral_rolloff) else 0.0,
-            spectral_flux=float(self.spectral_flux[frame]) if frame < len(self.spectral_flux) else 0.0,
-            harmonicity=float(np.max(self.chroma[:, frame])) if frame < self.chroma.shape[1] else 0.0,
-            rms_energy=float(self.rms[frame]) if frame < len(self.rms) else 0.0,
-            zcr=float(self.zcr[frame]) if frame < len(self.zcr) else 0.0,
-            segment_type=segment_type,
-            intensity=float(intensity),
-            glitch_intensity=glitch
+            segment_index=segment_index.astype(np.int32),
         )
-        
+
+    def _band_energies(self, magnitude):
+        """Énergie moyenne des 7 bandes pour chaque colonne de spectre, normalisée par le max de la colonne"""
+        if not hasattr(self, '_band_matrix'):
+            self._band_matrix = build_band_matrix(self.freqs)
+        bands = self._band_matrix @ magnitude
+        bands /= np.max(magnitude, axis=0) + 1e-6
+        return bands
+
+    def _assemble_feature_table(self, intensity, harmonicity, onset_detected, segment_index):
+        """Regroupe les colonnes de la table de features (toutes de longueur n_frames)."""
+        n_frames = len(intensity)
+        self.n_frames = n_frames
+        self.feature_table = {band: self.band_energies[i] for i, band in enumerate(FREQUENCY_BANDS)}
+        self.feature_table.update({
+            'beat_strength': self._fit_curve(self.beat_strength, n_frames),
+            'spectral_centroid': self._fit_curve(self.spectral_centroid, n_frames),
+            'spectral_bandwidth': self._fit_curve(self.spectral_bandwidth, n_frames),
+            'spectral_rolloff': self._fit_curve(self.spectral_rolloff, n_frames),
+            'spectral_flux': self._fit_curve(self.spectral_flux, n_frames),
+            'harmonicity': harmonicity,
+            'rms_energy': self._fit_curve(self.rms, n_frames),
+            'zcr': self._fit_curve(self.zcr, n_frames),
+            'intensity': intensity,
+            'glitch_intensity': self._fit_curve(self.drop_curve, n_frames),
+            'onset_detected': onset_detected,
+            'segment_index': segment_index,
+        })
+
+    @staticmethod
+    def _fit_curve(curve, n_frames):
+        """Ramène une courbe (ou matrice) à n_frames colonnes en float32, complétée par des zéros."""
+        curve = np.asarray(curve)
+        if curve.shape[-1] == n_frames and curve.dtype == np.float32:
+            return curve
+        fitted = np.zeros(curve.shape[:-1] + (n_frames,), dtype=np.float32)
+        n = min(curve.shape[-1], n_frames)
+        fitted[..., :n] = curve[..., :n]
+        return fitted
+
+    def export_feature_timeline(self, path: str) -> str:
+        """Écrit la timeline de features (cf. feature_timeline) : un rendu peut ensuite se passer d'analyse"""
+        style, profile = MusicStyleClassifier.classify(self)
+        write_feature_timeline(path, self, style, profile)
+        self.logger(f"🗂️ Timeline de features exportée: {path}")
+        return path
+
     def get_spectrum_at_time(self, time: float) -> np.ndarray:
-        """Retourne le spectre (magnitude) à un instant donné"""
+        """Retourne le spectre (magnitude) à un instant donné
+        
+        Nécessite keep_spectrogram=True (et une analyse hors cache) ; sinon des zéros.
+        L'affichage utilise get_display_spectrum.
+        """
         frame = int(time * self.sr / self.hop_length)
-        if frame < self.D.shape[1]:
+        if self.D is not None and frame < self.D.shape[1]:
             return self.D[:, frame]
-        return np.zeros(self.D.shape[0])
+        return np.zeros(len(self.freqs))
+
+class CoarseAudioAnalyzer(AdvancedAudioAnalyzer):
+    """Passe rapide pour l'aperçu : 11 kHz mono, bandes + RMS + onsets seulement.
+    
+    Expose les mêmes requêtes que l'analyse complète (les features non calculées valent 0),
+    ce qui permet de la remplacer à chaud dès que l'analyse complète est prête.
+    """
+    
+    n_fft = 512
+    n_mels = 64
+    
+    def __init__(self, audio_path: str, audio_preset: str = "Flat", logger=print):
+        self.audio_path = audio_path
+        self.hop_length = COARSE_HOP_LENGTH
+        self.audio_preset = audio_preset
+        self.logger = logger
+        self.streaming = False
+        # Le décodage natif est conservé pour l'analyse complète qui suit
+        self.pcm_store = get_pcm_store()
+        
+        start = time.perf_counter()
+        self._load_audio(audio_preset, sr=COARSE_SR, res_type='soxr_lq')
+        self._compute_spectrograms()
+        self._analyze_energy()
+        self._analyze_onsets()
+        self._fill_coarse_features()
+        self._build_feature_table()
+        self._compute_display_spectrum()
+        self.D = None
+        self.logger(f"⚡ Analyse rapide terminée ({time.perf_counter() - start:.2f}s)")
+    
+    def _fill_coarse_features(self):
+        """Onsets et tempo à partir des enveloppes ; le reste est laissé neutre jusqu'à l'analyse complète"""
+        n_frames = len(self.onset_env)
+        self.onset_frames = librosa.onset.onset_detect(onset_envelope=self.onset_env, sr=self.sr, hop_length=self.hop_length)
+        self.onset_times = librosa.frames_to_time(self.onset_frames, sr=self.sr, hop_length=self.hop_length)
+        # Tempo sur l'enveloppe moyennée par 4 frames (même résolution que l'analyse complète, 4x moins d'autocorrélations)
+        n = len(self.beat_env) // 4 * 4
+        self.tempo = estimate_tempo(self.beat_env[:n].reshape(-1, 4).mean(axis=1), self.sr, self.hop_length * 4) if n else 120.0
+        self.beat_frames = np.array([], dtype=int)
+        self.beat_times = np.array([])
+        # Grille régulière au tempo estimé, calée sur l'onset le plus fort, en attendant le suivi de beats
+        anchor = float(np.argmax(self.onset_env)) * self.hop_length / self.sr if n_frames else 0.0
+        self.beat_grid = BeatGrid.from_tempo(self.tempo, n_frames * self.hop_length / self.sr, anchor)
+        
+        # Sans beat tracking, l'enveloppe d'onset normalisée sert de force des beats
+        self.beat_strength = self.onset_env / (np.max(self.onset_env) + 1e-6)
+        
+        zeros = np.zeros(n_frames, dtype=np.float32)
+        self.spectral_centroid = self.spectral_bandwidth = self.spectral_rolloff = self.spectral_flux = zeros
+        self.drop_curve = zeros
+        self.chroma = np.zeros((12, 0), dtype=np.float32)
+        
+        self.segment_boundaries = np.array([0, n_frames])
+        self.segment_times = librosa.frames_to_time(self.segment_boundaries, sr=self.sr, hop_length=self.hop_length)
+        self.segment_types = ["neutral"]
+
+def _analyze_stem(stem_path, hop_length, streaming, cache_root, cache_max_bytes):
+    """Worker de processus : analyse un stem dans le cache partagé (relu ensuite par le processus parent)"""
+    configure_analysis_cache(cache_root, cache_max_bytes)
+    AdvancedAudioAnalyzer(stem_path, hop_length=hop_length, logger=lambda msg: None, streaming=streaming,
+                          workers=1, use_pcm_store=False)
+    return stem_path
 
 class MusicStyleClassifier:
     """Classifie automatiquement le style musical"""
@@ -475,8 +948,341 @@ class MusicStyleClassifier:
         else:
             return "fractal", profile  # Style par défaut (fractal)
 
+class StreamingBeatTracker:
+    """Suivi incrémental des onsets, du tempo et de la phase de beat pour le mode live.
+    
+    Travaille sur les échantillons bruts avec son propre découpage (fenêtre Hann de 2 * hop_length,
+    hop de 512 : ~86 frames/s) ; latence d'un hop, sans anticipation.
+    - Onsets : flux spectral log-compressé comparé à un seuil adaptatif (moyenne + écart moyen glissants).
+    - Tempo : autocorrélation de l'enveloppe d'onset sur une fenêtre glissante, pondérée par un a priori
+      log-normal centré sur 120 BPM (comme librosa), recalculée toutes les update_every frames.
+    - Phase : oscillateur à la période estimée, recalé sur le peigne d'onsets le plus énergétique
+      et sur les onsets proches du beat attendu.
+    """
+    
+    def __init__(self, sr=44100, hop_length=512, n_mels=40, window_seconds=8.0,
+                 min_bpm=60.0, max_bpm=200.0, update_every=16):
+        self.hop_length = hop_length
+        self.frame_rate = sr / hop_length
+        self.update_every = update_every
+        self.threshold_k = 2.0             # seuil = moyenne + k * écart moyen du flux
+        self.stats_alpha = 1.0 / max(1.0, 0.5 * self.frame_rate)   # mémoire ~0.5 s
+        self.refractory = max(1, int(round(0.1 * self.frame_rate)))  # 100 ms entre deux onsets
+        
+        # Trame d'analyse [moitié précédente | moitié en cours de remplissage]
+        n_fft = 2 * hop_length
+        self._frame = np.zeros(n_fft)
+        self._windowed = np.zeros(n_fft)
+        self._hann = np.hanning(n_fft + 1)[:-1]
+        self._spectrum = np.zeros(hop_length + 1, dtype=np.complex128)
+        self._rfft_out = True
+        
+        # Bandes Mel (comme onset_strength de librosa : les basses pèsent autant que les aigus)
+        # puis spectres log-compressés courant / précédent et tampon de différence
+        self._mel_basis = librosa.filters.mel(sr=sr, n_fft=n_fft, n_mels=n_mels).astype(np.float64)
+        self._magnitude = np.zeros(hop_length + 1)
+        self._log_mel = np.zeros(n_mels)
+        self._prev_log_mel = np.zeros(n_mels)
+        self._diff = np.zeros(n_mels)
+        
+        # Enveloppe d'onset en double écriture : _env[pos:pos + window] est toujours ordonnée, sans copie
+        self.window = int(window_seconds * self.frame_rate)
+        self._env = np.zeros(2 * self.window)
+        self._centered = np.zeros(self.window)
+        
+        # Plage de lags de l'autocorrélation (+1 de chaque côté pour le lissage) et a priori de tempo
+        self._lags = np.arange(int(np.floor(60.0 * self.frame_rate / max_bpm)),
+                               int(np.ceil(60.0 * self.frame_rate / min_bpm)) + 1)
+        self._prior = np.exp(-0.5 * np.log2(60.0 * self.frame_rate / self._lags / 120.0) ** 2)
+        self._acf = np.zeros(len(self._lags) + 2)
+        self._smoothed = np.zeros(len(self._lags))
+        self._weighted = np.zeros(len(self._lags))
+        self._comb = np.zeros(self._lags[-1] + 2)
+        
+        self.reset()
+    
+    def reset(self):
+        self._frame[:] = 0.0
+        self._pending = 0
+        self._prev_log_mel[:] = 0.0
+        self._env[:] = 0.0
+        self._pos = 0
+        self._filled = 0
+        self._frame_index = 0
+        self._has_prev = False
+        self._flux_mean = 0.0
+        self._flux_dev = 0.0
+        self._last_onset = -self.refractory
+        self.flux = 0.0
+        self.onset = False
+        self.beat = False
+        self.tempo = 120.0
+        self.period = 60.0 * self.frame_rate / self.tempo
+        self.phase = 0.0
+        self._frames_since_beat = 0
+        # Nombre de beats émis : donne la position dans la mesure (beat_count % 4)
+        self.beat_count = 0
+        self.confidence = 0.0
+    
+    def process(self, samples):
+        """Ajoute un buffer d'échantillons (longueur quelconque). Retourne True si un onset y a été détecté.
+        
+        onset / beat indiquent ensuite si un onset / un beat prédit est tombé dans ce buffer.
+        """
+        hop = self.hop_length
+        onset = beat = False
+        i, n = 0, len(samples)
+        while i < n:
+            take = min(hop - self._pending, n - i)
+            self._frame[hop + self._pending:hop + self._pending + take] = samples[i:i + take]
+            self._pending += take
+            i += take
+            if self._pending == hop:
+                self._pending = 0
+                self._update_frame()
+                onset |= self.onset
+                beat |= self.beat
+                self._frame[:hop] = self._frame[hop:]
+        self.onset, self.beat = onset, beat
+        return onset
+    
+    def _update_frame(self):
+        """Une frame complète : flux, décision d'onset, enveloppe, tempo et phase"""
+        np.multiply(self._frame, self._hann, out=self._windowed)
+        if self._rfft_out:
+            try:
+                np.fft.rfft(self._windowed, out=self._spectrum)
+            except TypeError:   # numpy < 2.0
+                self._rfft_out = False
+        if not self._rfft_out:
+            self._spectrum[:] = np.fft.rfft(self._windowed)
+        
+        # Flux spectral positif sur le spectre Mel log-compressé
+        np.abs(self._spectrum, out=self._magnitude)
+        log_mel = self._log_mel
+        np.dot(self._mel_basis, self._magnitude, out=log_mel)
+        np.log1p(log_mel, out=log_mel)
+        if self._has_prev:
+            np.subtract(log_mel, self._prev_log_mel, out=self._diff)
+            np.maximum(self._diff, 0.0, out=self._diff)
+            flux = float(self._diff.mean())
+        else:
+            flux = 0.0
+        self._log_mel, self._prev_log_mel = self._prev_log_mel, log_mel
+        self._has_prev = True
+        self.flux = flux
+        
+        # Seuil adaptatif (statistiques mises à jour après la décision)
+        threshold = self._flux_mean + self.threshold_k * self._flux_dev
+        self.onset = (flux > threshold and flux > 1e-4
+                      and self._frame_index - self._last_onset >= self.refractory)
+        strength = max(0.0, flux - self._flux_mean)
+        self._flux_mean += self.stats_alpha * (flux - self._flux_mean)
+        self._flux_dev += self.stats_alpha * (abs(flux - self._flux_mean) - self._flux_dev)
+        if self.onset:
+            self._last_onset = self._frame_index
+        
+        # Enveloppe d'onset glissante
+        self._env[self._pos] = strength
+        self._env[self._pos + self.window] = strength
+        self._pos = (self._pos + 1) % self.window
+        self._filled = min(self._filled + 1, self.window)
+        self._frame_index += 1
+        if self._frame_index % self.update_every == 0 and self._filled >= 2 * self._lags[-1]:
+            self._update_tempo()
+        
+        self._advance_phase()
+    
+    def _update_tempo(self):
+        """Autocorrélation de l'enveloppe sur la fenêtre, pic pondéré par l'a priori, interpolation parabolique"""
+        n = self._filled
+        x = self._centered[:n]
+        x[:] = self._env[self._pos + self.window - n:self._pos + self.window]
+        x -= x.mean()
+        energy = float(np.dot(x, x))
+        if energy <= 1e-12:
+            self.confidence = 0.0
+            return
+        first = self._lags[0] - 1
+        for i in range(len(self._acf)):
+            lag = first + i
+            self._acf[i] = np.dot(x[lag:], x[:n - lag])
+        
+        # À ~43 frames/s une période non entière se répartit sur deux lags voisins :
+        # le lissage [0.5, 1, 0.5] regroupe cette masse (sinon le double de la période gagne)
+        acf = self._smoothed
+        np.add(self._acf[:-2], self._acf[2:], out=acf)
+        acf *= 0.5
+        acf += self._acf[1:-1]
+        best = int(np.argmax(np.multiply(acf, self._prior, out=self._weighted)))
+        if acf[best] <= 0:
+            self.confidence = 0.0
+            return
+        
+        offset = 0.0
+        if 0 < best < len(acf) - 1:
+            denom = acf[best - 1] - 2 * acf[best] + acf[best + 1]
+            if denom < 0:
+                offset = 0.5 * (acf[best - 1] - acf[best + 1]) / denom
+        period = float(self._lags[best]) + offset
+        
+        # Corrélation normalisée (par l'énergie et le nombre de termes) comme confiance
+        self.confidence = min(1.0, float(self._acf[best + 1]) / energy * n / (n - self._lags[best]))
+        self.period += 0.5 * (period - self.period)
+        self.tempo = 60.0 * self.frame_rate / self.period
+        self._align_phase(x)
+    
+    def _align_phase(self, x):
+        """Recale la phase sur le peigne (période estimée) qui capte le plus d'énergie d'onset"""
+        n = len(x)
+        n_offsets = int(self.period)
+        n_teeth = int((n - n_offsets) / self.period)
+        if n_offsets < 1 or n_teeth < 1:
+            return
+        # scores[o] = somme des frames situées o frames avant chaque dent (partant de la plus récente)
+        scores = self._comb[:n_offsets]
+        scores[:] = 0.0
+        for k in range(n_teeth):
+            end = n - int(round(k * self.period))
+            scores += x[end - n_offsets:end][::-1]
+        frames_since_beat = int(np.argmax(scores))
+        # Phase attendue avant l'avance de la frame courante
+        target = (frames_since_beat / self.period) % 1.0
+        error = (self.phase - target + 0.5) % 1.0 - 0.5
+        self._correct_phase(0.5 * error)
+    
+    def _correct_phase(self, amount):
+        """Recul/avance de phase sans ramener dans [0, 1) : le passage de 1.0 reste réservé à _advance_phase
+        (un recalage ne peut ni sauter ni doubler un beat)"""
+        self.phase -= amount
+    
+    def _advance_phase(self):
+        """Oscillateur de beat : recalage (PLL) sur les onsets proches du beat prédit, puis avance d'une frame"""
+        if self.onset:
+            if self.confidence < 0.1:
+                self.phase = 0.0
+            else:
+                error = (self.phase + 0.5) % 1.0 - 0.5
+                if abs(error) < 0.25:
+                    self._correct_phase(0.3 * error)
+        
+        self.phase += 1.0 / self.period
+        self._frames_since_beat += 1
+        self.beat = False
+        if self.phase >= 1.0:
+            self.phase -= np.floor(self.phase)
+            # Garde-fou : jamais deux beats à moins d'une demi-période
+            if self._frames_since_beat >= 0.5 * self.period:
+                self.beat = True
+                self._frames_since_beat = 0
+                self.beat_count += 1
+    
+    @property
+    def beat_strength(self):
+        """Impulsion décroissante après chaque beat prédit (0 tant que le tempo n'est pas verrouillé)"""
+        if self.confidence < 0.1:
+            return 0.0
+        return float(np.exp(-4.0 * max(self.phase, 0.0)))
+
+def _wrap_phase(phase):
+    """Ramène une phase dans [0, 1) (x % 1.0 donne 1.0 pour un négatif infime)"""
+    phase %= 1.0
+    return 0.0 if phase >= 1.0 else phase
+
+class AudioRingBuffer:
+    """Tampon circulaire entre le callback de capture audio et la boucle de rendu.
+    
+    Un seul producteur (write, appelé depuis le thread audio) et un seul consommateur (next_window) :
+    le compteur d'échantillons écrits n'est publié qu'après la copie, donc aucun verrou n'est nécessaire.
+    Le consommateur avance par hops de hop_size et lit des fenêtres de window_size qui se chevauchent,
+    indépendamment de la cadence d'images.
+    - overruns : le rendu a pris trop de retard, les hops en attente sont abandonnés pour les plus frais.
+    - underruns : appels à vide consécutifs, c'est-à-dire un passage de la boucle de rendu sans aucun
+      nouveau hop (le False qui termine une boucle « while next_window() » n'est pas compté).
+    - input_overflows : débordements signalés par le pilote audio (à incrémenter par le callback).
+    """
+    
+    def __init__(self, capacity=44100, window_size=1024, hop_size=512):
+        if not 0 < hop_size <= window_size <= capacity // 2:
+            raise ValueError("Il faut 0 < hop_size <= window_size <= capacity / 2")
+        self.capacity = capacity
+        self.window_size = window_size
+        self.hop_size = hop_size
+        self._data = np.zeros(capacity, dtype=np.float32)
+        self.reset()
+    
+    def reset(self):
+        self._data[:] = 0.0
+        self.written = 0       # total d'échantillons écrits (publié après la copie)
+        self.read_pos = 0      # fin de la dernière fenêtre lue
+        self.overruns = 0
+        self.underruns = 0
+        self.input_overflows = 0
+        self.dropped_samples = 0
+        self._starved = False
+    
+    def write(self, samples):
+        """Côté producteur : copie les échantillons dans l'anneau (écrase les plus anciens)"""
+        n = len(samples)
+        if n > self.capacity:
+            samples = samples[n - self.capacity:]
+            self.written += n - self.capacity
+            n = self.capacity
+        start = self.written % self.capacity
+        first = min(n, self.capacity - start)
+        self._data[start:start + first] = samples[:first]
+        self._data[:n - first] = samples[first:]
+        self.written += n
+    
+    @property
+    def available(self):
+        """Échantillons écrits mais pas encore consommés"""
+        return self.written - self.read_pos
+    
+    def next_window(self, out) -> bool:
+        """Côté consommateur : copie dans out (longueur window_size) la fenêtre qui finit au hop suivant.
+        
+        Ne bloque jamais : retourne False si aucun hop complet n'est disponible.
+        Au-delà d'un retard d'une demi-capacité, saute directement à la fenêtre la plus récente (overrun).
+        """
+        written = self.written
+        end = self.read_pos + self.hop_size
+        if written < end:
+            if self._starved:
+                self.underruns += 1
+            self._starved = True
+            return False
+        self._starved = False
+        if written - end > self.capacity // 2 - self.window_size:
+            self.overruns += 1
+            self.dropped_samples += written - end
+            end = written
+        
+        start = (end - self.window_size) % self.capacity
+        first = min(self.window_size, self.capacity - start)
+        out[:first] = self._data[start:start + first]
+        out[first:] = self._data[:self.window_size - first]
+        self.read_pos = end
+        return True
+    
+    def stats(self) -> Dict:
+        return {
+            'written': self.written, 'overruns': self.overruns, 'underruns': self.underruns,
+            'input_overflows': self.input_overflows, 'dropped_samples': self.dropped_samples,
+        }
+
 class RealTimeAudioAnalyzer:
-    """Analyseur audio temps réel pour le visualiseur"""
+    """Analyseur audio temps réel pour le visualiseur.
+    
+    Chemin critique sans allocation de tableaux en régime établi : tampon d'entrée, spectre, bandes
+    et état de lissage sont préalloués, et process() met à jour puis retourne toujours le même
+    objet AdvancedAudioFeatures (à copier si l'appelant veut le conserver d'un buffer à l'autre).
+    """
+    
+    # Gains appliqués aux 7 bandes (ordre de FREQUENCY_BANDS)
+    BAND_GAINS = np.array([3.0, 2.0, 1.0, 1.0, 1.0, 1.0, 2.0], dtype=np.float32)
+    # Ordre du vecteur d'état lissé : les 7 bandes puis les features scalaires
+    STATE_FIELDS = tuple(FREQUENCY_BANDS) + ('beat_strength', 'intensity', 'spectral_flux')
     
     def __init__(self, sr=44100, buffer_size=1024):
         self.sr = sr
@@ -486,61 +1292,164 @@ class RealTimeAudioAnalyzer:
         # Lissage temporel
         self.prev_features = None
         self.smooth_factor = 0.3
-        self.current_magnitude = None
         
-    def process(self, audio_buffer) -> AdvancedAudioFeatures:
-        """Traite un buffer audio brut et retourne les features"""
+        # Tampons réutilisés à chaque buffer (float64 : la FFT float32 de numpy alloue une copie interne)
+        self._window = np.zeros(buffer_size)
+        self._abs = np.zeros(buffer_size)
+        self._spectrum = np.zeros(len(self.freqs), dtype=np.complex128)
+        self.current_magnitude = np.zeros(len(self.freqs))
+        self._raw = np.zeros(len(self.STATE_FIELDS))
+        self._state = np.zeros(len(self.STATE_FIELDS))
+        self._features = AdvancedAudioFeatures(segment_type="neutral", glitch_intensity=0.0)
+        self._rfft_out = self._supports_rfft_out()
+        self._update_bands()
+        
+        # Onsets, tempo et phase de beat incrémentaux
+        self.beat_tracker = StreamingBeatTracker(sr)
+        
+        # Flux spectral à la même échelle que l'analyse hors ligne (STFT Hann 2048 : somme de fenêtre 1024)
+        self._flux_scale = 1024.0 / buffer_size
+        self._raw_magnitude = np.zeros(len(self.freqs))
+        self._prev_raw_magnitude = np.zeros(len(self.freqs))
+        self._flux_diff = np.zeros(len(self.freqs))
+        
+        # Détection de drops (montée d'énergie x flux, normalisés par des maxima à décroissance lente)
+        self._prev_rms = 0.0
+        self._rise_max = 1e-6
+        self._flux_max = 1e-6
+        
+        # Spectre d'affichage de l'overlay (calculé à la demande, même échelle que l'analyse hors ligne)
+        self._display_matrix = build_display_matrix(self.freqs).astype(np.float64)
+        self._display_power = np.zeros(len(self.freqs))
+        self._display_work = np.zeros(DISPLAY_BINS)
+        self.display_spectrum = np.zeros(DISPLAY_BINS, dtype=np.uint8)
+    
+    def _supports_rfft_out(self):
+        """numpy >= 2.0 : np.fft.rfft peut écrire dans un tableau existant"""
+        try:
+            np.fft.rfft(self._window, out=self._spectrum)
+            return True
+        except TypeError:
+            return False
+    
+    def get_display_spectrum(self) -> np.ndarray:
+        """Spectre d'affichage du dernier buffer (DISPLAY_BINS valeurs uint8), sans allocation"""
+        work = self._display_work
+        np.multiply(self.current_magnitude, self.current_magnitude, out=self._display_power)
+        np.dot(self._display_matrix, self._display_power, out=work)
+        work *= (2.0 / self.buffer_size) ** 2  # Référence : sinus pleine échelle, fenêtre rectangulaire
+        np.maximum(work, 1e-20, out=work)
+        np.log10(work, out=work)
+        work *= 10.0 / DISPLAY_DB_RANGE
+        work += 1.0
+        np.clip(work, 0.0, 1.0, out=work)
+        work *= 255.0
+        np.rint(work, out=work)
+        np.copyto(self.display_spectrum, work, casting='unsafe')
+        return self.display_spectrum
+    
+    def _update_bands(self):
+        """Matrice de moyennage restreinte à la plage de bins couverte par les bandes"""
+        self._band_edges = tuple(FREQUENCY_BANDS.values())
+        matrix = build_band_matrix(self.freqs)
+        used = np.flatnonzero(matrix.any(axis=0))
+        self._bins = slice(int(used[0]), int(used[-1]) + 1) if len(used) else slice(0, 0)
+        self._band_matrix = matrix[:, self._bins].astype(np.float64) * self.BAND_GAINS[:, None]
+        self._bands = self._raw[:len(FREQUENCY_BANDS)]
+        
+    def process(self, audio_buffer, new_samples=None) -> AdvancedAudioFeatures:
+        """Traite un buffer audio brut et retourne les features
+        
+        new_samples : nombre d'échantillons nouveaux en fin de buffer quand les fenêtres se chevauchent
+        (AudioRingBuffer) ; seuls ceux-là alimentent le suivi de beat. Par défaut, tout le buffer.
+        """
+        # Les bandes peuvent être modifiées à chaud (FFTConfigDialog)
+        if tuple(FREQUENCY_BANDS.values()) != self._band_edges:
+            self._update_bands()
+        
+        # Copie dans le tampon de travail (tronqué ou complété par des zéros)
+        window = self._window
+        n = min(len(audio_buffer), self.buffer_size)
+        window[:n] = audio_buffer[:n]
+        window[n:] = 0.0
+        
         # Normalisation
-        if np.max(np.abs(audio_buffer)) > 0:
-            audio_buffer = audio_buffer / np.max(np.abs(audio_buffer))
+        np.abs(window, out=self._abs)
+        peak = self._abs.max()
+        if peak > 0:
+            window *= 1.0 / peak
             
         # FFT
-        magnitude = np.abs(np.fft.rfft(audio_buffer))
-        self.current_magnitude = magnitude
-        
-        # Calcul des bandes (simplifié pour le temps réel)
-        def get_band_energy(min_freq, max_freq):
-            mask = (self.freqs >= min_freq) & (self.freqs < max_freq)
-            if np.any(mask):
-                return float(np.mean(magnitude[mask]))
-            return 0.0
-
-        sub_bass = get_band_energy(*FREQUENCY_BANDS['sub_bass']) * 3.0
-        bass = get_band_energy(*FREQUENCY_BANDS['bass']) * 2.0
-        low_mid = get_band_energy(*FREQUENCY_BANDS['low_mid'])
-        mid = get_band_energy(*FREQUENCY_BANDS['mid'])
-        high_mid = get_band_energy(*FREQUENCY_BANDS['high_mid'])
-        presence = get_band_energy(*FREQUENCY_BANDS['presence'])
-        brilliance = get_band_energy(*FREQUENCY_BANDS['brilliance']) * 2.0
+        if self._rfft_out:
+            np.fft.rfft(window, out=self._spectrum)
+        else:
+            self._spectrum[:] = np.fft.rfft(window)
+        magnitude = np.abs(self._spectrum, out=self.current_magnitude)
+        
+        # 7 bandes (gains inclus) en une seule réduction matricielle
+        bands = self._bands
+        np.dot(self._band_matrix, magnitude[self._bins], out=bands)
+        np.minimum(bands, 1.0, out=bands)
         
         # RMS / Intensité
-        rms = float(np.sqrt(np.mean(audio_buffer**2)))
-        intensity = min(rms * 5.0, 1.0)
-        
-        # Beat strength approximatif (basé sur les basses)
-        beat_strength = min(bass * 3.0, 1.0) if bass > 0.1 else 0.0
-        
-        features = AdvancedAudioFeatures(
-            sub_bass=min(sub_bass, 1.0),
-            bass=min(bass, 1.0),
-            low_mid=min(low_mid, 1.0),
-            mid=min(mid, 1.0),
-            high_mid=min(high_mid, 1.0),
-            presence=min(presence, 1.0),
-            brilliance=min(brilliance, 1.0),
-            beat_strength=beat_strength,
-            intensity=intensity,
-            segment_type="neutral", # Difficile à déterminer en temps réel sans latence
-            glitch_intensity=0.0
-        )
+        rms = float(np.sqrt(np.dot(window, window) / self.buffer_size))
+        gain = float(peak) if peak > 0 else 1.0
+        
+        # Onsets / tempo / phase (sur les échantillons d'origine, pas sur le buffer normalisé)
+        tracker = self.beat_tracker
+        if new_samples is not None and new_samples < len(audio_buffer):
+            onset = tracker.process(audio_buffer[len(audio_buffer) - new_samples:])
+        else:
+            onset = tracker.process(audio_buffer)
+        
+        # Flux spectral (même formule que l'analyse hors ligne)
+        raw_magnitude = np.multiply(magnitude, gain, out=self._raw_magnitude)
+        np.subtract(raw_magnitude, self._prev_raw_magnitude, out=self._flux_diff)
+        flux = float(np.sqrt(np.dot(self._flux_diff, self._flux_diff))) * self._flux_scale
+        self._raw_magnitude, self._prev_raw_magnitude = self._prev_raw_magnitude, raw_magnitude
+        
+        # Drop : montée soudaine d'énergie combinée au flux, amplifiée comme _analyze_drops
+        raw_rms = rms * gain
+        rise = max(0.0, raw_rms - self._prev_rms)
+        self._prev_rms = raw_rms
+        self._rise_max = max(rise, self._rise_max * 0.999)
+        self._flux_max = max(flux, self._flux_max * 0.999)
+        drop = (rise / self._rise_max) * (flux / self._flux_max)
+        drop = min(drop * 2.0, 1.0) if drop > 0.2 else 0.0
+        
+        # Beat strength : impulsion du suivi de beat une fois le tempo verrouillé, sinon basée sur les basses
+        if tracker.confidence >= 0.1:
+            beat_strength = tracker.beat_strength
+        else:
+            bass = float(bands[1])
+            beat_strength = min(bass * 3.0, 1.0) if bass > 0.1 else 0.0
+        raw = self._raw
+        n_bands = len(FREQUENCY_BANDS)
+        raw[n_bands] = beat_strength
+        raw[n_bands + 1] = min(rms * 5.0, 1.0)
+        raw[n_bands + 2] = flux
+        
+        # Lissage exponentiel sur le vecteur d'état : s * prev + (1 - s) * raw = s * (prev - raw) + raw
+        state = self._state
+        if self.prev_features is None:
+            state[:] = self._raw
+        else:
+            state -= self._raw
+            state *= self.smooth_factor
+            state += self._raw
         
-        # Lissage
-        if self.prev_features:
-            for field in features.__dataclass_fields__:
-                if field not in ['segment_type', 'onset_detected']:
-                    curr = getattr(features, field)
-                    prev = getattr(self.prev_features, field)
-                    setattr(features, field, prev * self.smooth_factor + curr * (1 - self.smooth_factor))
+        features = self._features
+        (features.sub_bass, features.bass, features.low_mid, features.mid, features.high_mid,
+         features.presence, features.brilliance, features.beat_strength, features.intensity,
+         features.spectral_flux) = state.tolist()
+        # Événements non lissés : un drop ou un onset ne dure qu'un buffer
+        features.glitch_intensity = drop
+        features.onset_detected = onset
+        features.tempo = tracker.tempo
+        # Phases non lissées : une rampe lissée n'atteindrait jamais 1 avant de retomber à 0.
+        # Un recalage de la PLL peut faire passer la phase sous 0 : les shaders reçoivent [0, 1)
+        features.beat_phase = _wrap_phase(tracker.phase)
+        features.bar_phase = _wrap_phase(((tracker.beat_count % 4) + tracker.phase) / 4.0)
         
         self.prev_features = features
-        return features
\ No newline at end of file
+        return features
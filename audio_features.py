@@ -0,0 +1,237 @@
+from dataclasses import dataclass, field
+from typing import Dict, Tuple
+import numpy as np
+
+# Structures et requêtes de features audio, sans dépendance à librosa : partagées par l'analyseur
+# (audio_analysis) et par les timelines de features pré-calculées (feature_timeline), ce qui permet
+# à une machine de rendu de travailler sans décoder ni analyser l'audio.
+
+@dataclass
+class AdvancedAudioFeatures:
+    """Features audio détaillées pour génération procédurale"""
+    # Bandes de fréquences (0-1)
+    sub_bass: float = 0.0      # 20-60 Hz
+    bass: float = 0.0           # 60-250 Hz
+    low_mid: float = 0.0        # 250-500 Hz
+    mid: float = 0.0            # 500-2000 Hz
+    high_mid: float = 0.0       # 2000-4000 Hz
+    presence: float = 0.0       # 4000-6000 Hz
+    brilliance: float = 0.0     # 6000+ Hz
+    
+    # Caractéristiques rythmiques
+    beat_strength: float = 0.0
+    tempo: float = 120.0
+    onset_detected: bool = False
+    beat_phase: float = 0.0     # 0-1 entre deux beats (0 = sur le beat)
+    bar_phase: float = 0.0      # 0-1 sur la mesure (0 = premier temps)
+    
+    # Caractéristiques spectrales
+    spectral_centroid: float = 0.0
+    spectral_bandwidth: float = 0.0
+    spectral_rolloff: float = 0.0
+    spectral_flux: float = 0.0
+    
+    # Caractéristiques harmoniques
+    harmonicity: float = 0.0
+    pitch: float = 0.0
+    
+    # Énergie globale
+    rms_energy: float = 0.0
+    zcr: float = 0.0  # Zero Crossing Rate
+    
+    # Méta-données de segment
+    segment_type: str = "neutral"  # intro, verse, chorus, bridge, outro
+    intensity: float = 0.5  # 0-1
+    glitch_intensity: float = 0.0  # 0-1, pour effets de drops/glitch
+    
+    # Canaux par stem ("drums.beat_strength", ...) quand l'analyse porte sur des stems
+    stems: Dict[str, float] = field(default_factory=dict)
+
+# Définition centralisée des bandes de fréquences (Hz)
+FREQUENCY_BANDS = {
+    'sub_bass': (20, 60),
+    'bass': (60, 250),
+    'low_mid': (250, 500),
+    'mid': (500, 2000),
+    'high_mid': (2000, 4000),
+    'presence': (4000, 6000),
+    'brilliance': (6000, 20000)
+}
+
+# Spectre d'affichage (overlay spectrogramme) : bins log-espacés, dB quantifiés sur 8 bits
+DISPLAY_BINS = 128
+DISPLAY_FMIN = 30.0
+DISPLAY_FMAX = 16000.0
+DISPLAY_DB_RANGE = 80.0
+
+_EMPTY_DISPLAY_SPECTRUM = np.zeros(DISPLAY_BINS, dtype=np.uint8)
+_EMPTY_DISPLAY_SPECTRUM.flags.writeable = False
+
+# Stems usuels (uniforms déclarés dans les shaders) et features exposées par stem.
+# Canal "<stem>.<feature>" dans la table et les modulations, uniform "<stem>_<feature>" côté GLSL.
+STEM_NAMES = ('drums', 'bass', 'vocals', 'other')
+STEM_CHANNELS = ('beat_strength', 'onset_detected', 'intensity', 'rms_energy', 'spectral_flux', 'bass', 'mid', 'presence')
+
+def stem_uniform_name(channel: str) -> str:
+    """Nom d'uniform GLSL d'un canal de stem ("drums.beat_strength" -> "drums_beat_strength")"""
+    return channel.replace('.', '_')
+
+class BeatGrid:
+    """Grille de beats pré-calculée : temps des beats, premiers temps de mesure et numéros de mesure.
+    
+    La position en beats est continue : interpolation linéaire entre deux beats détectés,
+    extrapolation au tempo médian avant le premier et après le dernier. Toutes les requêtes
+    (phase, beat / mesure suivants) sont en O(log n) via searchsorted, scalaires ou vectorisées.
+    """
+    
+    def __init__(self, beat_times, beats_per_bar: int = 4, downbeat_offset: int = 0, tempo: float = 120.0):
+        beat_times = np.asarray(beat_times, dtype=np.float64)
+        if len(beat_times) >= 2:
+            self.period = float(np.median(np.diff(beat_times)))
+        else:
+            self.period = 60.0 / tempo if tempo > 0 else 0.5
+        if len(beat_times) == 0:
+            beat_times = np.zeros(1)
+        self.beat_times = beat_times
+        self.beats_per_bar = beats_per_bar
+        self.downbeat_offset = int(downbeat_offset) % beats_per_bar
+        # Numéro de mesure de chaque beat (négatif pour une levée avant le premier temps)
+        self.bar_numbers = (np.arange(len(beat_times)) - self.downbeat_offset) // beats_per_bar
+        self.downbeat_times = beat_times[self.downbeat_offset::beats_per_bar]
+    
+    @classmethod
+    def from_tempo(cls, tempo: float, duration: float, anchor: float = 0.0, beats_per_bar: int = 4):
+        """Grille régulière (tempo constant) calée sur anchor"""
+        period = 60.0 / tempo if tempo > 0 else 0.5
+        first = anchor - np.floor(anchor / period) * period
+        return cls(np.arange(first, max(duration, first) + period, period), beats_per_bar, tempo=tempo)
+    
+    def beat_position(self, times):
+        """Position continue en beats (0 = premier beat de la grille)"""
+        t = np.asarray(times, dtype=np.float64)
+        b = self.beat_times
+        n = len(b)
+        if n >= 2:
+            idx = np.clip(np.searchsorted(b, t, side='right') - 1, 0, n - 2)
+            pos = idx + (t - b[idx]) / (b[idx + 1] - b[idx])
+            pos = np.where(t > b[-1], (n - 1) + (t - b[-1]) / self.period, pos)
+        else:
+            pos = (t - b[0]) / self.period
+        return np.where(t < b[0], (t - b[0]) / self.period, pos)
+    
+    def time_at(self, positions):
+        """Inverse de beat_position : instant d'une position en beats"""
+        p = np.asarray(positions, dtype=np.float64)
+        b = self.beat_times
+        n = len(b)
+        t = np.interp(p, np.arange(n), b)
+        t = np.where(p < 0, b[0] + p * self.period, t)
+        return np.where(p > n - 1, b[-1] + (p - (n - 1)) * self.period, t)
+    
+    def bar_position(self, times):
+        """Position continue en mesures (0 = mesure du premier temps détecté)"""
+        return (self.beat_position(times) - self.downbeat_offset) / self.beats_per_bar
+    
+    def phases(self, times) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(beat_phase, bar_phase, numéro de mesure) pour chaque instant"""
+        beat_pos = self.beat_position(times)
+        bar_pos = (beat_pos - self.downbeat_offset) / self.beats_per_bar
+        bar = np.floor(bar_pos)
+        return beat_pos - np.floor(beat_pos), bar_pos - bar, bar.astype(np.int64)
+    
+    def next_beat(self, time: float) -> float:
+        """Instant du prochain beat strictement après time"""
+        return float(self.time_at(np.floor(self.beat_position(time) + 1e-9) + 1))
+    
+    def bar_start(self, bar: int) -> float:
+        """Instant du premier temps de la mesure bar"""
+        return float(self.time_at(bar * self.beats_per_bar + self.downbeat_offset))
+    
+    def next_downbeat(self, time: float, bars: int = 1) -> float:
+        """Premier temps de la bars-ième mesure après celle en cours à time"""
+        return self.bar_start(int(np.floor(self.bar_position(time) + 1e-9)) + bars)
+
+class FeatureTableQueries:
+    """Requêtes sur une table de features par frame (struct-of-arrays).
+    
+    Attend sr, hop_length, n_frames, feature_table, segment_types, tempo, beat_grid
+    et display_spectrum sur l'instance.
+    """
+    
+    # Canaux par stem présents dans la table de features
+    stem_channels: Tuple[str, ...] = ()
+    
+    def get_features_at_time(self, time: float) -> AdvancedAudioFeatures:
+        """Extrait toutes les features à un instant donné (simple lecture dans la table pré-calculée)"""
+        frame = int(time * self.sr / self.hop_length)
+        frame = min(frame, self.n_frames - 1)
+        table = self.feature_table
+
+        segment = int(table['segment_index'][frame])
+        segment_type = self.segment_types[segment] if segment >= 0 else "neutral"
+        beat_phase, bar_phase, _ = self.beat_grid.phases(time)
+
+        return AdvancedAudioFeatures(
+            sub_bass=float(table['sub_bass'][frame]),
+            bass=float(table['bass'][frame]),
+            low_mid=float(table['low_mid'][frame]),
+            mid=float(table['mid'][frame]),
+            high_mid=float(table['high_mid'][frame]),
+            presence=float(table['presence'][frame]),
+            brilliance=float(table['brilliance'][frame]),
+            beat_strength=float(table['beat_strength'][frame]),
+            tempo=float(self.tempo),
+            onset_detected=bool(table['onset_detected'][frame]),
+            beat_phase=float(beat_phase),
+            bar_phase=float(bar_phase),
+            spectral_centroid=float(table['spectral_centroid'][frame]),
+            spectral_bandwidth=float(table['spectral_bandwidth'][frame]),
+            spectral_rolloff=float(table['spectral_rolloff'][frame]),
+            spectral_flux=float(table['spectral_flux'][frame]),
+            harmonicity=float(table['harmonicity'][frame]),
+            rms_energy=float(table['rms_energy'][frame]),
+            zcr=float(table['zcr'][frame]),
+            segment_type=segment_type,
+            intensity=float(table['intensity'][frame]),
+            glitch_intensity=float(table['glitch_intensity'][frame]),
+            stems={channel: float(table[channel][frame]) for channel in self.stem_channels}
+        )
+        
+    def get_features_batch(self, times) -> Dict[str, np.ndarray]:
+        """Version vectorisée de get_features_at_time : une colonne numpy par champ d'AdvancedAudioFeatures.
+
+        La colonne 'frame' donne l'index de frame d'analyse de chaque instant ; chaque canal de stem
+        ("drums.beat_strength", ...) est une colonne à part entière.
+        """
+        times = np.asarray(times, dtype=np.float64)
+        frames = np.minimum((times * self.sr / self.hop_length).astype(np.int64), self.n_frames - 1)
+        table = self.feature_table
+
+        batch = {name: table[name][frames] for name in (
+            'sub_bass', 'bass', 'low_mid', 'mid', 'high_mid', 'presence', 'brilliance',
+            'beat_strength', 'onset_detected', 'spectral_centroid', 'spectral_bandwidth',
+            'spectral_rolloff', 'spectral_flux', 'harmonicity', 'rms_energy', 'zcr',
+            'intensity', 'glitch_intensity'
+        ) + self.stem_channels}
+        batch['tempo'] = np.full(len(frames), self.tempo, dtype=np.float32)
+        batch['pitch'] = np.zeros(len(frames), dtype=np.float32)
+        beat_phase, bar_phase, _ = self.beat_grid.phases(times)
+        batch['beat_phase'] = beat_phase.astype(np.float32)
+        batch['bar_phase'] = bar_phase.astype(np.float32)
+
+        # Le dernier élément sert pour l'index -1 (hors segment)
+        segment_names = np.array(list(self.segment_types) + ["neutral"])
+        batch['segment_type'] = segment_names[table['segment_index'][frames]]
+        batch['frame'] = frames
+        return batch
+
+    def features_for_fps(self, fps: float, n_frames: int) -> Dict[str, np.ndarray]:
+        """Features de toutes les frames vidéo d'un export (instant = frame / fps)."""
+        return self.get_features_batch(np.arange(n_frames) / fps)
+
+    def get_display_spectrum(self, time: float) -> np.ndarray:
+        """Spectre d'affichage à un instant (DISPLAY_BINS valeurs uint8, log-fréquence, dB), sans copie"""
+        frame = int(time * self.sr / self.hop_length)
+        if 0 <= frame < len(self.display_spectrum):
+            return self.display_spectrum[frame]
+        return _EMPTY_DISPLAY_SPECTRUM
@@ -0,0 +1,85 @@
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+import librosa
+import soundfile as sf
+from scipy.ndimage import gaussian_filter1d
+
+from audio_analysis import AdvancedAudioAnalyzer
+
+HOP_LENGTH = 512
+
+def legacy_features(y, sr, hop_length=HOP_LENGTH):
+    """Reproduit l'ancienne chaîne d'analyse : chaque feature librosa recalcule sa propre STFT depuis y."""
+    features = {}
+    tempo, beat_frames = librosa.beat.beat_track(y=y, sr=sr, hop_length=hop_length)
+    features['tempo'] = float(tempo[0]) if np.ndim(tempo) > 0 else float(tempo)
+    features['beat_frames'] = beat_frames
+    features['onset_env'] = librosa.onset.onset_strength(y=y, sr=sr, hop_length=hop_length)
+    features['chroma'] = librosa.feature.chroma_stft(y=y, sr=sr, hop_length=hop_length)
+    features['rms'] = librosa.feature.rms(y=y, hop_length=hop_length)[0]
+    features['zcr'] = librosa.feature.zero_crossing_rate(y=y, hop_length=hop_length)[0]
+    features['D'] = np.abs(librosa.stft(y, hop_length=hop_length))
+    features['spectral_centroid'] = gaussian_filter1d(
+        librosa.feature.spectral_centroid(y=y, sr=sr, hop_length=hop_length)[0], sigma=2)
+    features['spectral_bandwidth'] = gaussian_filter1d(
+        librosa.feature.spectral_bandwidth(y=y, sr=sr, hop_length=hop_length)[0], sigma=2)
+    features['spectral_rolloff'] = librosa.feature.spectral_rolloff(
+        y=y, sr=sr, hop_length=hop_length, roll_percent=0.85)[0]
+    librosa.feature.tempogram(onset_envelope=features['onset_env'], sr=sr, hop_length=hop_length)
+    mfcc = librosa.feature.mfcc(y=y, sr=sr, n_mfcc=13, hop_length=hop_length)
+    features['segment_boundaries'] = librosa.segment.agglomerative(mfcc, k=8)
+    return features
+
+def make_test_signal(duration, sr=44100):
+    """Signal synthétique : kick à 128 BPM, basse et nappe harmonique."""
+    t = np.arange(int(duration * sr)) / sr
+    beat_phase = (t * 128 / 60.0) % 1.0
+    kick = np.sin(2 * np.pi * 55 * t) * np.exp(-beat_phase * 12)
+    pad = 0.2 * np.sin(2 * np.pi * 440 * t) + 0.1 * np.sin(2 * np.pi * 660 * t)
+    hats = 0.05 * np.random.default_rng(0).standard_normal(len(t)) * (((t * 256 / 60.0) % 1.0) < 0.1)
+    return (0.6 * kick + pad + hats).astype(np.float32)
+
+def main():
+    if len(sys.argv) > 1:
+        audio_path = sys.argv[1]
+        tmp_dir = None
+    else:
+        tmp_dir = tempfile.TemporaryDirectory()
+        audio_path = os.path.join(tmp_dir.name, "benchmark.wav")
+        sf.write(audio_path, make_test_signal(120.0), 44100)
+
+    y, sr = librosa.load(audio_path, sr=44100)
+    print(f"Audio: {audio_path} ({len(y) / sr:.1f}s)")
+
+    # Échauffement (compilation numba de librosa)
+    legacy_features(y[:sr * 5], sr)
+
+    t0 = time.perf_counter()
+    legacy = legacy_features(y, sr)
+    legacy_time = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    analyzer = AdvancedAudioAnalyzer(audio_path, hop_length=HOP_LENGTH, logger=lambda msg: None, use_cache=False,
+                                     use_pcm_store=False)
+    shared_time = time.perf_counter() - t0
+
+    print(f"Ancienne chaîne (STFT par feature) : {legacy_time:.2f}s")
+    print(f"Front-end STFT partagé (analyse complète) : {shared_time:.2f}s  (x{legacy_time / shared_time:.2f})")
+
+    print("\nÉcart relatif max par courbe :")
+    for name in ('onset_env', 'rms', 'zcr', 'spectral_centroid', 'spectral_bandwidth', 'spectral_rolloff', 'chroma'):
+        ref = np.asarray(legacy[name], dtype=np.float64)
+        new = np.asarray(getattr(analyzer, name), dtype=np.float64)
+        err = np.max(np.abs(ref - new)) / (np.max(np.abs(ref)) + 1e-9)
+        print(f"  {name:<20} {err:.2e}")
+    print(f"  {'tempo':<20} {legacy['tempo']:.2f} -> {analyzer.tempo:.2f} BPM")
+    print(f"  {'beats':<20} {len(legacy['beat_frames'])} -> {len(analyzer.beat_frames)}")
+
+    if tmp_dir:
+        tmp_dir.cleanup()
+
+if __name__ == "__main__":
+    main()
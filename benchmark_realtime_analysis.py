@@ -0,0 +1,92 @@
+import time
+import tracemalloc
+import numpy as np
+
+from audio_analysis import AdvancedAudioFeatures, FREQUENCY_BANDS, RealTimeAudioAnalyzer, StreamingBeatTracker
+
+BUFFER_SIZE = 1024
+N_BUFFERS = 5000
+
+class LegacyRealTimeAudioAnalyzer:
+    """Reproduit l'ancien chemin critique : masques booléens par bande, nouvel objet features et lissage par getattr/setattr."""
+
+    def __init__(self, sr=44100, buffer_size=BUFFER_SIZE):
+        self.freqs = np.fft.rfftfreq(buffer_size, 1/sr)
+        self.prev_features = None
+        self.smooth_factor = 0.3
+
+    def process(self, audio_buffer):
+        if np.max(np.abs(audio_buffer)) > 0:
+            audio_buffer = audio_buffer / np.max(np.abs(audio_buffer))
+        magnitude = np.abs(np.fft.rfft(audio_buffer))
+
+        def get_band_energy(min_freq, max_freq):
+            mask = (self.freqs >= min_freq) & (self.freqs < max_freq)
+            if np.any(mask):
+                return float(np.mean(magnitude[mask]))
+            return 0.0
+
+        gains = dict(zip(FREQUENCY_BANDS, RealTimeAudioAnalyzer.BAND_GAINS))
+        bands = {name: min(get_band_energy(*FREQUENCY_BANDS[name]) * float(gains[name]), 1.0) for name in FREQUENCY_BANDS}
+        bass = get_band_energy(*FREQUENCY_BANDS['bass']) * 2.0
+        rms = float(np.sqrt(np.mean(audio_buffer**2)))
+        features = AdvancedAudioFeatures(beat_strength=min(bass * 3.0, 1.0) if bass > 0.1 else 0.0,
+                                         intensity=min(rms * 5.0, 1.0), segment_type="neutral", **bands)
+        if self.prev_features:
+            for field in features.__dataclass_fields__:
+                if field not in ['segment_type', 'onset_detected']:
+                    curr = getattr(features, field)
+                    prev = getattr(self.prev_features, field)
+                    setattr(features, field, prev * self.smooth_factor + curr * (1 - self.smooth_factor))
+        self.prev_features = features
+        return features
+
+def make_buffers(n=64, buffer_size=BUFFER_SIZE, sr=44100):
+    """Buffers type micro : kick, nappe et bruit."""
+    rng = np.random.default_rng(0)
+    t = np.arange(buffer_size) / sr
+    return [(0.6 * np.sin(2 * np.pi * (50 + 3 * i) * t) + 0.2 * np.sin(2 * np.pi * 880 * t)
+             + 0.05 * rng.standard_normal(buffer_size)).astype(np.float32) for i in range(n)]
+
+def measure(analyzer, buffers, n_buffers=N_BUFFERS):
+    """Retourne (µs par buffer, octets alloués au pic pendant un buffer, octets retenus après n buffers)."""
+    for buf in buffers:  # régime établi
+        analyzer.process(buf)
+
+    start = time.perf_counter()
+    for i in range(n_buffers):
+        analyzer.process(buffers[i % len(buffers)])
+    per_call = (time.perf_counter() - start) / n_buffers * 1e6
+
+    tracemalloc.start()
+    analyzer.process(buffers[0])
+    tracemalloc.reset_peak()
+    base, _ = tracemalloc.get_traced_memory()
+    peak = 0
+    for i in range(200):
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        analyzer.process(buffers[i % len(buffers)])
+        peak = max(peak, tracemalloc.get_traced_memory()[1] - before)
+    retained = tracemalloc.get_traced_memory()[0] - base
+    tracemalloc.stop()
+    return per_call, peak, retained
+
+def main():
+    buffers = make_buffers()
+    print(f"{N_BUFFERS} buffers de {BUFFER_SIZE} échantillons")
+    for name, analyzer in (("Ancien process()", LegacyRealTimeAudioAnalyzer()), ("Nouveau process()", RealTimeAudioAnalyzer())):
+        per_call, peak, retained = measure(analyzer, buffers)
+        print(f"  {name:<18} {per_call:7.1f} µs/buffer  pic alloué/buffer: {peak:6d} o  retenu: {retained:d} o")
+
+    # Part du suivi onsets / tempo / phase dans le nouveau process()
+    tracker = StreamingBeatTracker()
+    for buf in buffers * 4:
+        tracker.process(buf)
+    start = time.perf_counter()
+    for i in range(N_BUFFERS):
+        tracker.process(buffers[i % len(buffers)])
+    print(f"  dont suivi de beat  {(time.perf_counter() - start) / N_BUFFERS * 1e6:7.1f} µs/buffer")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+import argparse
+import os
+import sys
+import numpy as np
+
+from analysis_cache import read_analysis_cache, write_analysis_cache
+from audio_features import BeatGrid, FeatureTableQueries
+
+# Timeline de features : tout ce qu'un rendu lit dans l'analyse, dans un fichier à colonnes.
+# Même conteneur que le cache d'analyse (cf. analysis_cache : en-tête JSON puis colonnes brutes
+# alignées sur 64 octets, relues par memory-map). Une machine de rendu n'a besoin ni de librosa
+# ni du décodage audio : ce module n'importe que numpy.
+#
+# En-tête (meta) :
+#   format, version        "kymatix-feature-timeline", TIMELINE_VERSION
+#   source                 nom du fichier audio analysé (information)
+#   duration, sr           durée (s) et fréquence d'échantillonnage de l'analyse
+#   hop_length, n_frames   une frame d'analyse = hop_length / sr secondes
+#   tempo                  BPM global
+#   segment_types          type de chaque segment (intro, verse, chorus, bridge, outro)
+#   beats_per_bar, downbeat_offset   grille de mesures (cf. BeatGrid)
+#   stem_channels          canaux de stems présents dans la table ("drums.beat_strength", ...)
+#   style, profile         résultat de MusicStyleClassifier
+# Colonnes :
+#   table/<feature>        (n_frames,) float32 par feature de AdvancedAudioFeatures et par canal de stem ;
+#                          table/onset_detected en uint8, table/segment_index en int32 (-1 = hors segment)
+#   beat_times             (n_beats,) float64, instants des beats (s)
+#   segment_times          (n_segments + 1,) float32, bornes des segments (s)
+#   display_spectrum       (n_frames, DISPLAY_BINS) uint8, spectre d'affichage log-fréquence en dB
+TIMELINE_FORMAT = "kymatix-feature-timeline"
+TIMELINE_VERSION = 1
+TIMELINE_SUFFIX = ".features.bin"
+
+
+def write_feature_timeline(path, analyzer, style, profile):
+    """Écrit la timeline de features d'un analyseur (analyse terminée ou relue du cache)."""
+    grid = analyzer.beat_grid
+    meta = {
+        "format": TIMELINE_FORMAT,
+        "version": TIMELINE_VERSION,
+        "source": os.path.basename(analyzer.audio_path),
+        "duration": float(analyzer.duration),
+        "sr": int(analyzer.sr),
+        "hop_length": int(analyzer.hop_length),
+        "n_frames": int(analyzer.n_frames),
+        "tempo": float(analyzer.tempo),
+        "segment_types": list(analyzer.segment_types),
+        "beats_per_bar": int(grid.beats_per_bar),
+        "downbeat_offset": int(grid.downbeat_offset),
+        "stem_channels": list(analyzer.stem_channels),
+        "style": style,
+        "profile": {key: float(value) for key, value in profile.items()},
+    }
+    arrays = {}
+    for name, column in analyzer.feature_table.items():
+        if name == 'onset_detected':
+            column = np.asarray(column).astype(np.uint8)
+        arrays[f"table/{name}"] = column
+    arrays["beat_times"] = np.asarray(grid.beat_times, dtype=np.float64)
+    arrays["segment_times"] = np.asarray(analyzer.segment_times, dtype=np.float32)
+    arrays["display_spectrum"] = analyzer.display_spectrum
+    write_analysis_cache(path, meta, arrays)
+    return path
+
+
+class FeatureTimeline(FeatureTableQueries):
+    """Timeline de features relue depuis un fichier : mêmes requêtes que AdvancedAudioAnalyzer, sans analyse."""
+
+    def __init__(self, path):
+        meta, arrays = read_analysis_cache(path)
+        if meta.get("format") != TIMELINE_FORMAT:
+            raise ValueError(f"{path} n'est pas une timeline de features")
+        if meta.get("version") != TIMELINE_VERSION:
+            raise ValueError(f"Version de timeline {meta.get('version')} incompatible (attendu {TIMELINE_VERSION})")
+
+        self.path = path
+        self.audio_path = meta["source"]
+        self.duration = meta["duration"]
+        self.sr = meta["sr"]
+        self.hop_length = meta["hop_length"]
+        self.n_frames = meta["n_frames"]
+        self.tempo = meta["tempo"]
+        self.segment_types = meta["segment_types"]
+        self.stem_channels = tuple(meta["stem_channels"])
+        self.style = meta["style"]
+        self.profile = meta["profile"]
+
+        self.feature_table = {name[len("table/"):]: column for name, column in arrays.items() if name.startswith("table/")}
+        self.feature_table['onset_detected'] = self.feature_table['onset_detected'].view(np.bool_)
+        self.segment_times = arrays["segment_times"]
+        self.display_spectrum = arrays["display_spectrum"]
+        self.beat_grid = BeatGrid(arrays["beat_times"], meta["beats_per_bar"], meta["downbeat_offset"], self.tempo)
+
+
+def default_timeline_path(audio_path):
+    return os.path.splitext(audio_path)[0] + TIMELINE_SUFFIX
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Analyse un morceau et exporte sa timeline de features (rendu sans analyse).")
+    parser.add_argument("audio", help="Fichier audio à analyser")
+    parser.add_argument("-o", "--output", default=None, help=f"Fichier de sortie (défaut: <audio>{TIMELINE_SUFFIX})")
+    parser.add_argument("--preset", default="Flat", help="Preset audio utilisé pour l'analyse (Flat, Bass Boost, Vocal Boost)")
+    parser.add_argument("--streaming", action="store_true", help="Analyse en flux par blocs (mémoire bornée)")
+    parser.add_argument("--stem", action="append", default=[], metavar="NOM=CHEMIN", help="Stem du morceau (répétable)")
+    args = parser.parse_args(argv)
+
+    if not os.path.isfile(args.audio):
+        print(f"Erreur: fichier introuvable - {args.audio}", file=sys.stderr)
+        return 1
+    stems = dict(item.split("=", 1) for item in args.stem)
+
+    # Seule la machine qui analyse a besoin de librosa
+    from audio_analysis import AdvancedAudioAnalyzer
+    analyzer = AdvancedAudioAnalyzer(args.audio, audio_preset=args.preset, streaming=args.streaming, stems=stems)
+    path = analyzer.export_feature_timeline(args.output or default_timeline_path(args.audio))
+    print(f"🗂️ Timeline de features: {path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,16 +3,13 @@ import os
 
 class FFmpegHandler:
     @staticmethod
-    def merge_audio_video(video_path, audio_path, output_path, bitrate="High Quality (CRF 18)", codec="H.264 (MP4)", logger=print):
-        logger(f"\n🔊 Fusion audio + vidéo avec ffmpeg (Codec: {codec})...")
-        cmd = [
-            'ffmpeg', '-y', '-loglevel', 'error', '-stats',
-            '-i', video_path
-        ]
-        
-        if "GIF" not in codec:
-            cmd.extend(['-i', audio_path])
+    def codec_args(codec="H.264 (MP4)", bitrate="High Quality (CRF 18)", filters=()):
+        """Options d'encodage ffmpeg pour les réglages codec / bitrate de l'interface.
 
+        filters : filtres vidéo appliqués avant ceux du codec (ex. "vflip")
+        """
+        cmd = []
+        filters = list(filters)
         # Codec specific settings
         if "ProRes" in codec:
             cmd.extend(['-c:v', 'prores_ks', '-profile:v', '3', '-vendor', 'apl0', '-bits_per_mb', '8000', '-pix_fmt', 'yuv422p10le'])
@@ -28,7 +25,7 @@ class FFmpegHandler:
         elif "VP9" in codec:
             cmd.extend(['-c:v', 'libvpx-vp9', '-b:v', '0', '-crf', '30', '-c:a', 'libvorbis'])
         elif "GIF" in codec:
-            cmd.extend(['-vf', 'fps=15,scale=480:-1:flags=lanczos,split[s0][s1];[s0]palettegen[p];[s1][p]paletteuse'])
+            filters.append('fps=15,scale=480:-1:flags=lanczos,split[s0][s1];[s0]palettegen[p];[s1][p]paletteuse')
         else: # H.264 Default
             cmd.extend(['-c:v', 'libx264', '-preset', 'medium', '-pix_fmt', 'yuv420p'])
             cmd.extend(['-c:a', 'aac', '-b:a', '320k'])
@@ -37,10 +34,25 @@ class FFmpegHandler:
                 cmd.extend(['-crf', crf_val])
             elif "Mbps" in bitrate:
                 cmd.extend(['-b:v', bitrate.split(" ")[0] + "M"])
-            
+
+        if filters:
+            cmd.extend(['-vf', ",".join(filters)])
         if "GIF" not in codec:
             cmd.append('-shortest')
-            
+        return cmd
+
+    @staticmethod
+    def merge_audio_video(video_path, audio_path, output_path, bitrate="High Quality (CRF 18)", codec="H.264 (MP4)", logger=print):
+        logger(f"\n🔊 Fusion audio + vidéo avec ffmpeg (Codec: {codec})...")
+        cmd = [
+            'ffmpeg', '-y', '-loglevel', 'error', '-stats',
+            '-i', video_path
+        ]
+        
+        if "GIF" not in codec:
+            cmd.extend(['-i', audio_path])
+
+        cmd.extend(FFmpegHandler.codec_args(codec, bitrate))
         cmd.append(output_path)
 
         try:
@@ -80,3 +92,58 @@ class FFmpegHandler:
             subprocess.run(cmd, check=True)
         except Exception as e:
             logger(f"❌ Erreur export audio: {e}")
+
+
+class FFmpegVideoSink:
+    """Encodeur ffmpeg alimenté en frames brutes sur stdin, audio multiplexé au passage.
+
+    Un seul encodage, sans fichier intermédiaire : la vidéo est finie quand la dernière frame est écrite.
+    flip : frames en bas-en-haut (lecture OpenGL), retournées par ffmpeg (vflip).
+    """
+
+    def __init__(self, output_path, width, height, fps, audio_path=None, bitrate="High Quality (CRF 18)",
+                 codec="H.264 (MP4)", pix_fmt="rgb24", flip=True, logger=print):
+        self.output_path = output_path
+        self.logger = logger
+        self.frame_bytes = width * height * 3
+        cmd = [
+            'ffmpeg', '-y', '-loglevel', 'error', '-stats',
+            '-f', 'rawvideo', '-pix_fmt', pix_fmt, '-s', f"{width}x{height}", '-framerate', str(fps), '-i', '-'
+        ]
+        if audio_path and "GIF" not in codec:
+            cmd.extend(['-i', audio_path, '-map', '0:v', '-map', '1:a'])
+        cmd.extend(FFmpegHandler.codec_args(codec, bitrate, ['vflip'] if flip else ()))
+        cmd.append(output_path)
+
+        logger(f"🎞️ Encodage direct ffmpeg (Codec: {codec})...")
+        try:
+            self.process = subprocess.Popen(cmd, stdin=subprocess.PIPE)
+        except FileNotFoundError:
+            logger("\n❌ ffmpeg n'est pas installé!")
+            raise
+
+    def write(self, frame):
+        """frame : bytes ou tableau contigu de width * height * 3 octets"""
+        try:
+            self.process.stdin.write(frame)
+        except BrokenPipeError:
+            raise RuntimeError(f"ffmpeg s'est arrêté pendant l'encodage (code {self.process.wait()})")
+
+    def close(self):
+        """Termine le flux et attend la fin de l'encodage ; True si la vidéo est complète"""
+        self.process.stdin.close()
+        if self.process.wait() == 0:
+            self.logger(f"\n🎉 SUCCÈS! Vidéo exportée: {self.output_path}")
+            return True
+        self.logger(f"\n❌ Erreur ffmpeg (code {self.process.returncode})")
+        return False
+
+    def abort(self):
+        """Interrompt l'encodage et supprime la vidéo partielle"""
+        try:
+            self.process.stdin.close()
+        except OSError:
+            pass
+        self.process.kill()
+        self.process.wait()
+        if os.path.exists(self.output_path): os.remove(self.output_path)
@@ -0,0 +1,111 @@
+import queue
+import threading
+import time
+
+# Fin de flux, transmise d'étape en étape
+_STOP = object()
+
+
+class FramePipeline:
+    """Étapes CPU d'un rendu (conversion, encodage...) sur des threads reliés par des files bornées.
+
+    Le thread GL ne fait que rendre et lire les pixels : submit() dépose la frame et rend la main,
+    sauf si max_pending frames attendent déjà devant une étape (contre-pression : mémoire bornée).
+    Un thread par étape, donc l'ordre des frames est conservé. numpy, OpenCV et l'écriture dans
+    un pipe relâchent le GIL : les étapes avancent pendant que le GPU rend la frame suivante.
+    """
+
+    def __init__(self, stages, max_pending=4, discard=None):
+        """stages : liste de (nom, fonction(frame_num, data) -> data pour l'étape suivante)
+
+        discard(frame_num, data) : appelé pour chaque frame abandonnée (erreur, annulation), par
+        exemple pour libérer le tampon qu'elle référence.
+        """
+        self.stats = {}
+        self._discard = discard
+        self._error = None
+        self._cancelled = False
+        self._closed = False
+        self._queues = [queue.Queue(maxsize=max_pending) for _ in stages]
+        self._threads = []
+        for index, (name, func) in enumerate(stages):
+            self.stats[name] = [0, 0.0]
+            outbox = self._queues[index + 1] if index + 1 < len(stages) else None
+            thread = threading.Thread(target=self._run, args=(name, func, self._queues[index], outbox),
+                                      name=f"frame-{name}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _run(self, name, func, inbox, outbox):
+        stats = self.stats[name]
+        while True:
+            item = inbox.get()
+            if item is _STOP:
+                break
+            # Après une erreur ou une annulation, on vide la file sans traiter (l'amont ne bloque pas)
+            frame_num, data = item
+            if self._error is not None or self._cancelled:
+                self._drop(frame_num, data)
+                continue
+            start = time.perf_counter()
+            try:
+                data = func(frame_num, data)
+            except BaseException as e:
+                self._error = e
+                self._drop(frame_num, data)
+                continue
+            stats[0] += 1
+            stats[1] += time.perf_counter() - start
+            if outbox is not None:
+                outbox.put((frame_num, data))
+        if outbox is not None:
+            outbox.put(_STOP)
+
+    def _drop(self, frame_num, data):
+        if self._discard is not None:
+            try:
+                self._discard(frame_num, data)
+            except Exception:
+                pass
+
+    def submit(self, frame_num, data):
+        """Dépose une frame ; bloque tant que la première étape a max_pending frames en attente"""
+        if self._error is not None:
+            raise self._error
+        self._queues[0].put((frame_num, data))
+
+    @property
+    def capacity(self):
+        """Frames que le pipeline peut contenir à la fois : une file pleine plus une frame en cours par étape"""
+        return sum(q.maxsize + 1 for q in self._queues)
+
+    def record(self, name, seconds, frames=1):
+        """Temps passé par une étape tenue hors du pipeline (rendu GL sur le thread appelant)"""
+        stats = self.stats.setdefault(name, [0, 0.0])
+        stats[0] += frames
+        stats[1] += seconds
+
+    def close(self):
+        """Attend que toutes les frames aient traversé les étapes ; relance l'erreur d'une étape"""
+        if not self._closed:
+            self._closed = True
+            self._queues[0].put(_STOP)
+            for thread in self._threads:
+                thread.join()
+        if self._error is not None:
+            raise self._error
+
+    def cancel(self):
+        """Abandonne les frames en attente et arrête les threads"""
+        self._cancelled = True
+        try:
+            self.close()
+        except BaseException:
+            pass
+
+    def throughput(self):
+        """{étape: frames par seconde de travail effectif}"""
+        return {name: (count / busy if busy > 0 else 0.0) for name, (count, busy) in self.stats.items()}
+
+    def summary(self):
+        return " | ".join(f"{name} {fps:.1f} fps" for name, fps in self.throughput().items())
@@ -3,6 +3,7 @@ import time
 import numpy as np
 from PyQt6.QtCore import QTimer, QThread, pyqtSignal
 from gui_threads import AudioLoaderThread, AnalysisThread
+from audio_analysis import CoarseAudioAnalyzer
 from vst_manager import VSTManager
 class AudioUpdateThread(QThread):
     """Thread dedicated to audio synchronization and feature extraction"""
@@ -38,14 +39,20 @@ class AudioUpdateThread(QThread):
 
             features = None
             spectrum = None
-            if self.analyzer:
+            # Single read per tick: the analyzer can be hot-swapped from the GUI thread
+            analyzer = self.analyzer
+            if analyzer:
                 # This is the heavy part we want off the main thread
-                features = self.analyzer.get_features_at_time(current_time)
-                spectrum = self.analyzer.get_spectrum_at_time(current_time)
+                features = analyzer.get_features_at_time(current_time)
+                spectrum = analyzer.get_display_spectrum(current_time)
             
             self.update_signal.emit(current_time, features, spectrum)
             time.sleep(0.016) # ~60 FPS
 
+    def set_analyzer(self, analyzer):
+        """Swaps the analyzer without interrupting playback (picked up on the next tick)."""
+        self.analyzer = analyzer
+
     def stop(self):
         self.running = False
         self.wait()
@@ -65,7 +72,7 @@ class AudioMixin:
         self.sim_start_time = 0
         self.sim_pause_time = 0
 
-    def on_audio_loaded_for_preview(self, data, path_for_playback):
+    def on_audio_loaded_for_preview(self, data, path_for_playback, peaks=None):
         self.audio_data = data
 
         # Load the (potentially processed) audio into pygame for playback
@@ -77,37 +84,46 @@ class AudioMixin:
             self.log(f"❌ Could not load audio for preview: {e}")
             self.audio_loaded = False
 
-        # Update waveform display
-        if data is not None and data.ndim == 2:
-            mono = np.mean(data, axis=0)
-            self.waveform.set_data(mono)
-        else:
-            self.waveform.set_data(data)
+        # Update waveform display (peak pyramid built by the loader thread)
+        self.waveform.set_data(data, peaks)
             
         if self.timeline_widget:
-            self.timeline_widget.set_audio_data(data)
+            self.timeline_widget.set_audio_data(data, peaks=peaks)
 
-        # Start analysis on the original audio file path
-        self.log("📊 Starting full audio analysis for preview...")
+        # Start analysis on the original audio file path (quick coarse pass first, then full quality)
+        self.log("📊 Starting progressive audio analysis for preview...")
         self.analysis_thread = AnalysisThread(self.audio_input.text(), self.audio_preset_combo.currentText())
         self.analysis_thread.log_signal.connect(self.log)
+        self.analysis_thread.coarse_ready.connect(self.on_coarse_analysis_ready)
         self.analysis_thread.analysis_complete.connect(self.on_analysis_complete)
         self.analysis_thread.start()
 
-    def on_analysis_complete(self, analyzer):
-        if analyzer:
-            self.analyzer = analyzer
-            self.preview_widget.set_analyzer(analyzer)
+    def _install_analyzer(self, analyzer):
+        """Makes the analyzer current everywhere, including a running AudioUpdateThread."""
+        self.analyzer = analyzer
+        self.preview_widget.set_analyzer(analyzer)
+        if self.audio_thread and self.audio_thread.isRunning():
+            self.audio_thread.set_analyzer(analyzer)
+        else:
             self.seek_slider.setRange(0, int(self.analyzer.duration * 1000))
-            
             tot_sec = int(self.analyzer.duration)
             self.lbl_time.setText(f"00:00 / {tot_sec//60:02d}:{tot_sec%60:02d}")
-            
+        self.btn_play.setEnabled(True)
+
+    def on_coarse_analysis_ready(self, analyzer):
+        self._install_analyzer(analyzer)
+        self.log("⚡ Quick preview ready, full analysis continues in background...")
+
+    def on_analysis_complete(self, analyzer):
+        if analyzer:
+            self._install_analyzer(analyzer)
             self.log("✅ Analysis complete. Ready for preview.")
             
-            self.btn_play.setEnabled(True)
             if not self.audio_loaded:
                 self.log("⚠️ Audio playback disabled (Load failed), using simulated timing.")
+        elif isinstance(self.analyzer, CoarseAudioAnalyzer):
+            # Keep the coarse analysis rather than falling back to simulation
+            self.log("⚠️ Full analysis failed, keeping the quick preview analysis.")
         else:
             self.log("❌ Analysis failed. Switching to simulation mode.")
             class DummyAnalyzer:
@@ -119,6 +135,8 @@ class AudioMixin:
                     return AdvancedAudioFeatures(intensity=0.5, beat_strength=0.5)
                 def get_spectrum_at_time(self, t):
                     return np.zeros(100)
+                def get_display_spectrum(self, t):
+                    return np.zeros(128, dtype=np.uint8)
             
             self.analyzer = DummyAnalyzer()
             self.preview_widget.set_analyzer(self.analyzer)
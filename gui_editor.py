@@ -416,6 +416,7 @@ col = vec3(0.5, 0.8, 1.0) * diff;
             "texture", "texture2D", "textureCube", "textureProj", "textureLod"
         ]
         uniforms = re.findall(r"uniform\s+\w+\s+(\w+);", ProceduralShaderGenerator.UNIFORMS_BLOCK)
+        uniforms += list(ProceduralShaderGenerator.PARAMS_BLOCK_FIELDS)
         all_words = list(set(keywords + funcs + uniforms))
         completer = QCompleter(all_words, self)
         self.editor.set_completer(completer)
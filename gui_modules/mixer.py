@@ -2,6 +2,7 @@ from PyQt6.QtWidgets import (QGroupBox, QVBoxLayout, QHBoxLayout, QComboBox, QPu
                              QLabel, QLineEdit, QCheckBox, QSpinBox, QDoubleSpinBox, QGridLayout, 
                              QSlider, QAbstractSpinBox, QMenu)
 from PyQt6.QtCore import Qt
+from audio_features import STEM_NAMES, STEM_CHANNELS
 from .base import BaseModule
 
 class MixerModule(BaseModule):
@@ -445,6 +446,8 @@ class ModulationModule(BaseModule):
         layout.setContentsMargins(5, 15, 5, 5)
 
         self.sources = ["None", "sub_bass", "bass", "low_mid", "mid", "high_mid", "presence", "brilliance", "beat_strength", "intensity", "kick", "snare", "hi_hats"]
+        # Canaux par stem, actifs quand le morceau est analysé avec ses stems
+        self.sources += [f"{stem}.{feature}" for stem in STEM_NAMES for feature in STEM_CHANNELS]
         self.targets = ["None", "bloom_strength", "aberration_strength", "grain_strength", "glitch_strength", 
                         "vignette_strength", "scanline_strength", "contrast_strength", "saturation_strength", 
                         "brightness_strength", "gamma_strength", "exposure_strength", "strobe_strength", 
@@ -61,7 +61,8 @@ class PlaylistMixin:
         duration = item.data(Qt.ItemDataRole.UserRole + 1)
         
         if self.playlist_beat_sync_check.isChecked():
-            duration = (60.0 / self.detected_bpm) * 4 * self.playlist_bars_spin.value()
+            # Bascule calée sur la grille de beats de l'analyse (prochaine mesure), sinon sur le BPM
+            duration = self._beat_sync_duration(getattr(self, 'analyzer', None), self.preview_widget.playback_time)
         
         transition_time = 0.0
         if self.playlist_crossfade_check.isChecked():
@@ -70,6 +71,16 @@ class PlaylistMixin:
         self.trigger_scene(scene_idx, transition_duration=transition_time)
         self.playlist_timer.start(int(duration * 1000))
 
+    def _beat_sync_duration(self, analyzer, start_time):
+        """Durée jusqu'au premier temps fort situé playlist_bars_spin mesures après start_time"""
+        bars = self.playlist_bars_spin.value()
+        grid = getattr(analyzer, 'beat_grid', None)
+        if grid is not None:
+            duration = grid.next_downbeat(start_time, bars) - start_time
+            if duration > 0:
+                return duration
+        return (60.0 / self.detected_bpm) * 4 * bars
+
     def edit_playlist_item_duration(self, item):
         current_duration = item.data(Qt.ItemDataRole.UserRole + 1)
         val, ok = QInputDialog.getDouble(self, "Durée", "Durée de la scène (secondes):", current_duration, 0.1, 3600, 1)
@@ -94,12 +105,14 @@ class PlaylistMixin:
 
         self.log("📊 Analyse du BPM pour l'export playlist...")
         try:
-            analyzer = AdvancedAudioAnalyzer(audio_path)
+            # Même clé de cache que l'analyse principale (preset inclus) : pas de ré-analyse si déjà faite
+            analyzer = AdvancedAudioAnalyzer(audio_path, audio_preset=self.audio_preset_combo.currentText(), logger=self.log)
             self.detected_bpm = analyzer.tempo
             self.log(f"BPM Détecté: {self.detected_bpm}")
         except Exception as e:
             self.log(f"Erreur analyse BPM: {e}. Utilisation de 120 BPM.")
             self.detected_bpm = 120.0
+            analyzer = None
 
         macro_data = []
         current_time = 0.0
@@ -121,8 +134,7 @@ class PlaylistMixin:
                 
                 duration = item.data(Qt.ItemDataRole.UserRole + 1)
                 if self.playlist_beat_sync_check.isChecked():
-                    bars = self.playlist_bars_spin.value()
-                    duration = (60.0 / self.detected_bpm) * 4 * bars
+                    duration = self._beat_sync_duration(analyzer, current_time)
                 
                 if 'style' in scene_data:
                     macro_data.append({'time': current_time, 'type': 'style', 'value': scene_data['style']})
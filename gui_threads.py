@@ -1,6 +1,5 @@
 import os
 import json
-import librosa
 import urllib.request
 import cv2
 import time
@@ -9,6 +8,9 @@ import pyaudio # New import
 from PyQt6.QtCore import QThread, pyqtSignal, QMutex, QMutexLocker
 from video_exporter import AdvancedVideoExporter, RenderConfig
 from audio_analysis import RealTimeAudioAnalyzer, AdvancedAudioFeatures # New import
+from analysis_cache import get_analysis_cache
+from pcm_store import get_pcm_store
+from waveform_peaks import PeakPyramid
 
 CURRENT_VERSION = "1.0.0"
 UPDATE_URL = "https://raw.githubusercontent.com/Patrick/MusicVideoGen/main/version.json"
@@ -29,7 +31,7 @@ class UpdateCheckerThread(QThread):
 
 class AudioLoaderThread(QThread):
     """Thread pour charger l'audio pour la preview sans bloquer l'UI"""
-    loaded = pyqtSignal(object, str) # data, path_for_playback
+    loaded = pyqtSignal(object, str, object) # data, path_for_playback, peaks
     
     def __init__(self, path, main_window=None):
         super().__init__()
@@ -40,7 +42,8 @@ class AudioLoaderThread(QThread):
         path_for_playback = self.path
         try:
             # Chargement en stéréo pour le goniomètre, SR moyen pour perf/qualité
-            y, _ = librosa.load(self.path, sr=22050, mono=False)
+            # (vue du PCM décodé partagé : l'analyse relira le même décodage)
+            y, _ = get_pcm_store().get(self.path, sr=22050, mono=False)
 
             # Apply VST if enabled
             if self.mw and self.mw.vst_enable_check.isChecked():
@@ -54,27 +57,39 @@ class AudioLoaderThread(QThread):
                         path_for_playback = "temp_vst_preview.wav"
                         sf.write(path_for_playback, y.T, 22050) # soundfile expects (samples, channels)
 
-            self.loaded.emit(y, path_for_playback)
+            # Pyramide de crêtes calculée ici une fois pour toutes : waveform et timeline ne font plus que la lire
+            self.loaded.emit(y, path_for_playback, PeakPyramid(y, sr=22050))
         except ImportError:
             if self.mw: self.mw.log("❌ VST/Audio processing requires 'soundfile' and 'librosa'. Please run 'pip install soundfile librosa'.")
-            self.loaded.emit(None, self.path)
+            self.loaded.emit(None, self.path, None)
         except Exception as e:
             print(f"AudioLoaderThread Error: {e}")
-            self.loaded.emit(None, self.path)
+            self.loaded.emit(None, self.path, None)
 
 class AnalysisThread(QThread):
-    """Thread pour l'analyse audio complète sans bloquer l'UI"""
+    """Thread pour l'analyse audio complète sans bloquer l'UI.
+    
+    En mode progressif, une passe rapide (11 kHz) est émise d'abord via coarse_ready,
+    puis l'analyse complète via analysis_complete.
+    """
+    coarse_ready = pyqtSignal(object)
     analysis_complete = pyqtSignal(object)
     log_signal = pyqtSignal(str)
 
-    def __init__(self, audio_path, audio_preset):
+    def __init__(self, audio_path, audio_preset, progressive=True):
         super().__init__()
         self.audio_path = audio_path
         self.audio_preset = audio_preset
+        self.progressive = progressive
 
     def run(self):
+        from audio_analysis import AdvancedAudioAnalyzer, CoarseAudioAnalyzer
+        if self.progressive:
+            try:
+                self.coarse_ready.emit(CoarseAudioAnalyzer(self.audio_path, audio_preset=self.audio_preset, logger=self.log_signal.emit))
+            except Exception as e:
+                self.log_signal.emit(f"⚠️ Coarse analysis failed: {e}")
         try:
-            from audio_analysis import AdvancedAudioAnalyzer
             analyzer = AdvancedAudioAnalyzer(self.audio_path, audio_preset=self.audio_preset, logger=self.log_signal.emit)
             self.analysis_complete.emit(analyzer)
         except Exception as e:
@@ -221,6 +236,7 @@ class RenderThread(QThread):
                     logo_path=self.params.get('logo_path', None),
                     spectrogram_enabled=self.params.get('spectrogram', False),
                     audio_preset=self.params.get('audio_preset', "Flat"),
+                    streaming_analysis=self.params.get('streaming_analysis', False),
                     pbo_enabled=self.params.get('pbo_enabled', True),
                     vr_mode=self.params.get('vr_mode', False),
                     user_texture_path=self.params.get('user_texture'),
@@ -257,6 +273,11 @@ class RenderThread(QThread):
                         max_duration=self.params.get('max_duration'),
                         macro_data=self.params.get('macro_data')
                     )
+            
+            if total > 1:
+                stats = get_analysis_cache().stats()
+                self.log_signal.emit(f"🗄️ Cache d'analyse: {stats['hits']} hits / {stats['misses']} misses, "
+                                     f"{stats['entries']} entrées ({stats['size_bytes'] / 1e6:.0f} Mo)")
                 
             self.finished_signal.emit()
         except Exception as e:
@@ -7,6 +7,7 @@ from PyQt6.QtWidgets import (QMainWindow, QWidget, QVBoxLayout, QGraphicsView, Q
                              QGraphicsObject, QMenu, QCheckBox, QGraphicsItemGroup, QColorDialog, QGraphicsPolygonItem)
 from PyQt6.QtCore import Qt, QRectF, QPointF, pyqtSignal, QObject, QEasingCurve, QPoint
 from PyQt6.QtGui import QPainter, QPen, QBrush, QColor, QFont, QPainterPath, QCursor, QPolygonF
+from waveform_peaks import PeakPyramid, zigzag_points, polygon_from_points
 
 class TimelineKeyframe(QGraphicsRectItem):
     def __init__(self, time, value, parent=None, easing=QEasingCurve.Type.Linear):
@@ -160,6 +161,8 @@ class TimelineClipItem(QGraphicsRectItem):
         self.setPen(QPen(Qt.GlobalColor.black))
         self.setFlag(QGraphicsItem.GraphicsItemFlag.ItemIsMovable)
         self.setFlag(QGraphicsItem.GraphicsItemFlag.ItemIsSelectable)
+        # exposedRect précis : la forme d'onde ne calcule que la partie visible du clip
+        self.setFlag(QGraphicsItem.GraphicsItemFlag.ItemUsesExtendedStyleOption)
         self.setAcceptHoverEvents(True)
         self.resize_mode = None
         
@@ -177,48 +180,26 @@ class TimelineClipItem(QGraphicsRectItem):
         painter.setPen(self.pen())
         painter.drawRect(self.rect())
         
-        # Draw Waveform
+        # Draw Waveform (min/max from the scene's peak pyramid, one column per device pixel)
         scene = self.scene()
-        if scene and hasattr(scene, 'audio_data') and scene.audio_data is not None:
-            data = scene.audio_data
-            sr = getattr(scene, 'sample_rate', 22050)
-            
-            # Calculate time range relative to master audio
-            start_sec = max(0, self.x() / 100.0)
-            duration_sec = self.rect().width() / 100.0
-            
-            start_idx = int(start_sec * sr)
-            end_idx = int((start_sec + duration_sec) * sr)
-            
-            if start_idx < data.shape[-1]:
-                # Handle stereo/mono
-                if data.ndim == 2:
-                    chunk = np.mean(data[:, start_idx:end_idx], axis=0)
-                else:
-                    chunk = data[start_idx:end_idx]
+        peaks = getattr(scene, 'peaks', None) if scene else None
+        if peaks is not None:
+            rect = self.rect()
+            exposed = option.exposedRect.intersected(rect)
+            # Time range relative to master audio (100 px per second)
+            start_sec = self.x() / 100.0 + (exposed.left() - rect.left()) / 100.0
+            end_sec = start_sec + exposed.width() / 100.0
+            
+            if exposed.width() > 0 and start_sec < peaks.duration and end_sec > 0:
+                n_columns = max(1, int(exposed.width() * abs(painter.worldTransform().m11())))
+                mins, maxs, _ = peaks.columns_for_time(start_sec, end_sec, n_columns)
+                h = rect.height()
+                mid_y = rect.top() + h / 2
                 
-                if len(chunk) > 0:
-                    rect = self.rect()
-                    w = rect.width()
-                    h = rect.height()
-                    mid_y = rect.top() + h / 2
-                    
-                    # Downsample for display performance
-                    step = max(1, int(len(chunk) / w))
-                    display_data = chunk[::step]
-                    
-                    path = QPainterPath()
-                    path.moveTo(rect.left(), mid_y)
-                    
-                    for i, val in enumerate(display_data):
-                        if i > w: break
-                        x = rect.left() + i
-                        y = mid_y - val * (h * 0.45)
-                        path.lineTo(x, y)
-                        
-                    painter.setPen(QPen(QColor(0, 0, 0, 120), 1))
-                    painter.setBrush(Qt.BrushStyle.NoBrush)
-                    painter.drawPath(path)
+                points = zigzag_points(exposed.left(), exposed.width(), mid_y - maxs * (h * 0.45), mid_y - mins * (h * 0.45))
+                painter.setPen(QPen(QColor(0, 0, 0, 120), 1))
+                painter.setBrush(Qt.BrushStyle.NoBrush)
+                painter.drawPolyline(polygon_from_points(points))
 
         # --- Draw Automation Curve (Bezier) ---
         keyframes = []
@@ -400,7 +381,7 @@ class TimelineScene(QGraphicsScene):
         self.setBackgroundBrush(QBrush(QColor("#222")))
         self.setSceneRect(0, 0, 5000, 600)
         self.grid_step = 100 # 1 second = 100px
-        self.audio_data = None
+        self.peaks = None # PeakPyramid de l'audio maître (le signal brut n'est pas conservé)
         self.sample_rate = 22050
         self.tracks = []
         # Default tracks
@@ -453,9 +434,12 @@ class TimelineScene(QGraphicsScene):
             painter.setPen(QColor("#888"))
             painter.drawText(x + 5, 15, f"{sec}s")
 
-    def set_audio_data(self, data, sr=22050):
-        self.audio_data = data
+    def set_audio_data(self, data, sr=22050, peaks=None):
         self.sample_rate = sr
+        if data is None:
+            self.peaks = None
+        else:
+            self.peaks = peaks if peaks is not None else PeakPyramid(data, sr)
         self.update()
 
 class TimelineView(QGraphicsView):
@@ -639,8 +623,8 @@ class TimelineWidget(QWidget):
                 TimelineKeyframe(3.5, 1.0, item, QEasingCurve.Type.OutQuad)
                 break
 
-    def set_audio_data(self, data, sr=22050):
-        self.scene.set_audio_data(data, sr)
+    def set_audio_data(self, data, sr=22050, peaks=None):
+        self.scene.set_audio_data(data, sr, peaks)
 
     def keyPressEvent(self, event):
         if event.key() == Qt.Key.Key_S:
@@ -10,21 +10,30 @@ from PyQt6.QtGui import QPainter, QColor, QPen, QLinearGradient, QSyntaxHighligh
 from OpenGL.GL import *
 from OpenGL.GL.shaders import compileProgram, compileShader
 from shader_generator import ProceduralShaderGenerator
+from audio_features import stem_uniform_name
 from particle_system import ParticleSystem
+from opengl_renderer import ParamsUniformBuffer
 from obj_loader import OBJLoader
 from model_renderer import ModelRenderer
 from collections import deque
+from waveform_peaks import PeakPyramid, zigzag_points, polygon_from_points
 import dearpygui.dearpygui as dpg
 
 class WaveformWidget(QWidget):
-    """Widget pour afficher la forme d'onde audio"""
+    """Widget pour afficher la forme d'onde audio (min/max + RMS depuis une pyramide de crêtes)"""
     def __init__(self, parent=None):
         super().__init__(parent)
         self.setMinimumHeight(10)
         self.data = None
+        self.peaks = None
 
-    def set_data(self, data):
+    def set_data(self, data, peaks=None):
+        """peaks : PeakPyramid déjà calculée (thread de chargement), sinon construite ici"""
         self.data = data
+        if data is None:
+            self.peaks = None
+        else:
+            self.peaks = peaks if peaks is not None else PeakPyramid(data)
         self.update()
 
     def paintEvent(self, event):
@@ -34,36 +43,25 @@ class WaveformWidget(QWidget):
         # Fond
         painter.fillRect(self.rect(), QColor("#000000"))
         
-        if self.data is None:
+        if self.peaks is None:
             painter.setPen(QColor("#444444"))
             painter.drawText(self.rect(), Qt.AlignmentFlag.AlignCenter, self.parent().tr("waveform_no_preview"))
             return
 
-        # Dessin de la waveform
-        painter.setPen(QPen(QColor("#00FF00"), 1))
-        
         w = self.width()
         h = self.height()
         mid_h = h / 2
         
-        # Downsampling simple pour l'affichage
-        step = max(1, len(self.data) // w)
-        samples = self.data[::step]
+        # Une colonne min/max/RMS par pixel, niveau de pyramide choisi selon le zoom
+        mins, maxs, rms = self.peaks.columns(0, self.peaks.n_samples, w)
         
         # Normalisation
-        max_val = np.max(np.abs(samples)) if len(samples) > 0 else 1.0
-        if max_val == 0: max_val = 1.0
-        
-        # Création des lignes
-        path_points = []
-        for x, val in enumerate(samples):
-            if x >= w: break
-            y = mid_h - (val / max_val) * (mid_h - 5)
-            path_points.append((x, y))
-            
-        for i in range(len(path_points) - 1):
-            painter.drawLine(int(path_points[i][0]), int(path_points[i][1]), 
-                             int(path_points[i+1][0]), int(path_points[i+1][1]))
+        scale = (mid_h - 5) / (self.peaks.peak or 1.0)
+        
+        painter.setPen(QPen(QColor("#00FF00"), 1))
+        painter.drawPolyline(polygon_from_points(zigzag_points(0, w, mid_h - maxs * scale, mid_h - mins * scale)))
+        painter.setPen(QPen(QColor("#7FFF7F"), 1))
+        painter.drawPolyline(polygon_from_points(zigzag_points(0, w, mid_h - rms * scale, mid_h + rms * scale)))
 
 class VUMeterWidget(QWidget):
     """VU-mètre stéréo vertical"""
@@ -351,10 +349,8 @@ class VideoRecorderThread(QThread):
                 continue
             
             try:
-                # Conversion des données brutes (PBO) en image
+                # Données brutes (PBO) déjà retournées et en BGR par le GPU : simple vue numpy
                 frame = np.frombuffer(data, dtype=np.uint8).reshape(self.height, self.width, 3)
-                frame = cv2.flip(frame, 0) # OpenGL est inversé verticalement
-                frame = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
                 recorder.write(frame)
             except Exception as e:
                 print(f"❌ Erreur enregistrement frame: {e}")
@@ -536,6 +532,7 @@ class ShaderPreviewWidget(QOpenGLWidget):
         glVertexAttribPointer(0, 2, GL_FLOAT, GL_FALSE, 0, None)
         glBindVertexArray(0)
         
+        self.params_buffer = ParamsUniformBuffer()
         self.update_shader()
         self.timer.start(16) # ~60 FPS
         
@@ -835,6 +832,8 @@ class ShaderPreviewWidget(QOpenGLWidget):
                 self.makeCurrent()
                 glDeleteBuffers(len(self.pbo_ids), self.pbo_ids)
                 self.pbo_ids = []
+                glDeleteFramebuffers(1, [self.recording_fbo])
+                glDeleteTextures(1, [self.recording_tex])
                 self.doneCurrent()
             return False # Stopped
         elif output_path:
@@ -858,6 +857,15 @@ class ShaderPreviewWidget(QOpenGLWidget):
                 glBindBuffer(GL_PIXEL_PACK_BUFFER, pbo)
                 glBufferData(GL_PIXEL_PACK_BUFFER, size, None, GL_STREAM_READ)
             glBindBuffer(GL_PIXEL_PACK_BUFFER, 0)
+            
+            # FBO de capture : copie retournée de l'image (le retournement se fait sur le GPU)
+            self.recording_fbo = glGenFramebuffers(1)
+            self.recording_tex = glGenTextures(1)
+            glBindTexture(GL_TEXTURE_2D, self.recording_tex)
+            glTexImage2D(GL_TEXTURE_2D, 0, GL_RGB, w, h, 0, GL_RGB, GL_UNSIGNED_BYTE, None)
+            glBindFramebuffer(GL_FRAMEBUFFER, self.recording_fbo)
+            glFramebufferTexture2D(GL_FRAMEBUFFER, GL_COLOR_ATTACHMENT0, GL_TEXTURE_2D, self.recording_tex, 0)
+            glBindFramebuffer(GL_FRAMEBUFFER, self.defaultFramebufferObject())
             self.doneCurrent()
             
             self.recording_thread = VideoRecorderThread(output_path, w, h, 60.0)
@@ -898,6 +906,7 @@ class ShaderPreviewWidget(QOpenGLWidget):
             fs = compileShader(shader_code, GL_FRAGMENT_SHADER)
             
             new_program = compileProgram(vs, fs)
+            ParamsUniformBuffer.bind_program(new_program)
             
             old_program = self.program
             self.program = new_program
@@ -1036,12 +1045,15 @@ class ShaderPreviewWidget(QOpenGLWidget):
                 'presence': features.presence,
                 'brilliance': features.brilliance,
                 'beat_strength': features.beat_strength,
+                'beat_phase': features.beat_phase,
+                'bar_phase': features.bar_phase,
                 'intensity': features.intensity,
                 'spectral_centroid': features.spectral_centroid / 22050.0, # Normalize
                 'spectral_flux': min(features.spectral_flux / 10.0, 1.0), # Normalize
                 'glitch_intensity_feature': features.glitch_intensity,
                 'is_chorus': 1.0 if features.segment_type == 'chorus' else 0.0
             }
+            audio_features.update(features.stems)
         elif self.analyzer:
             # Fallback (lent) si pas de données poussées
             current_time = self.playback_time
@@ -1055,18 +1067,23 @@ class ShaderPreviewWidget(QOpenGLWidget):
                 'presence': features.presence,
                 'brilliance': features.brilliance,
                 'beat_strength': features.beat_strength,
+                'beat_phase': features.beat_phase,
+                'bar_phase': features.bar_phase,
                 'intensity': features.intensity,
                 'spectral_centroid': features.spectral_centroid / 22050.0, # Normalize
                 'spectral_flux': min(features.spectral_flux / 10.0, 1.0), # Normalize
                 'glitch_intensity_feature': features.glitch_intensity,
                 'is_chorus': 1.0 if features.segment_type == 'chorus' else 0.0
             }
+            audio_features.update(features.stems)
         else:
             # Fallback to simulation if no audio is analyzed
             current_time = time.time() - self.start_time
             beat = max(0.0, np.sin(current_time * (120.0/60.0) * np.pi) * 0.5 + 0.5) # Assuming 120 BPM
+            beats = current_time * (120.0/60.0)
             audio_features = {
                 'sub_bass': beat, 'bass': beat, 'beat_strength': beat,
+                'beat_phase': beats % 1.0, 'bar_phase': (beats % 4.0) / 4.0,
                 'low_mid': 0.3, 'mid': 0.3, 'high_mid': 0.2, 'presence': 0.1, 'brilliance': 0.1,
                 'intensity': 0.5, 'spectral_centroid': 0.2, 'spectral_flux': 0.0,
                 'glitch_intensity_feature': 0.0, 'is_chorus': 0.0
@@ -1112,8 +1129,10 @@ class ShaderPreviewWidget(QOpenGLWidget):
         except Exception:
             return
         
+        # Uniforms float : bloc std140 envoyé d'un seul glBufferSubData avant le rendu
+        block_values = {}
         glUniform2f(glGetUniformLocation(self.program, 'resolution'), float(w), float(h))
-        glUniform1f(glGetUniformLocation(self.program, 'time'), current_time)
+        block_values['time'] = current_time
 
         # iMouse uniform (Shadertoy style: xy = current, zw = click)
         mx = self.mouse_pos.x() * self.devicePixelRatio()
@@ -1148,14 +1167,14 @@ class ShaderPreviewWidget(QOpenGLWidget):
             glActiveTexture(GL_TEXTURE1)
             glBindTexture(GL_TEXTURE_2D, self.user_texture_id)
             glUniform1i(glGetUniformLocation(self.program, 'userTexture'), 1)
-            glUniform1f(glGetUniformLocation(self.program, 'hasUserTexture'), 1.0)
-            glUniform1f(glGetUniformLocation(self.program, 'distortUserTexture'), 1.0 if self.distort_user_texture else 0.0)
+            block_values['hasUserTexture'] = 1.0
+            block_values['distortUserTexture'] = 1.0 if self.distort_user_texture else 0.0
             
             mode_map = {"Mix": 0, "Add": 1, "Multiply": 2, "Screen": 3}
             mode_int = mode_map.get(self.texture_blend_mode, 0)
             glUniform1i(glGetUniformLocation(self.program, 'userTextureBlendMode'), mode_int)
         else:
-            glUniform1f(glGetUniformLocation(self.program, 'hasUserTexture'), 0.0)
+            block_values['hasUserTexture'] = 0.0
         
         # Mask Texture (iChannel2)
         if has_mask:
@@ -1164,73 +1183,81 @@ class ShaderPreviewWidget(QOpenGLWidget):
             glUniform1i(glGetUniformLocation(self.program, "maskTexture"), 2)
 
         # Envoi des features
-        glUniform1f(glGetUniformLocation(self.program, 'sub_bass'), audio_features.get('sub_bass', 0.0))
-        glUniform1f(glGetUniformLocation(self.program, 'bass'), audio_features.get('bass', 0.0))
-        glUniform1f(glGetUniformLocation(self.program, 'low_mid'), audio_features.get('low_mid', 0.0))
-        glUniform1f(glGetUniformLocation(self.program, 'beat_strength'), audio_features.get('beat_strength', 0.0))
-        glUniform1f(glGetUniformLocation(self.program, 'mid'), audio_features.get('mid', 0.0))
-        glUniform1f(glGetUniformLocation(self.program, 'high_mid'), audio_features.get('high_mid', 0.0))
-        glUniform1f(glGetUniformLocation(self.program, 'presence'), audio_features.get('presence', 0.0))
-        glUniform1f(glGetUniformLocation(self.program, 'brilliance'), audio_features.get('brilliance', 0.0))
-        glUniform1f(glGetUniformLocation(self.program, 'intensity'), audio_features.get('intensity', 0.0))
-        glUniform1f(glGetUniformLocation(self.program, 'spectral_centroid'), audio_features.get('spectral_centroid', 0.0))
-        glUniform1f(glGetUniformLocation(self.program, 'spectral_flux'), audio_features.get('spectral_flux', 0.0))
-        glUniform1f(glGetUniformLocation(self.program, 'is_chorus'), audio_features.get('is_chorus', 0.0))
+        block_values['sub_bass'] = audio_features.get('sub_bass', 0.0)
+        block_values['bass'] = audio_features.get('bass', 0.0)
+        block_values['low_mid'] = audio_features.get('low_mid', 0.0)
+        block_values['beat_strength'] = audio_features.get('beat_strength', 0.0)
+        block_values['beat_phase'] = audio_features.get('beat_phase', 0.0)
+        block_values['bar_phase'] = audio_features.get('bar_phase', 0.0)
+        block_values['mid'] = audio_features.get('mid', 0.0)
+        block_values['high_mid'] = audio_features.get('high_mid', 0.0)
+        block_values['presence'] = audio_features.get('presence', 0.0)
+        block_values['brilliance'] = audio_features.get('brilliance', 0.0)
+        block_values['intensity'] = audio_features.get('intensity', 0.0)
+        block_values['spectral_centroid'] = audio_features.get('spectral_centroid', 0.0)
+        block_values['spectral_flux'] = audio_features.get('spectral_flux', 0.0)
+        block_values['is_chorus'] = audio_features.get('is_chorus', 0.0)
+        # Canaux par stem ("drums.beat_strength" -> uniform drums_beat_strength)
+        for channel, value in audio_features.items():
+            if '.' in channel:
+                block_values[stem_uniform_name(channel)] = value
         
         # Envoi des paramètres modulés
-        glUniform1f(glGetUniformLocation(self.program, 'bloom_strength'), params['bloom_strength'])
-        glUniform1f(glGetUniformLocation(self.program, 'aberration_strength'), params['aberration_strength'])
-        glUniform1f(glGetUniformLocation(self.program, 'grain_strength'), params['grain_strength'])
-        glUniform1f(glGetUniformLocation(self.program, 'glitch_intensity'), params['glitch_strength'] + audio_features.get('glitch_intensity_feature', 0.0))
-        glUniform1f(glGetUniformLocation(self.program, 'vignette_strength'), params['vignette_strength'])
-        glUniform1f(glGetUniformLocation(self.program, 'scanline_strength'), params['scanline_strength'])
-        glUniform1f(glGetUniformLocation(self.program, 'contrast_strength'), params['contrast_strength'])
-        glUniform1f(glGetUniformLocation(self.program, 'saturation_strength'), params['saturation_strength'])
-        glUniform1f(glGetUniformLocation(self.program, 'brightness_strength'), params['brightness_strength'])
-        glUniform1f(glGetUniformLocation(self.program, 'gamma_strength'), params['gamma_strength'])
-        glUniform1f(glGetUniformLocation(self.program, 'exposure_strength'), params['exposure_strength'])
-        glUniform1f(glGetUniformLocation(self.program, 'strobe_strength'), params['strobe_strength'])
-        glUniform1f(glGetUniformLocation(self.program, 'light_leak_strength'), params['light_leak_strength'])
-        glUniform1f(glGetUniformLocation(self.program, 'mirror_strength'), params['mirror_strength'])
-        glUniform1f(glGetUniformLocation(self.program, 'pixelate_strength'), params['pixelate_strength'])
-        glUniform1f(glGetUniformLocation(self.program, 'posterize_strength'), params['posterize_strength'])
-        glUniform1f(glGetUniformLocation(self.program, 'solarize_strength'), params['solarize_strength'])
-        glUniform1f(glGetUniformLocation(self.program, 'hue_shift_strength'), params['hue_shift_strength'])
-        glUniform1f(glGetUniformLocation(self.program, 'invert_strength'), params['invert_strength'])
-        glUniform1f(glGetUniformLocation(self.program, 'sepia_strength'), params['sepia_strength'])
-        glUniform1f(glGetUniformLocation(self.program, 'thermal_strength'), params['thermal_strength'])
-        glUniform1f(glGetUniformLocation(self.program, 'edge_strength'), params['edge_strength'])
-        glUniform1f(glGetUniformLocation(self.program, 'fisheye_strength'), params['fisheye_strength'])
-        glUniform1f(glGetUniformLocation(self.program, 'twist_strength'), params['twist_strength'])
-        glUniform1f(glGetUniformLocation(self.program, 'ripple_strength'), params['ripple_strength'])
-        glUniform1f(glGetUniformLocation(self.program, 'mirror_quad_strength'), params['mirror_quad_strength'])
-        glUniform1f(glGetUniformLocation(self.program, 'rgb_split_strength'), params['rgb_split_strength'])
-        glUniform1f(glGetUniformLocation(self.program, 'bleach_strength'), params['bleach_strength'])
-        glUniform1f(glGetUniformLocation(self.program, 'vhs_strength'), params['vhs_strength'])
-        glUniform1f(glGetUniformLocation(self.program, 'neon_strength'), params['neon_strength'])
-        glUniform1f(glGetUniformLocation(self.program, 'cartoon_strength'), params['cartoon_strength'])
-        glUniform1f(glGetUniformLocation(self.program, 'sketch_strength'), params['sketch_strength'])
-        glUniform1f(glGetUniformLocation(self.program, 'vibrate_strength'), params['vibrate_strength'])
-        glUniform1f(glGetUniformLocation(self.program, 'drunk_strength'), params['drunk_strength'])
-        glUniform1f(glGetUniformLocation(self.program, 'pinch_strength'), params['pinch_strength'])
-        glUniform1f(glGetUniformLocation(self.program, 'zoom_blur_strength'), params['zoom_blur_strength'])
-        glUniform1f(glGetUniformLocation(self.program, 'aura_strength'), params['aura_strength'])
-        glUniform1f(glGetUniformLocation(self.program, 'psycho_strength'), params['psycho_strength'])
-        glUniform1f(glGetUniformLocation(self.program, 'hasMask'), 1.0 if has_mask else 0.0)
+        block_values['bloom_strength'] = params['bloom_strength']
+        block_values['aberration_strength'] = params['aberration_strength']
+        block_values['grain_strength'] = params['grain_strength']
+        block_values['glitch_intensity'] = params['glitch_strength'] + audio_features.get('glitch_intensity_feature', 0.0)
+        block_values['vignette_strength'] = params['vignette_strength']
+        block_values['scanline_strength'] = params['scanline_strength']
+        block_values['contrast_strength'] = params['contrast_strength']
+        block_values['saturation_strength'] = params['saturation_strength']
+        block_values['brightness_strength'] = params['brightness_strength']
+        block_values['gamma_strength'] = params['gamma_strength']
+        block_values['exposure_strength'] = params['exposure_strength']
+        block_values['strobe_strength'] = params['strobe_strength']
+        block_values['light_leak_strength'] = params['light_leak_strength']
+        block_values['mirror_strength'] = params['mirror_strength']
+        block_values['pixelate_strength'] = params['pixelate_strength']
+        block_values['posterize_strength'] = params['posterize_strength']
+        block_values['solarize_strength'] = params['solarize_strength']
+        block_values['hue_shift_strength'] = params['hue_shift_strength']
+        block_values['invert_strength'] = params['invert_strength']
+        block_values['sepia_strength'] = params['sepia_strength']
+        block_values['thermal_strength'] = params['thermal_strength']
+        block_values['edge_strength'] = params['edge_strength']
+        block_values['fisheye_strength'] = params['fisheye_strength']
+        block_values['twist_strength'] = params['twist_strength']
+        block_values['ripple_strength'] = params['ripple_strength']
+        block_values['mirror_quad_strength'] = params['mirror_quad_strength']
+        block_values['rgb_split_strength'] = params['rgb_split_strength']
+        block_values['bleach_strength'] = params['bleach_strength']
+        block_values['vhs_strength'] = params['vhs_strength']
+        block_values['neon_strength'] = params['neon_strength']
+        block_values['cartoon_strength'] = params['cartoon_strength']
+        block_values['sketch_strength'] = params['sketch_strength']
+        block_values['vibrate_strength'] = params['vibrate_strength']
+        block_values['drunk_strength'] = params['drunk_strength']
+        block_values['pinch_strength'] = params['pinch_strength']
+        block_values['zoom_blur_strength'] = params['zoom_blur_strength']
+        block_values['aura_strength'] = params['aura_strength']
+        block_values['psycho_strength'] = params['psycho_strength']
+        block_values['hasMask'] = 1.0 if has_mask else 0.0
         
         if use_feedback:
             glActiveTexture(GL_TEXTURE3)
             glBindTexture(GL_TEXTURE_2D, self.feedback_textures[self.feedback_index ^ 1])
             glUniform1i(glGetUniformLocation(self.program, "feedbackTexture"), 3)
-            glUniform1f(glGetUniformLocation(self.program, "hasFeedback"), 1.0)
-            glUniform1f(glGetUniformLocation(self.program, "feedback_decay"), self.feedback_decay)
+            block_values["hasFeedback"] = 1.0
+            block_values["feedback_decay"] = self.feedback_decay
         else:
-            glUniform1f(glGetUniformLocation(self.program, "hasFeedback"), 0.0)
+            block_values["hasFeedback"] = 0.0
         
         mode_map = {"Inside": 0, "Outside": 1}
         mask_mode_int = mode_map.get(self.mask_mode, 0)
         glUniform1i(glGetUniformLocation(self.program, "maskMode"), mask_mode_int)
         
+        self.params_buffer.upload(block_values)
+        
         glClearColor(0, 0, 0, 1)
         glClear(GL_COLOR_BUFFER_BIT)
         
@@ -1445,9 +1472,17 @@ class ShaderPreviewWidget(QOpenGLWidget):
             h = self.recording_height
             size = w * h * 3
             
-            # 1. Lire les pixels dans le PBO courant (Asynchrone, retourne immédiatement)
+            # 1. Blit à Y inversé vers le FBO de capture, puis lecture en BGR dans le PBO courant
+            #    (Asynchrone, retourne immédiatement) : ni cv2.flip ni cvtColor côté enregistreur
+            source = glGetIntegerv(GL_READ_FRAMEBUFFER_BINDING)
+            glBindFramebuffer(GL_DRAW_FRAMEBUFFER, self.recording_fbo)
+            glBlitFramebuffer(0, 0, w, h, 0, h, w, 0, GL_COLOR_BUFFER_BIT, GL_NEAREST)
+            glBindFramebuffer(GL_READ_FRAMEBUFFER, self.recording_fbo)
             glBindBuffer(GL_PIXEL_PACK_BUFFER, self.pbo_ids[self.pbo_index])
-            glReadPixels(0, 0, w, h, GL_RGB, GL_UNSIGNED_BYTE, 0)
+            glPixelStorei(GL_PACK_ALIGNMENT, 1)
+            glReadPixels(0, 0, w, h, GL_BGR, GL_UNSIGNED_BYTE, 0)
+            glPixelStorei(GL_PACK_ALIGNMENT, 4)
+            glBindFramebuffer(GL_FRAMEBUFFER, source)
             
             # 2. Récupérer les données du PBO précédent (Déjà prêt, pas de blocage GPU)
             if self.recording_frame_count > 0:
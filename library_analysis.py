@@ -0,0 +1,156 @@
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from analysis_cache import configure_analysis_cache, get_analysis_cache
+from audio_analysis import AdvancedAudioAnalyzer, MusicStyleClassifier
+
+# Pré-analyse d'une bibliothèque : remplit le cache central et écrit un index (durée, tempo, style, profil)
+# pour que le GUI, les rendus batch et la playlist démarrent avec des analyses déjà prêtes.
+AUDIO_EXTENSIONS = ('.mp3', '.wav', '.flac', '.ogg', '.m4a', '.aiff', '.aif')
+INDEX_FILENAME = "library_index.json"
+
+
+def find_audio_files(folder, recursive=True):
+    """Liste triée des fichiers audio du dossier (sous-dossiers inclus si recursive)."""
+    found = []
+    for dirpath, dirnames, filenames in os.walk(folder):
+        dirnames.sort()
+        found.extend(os.path.join(dirpath, name) for name in sorted(filenames)
+                     if name.lower().endswith(AUDIO_EXTENSIONS))
+        if not recursive:
+            break
+    return found
+
+
+def default_index_path():
+    """L'index vit à côté du cache central : la bibliothèque peut être en lecture seule."""
+    return os.path.join(get_analysis_cache().root, INDEX_FILENAME)
+
+
+def load_library_index(index_path=None):
+    """Index {chemin absolu: entrée} ou {} s'il n'existe pas encore."""
+    index_path = index_path or default_index_path()
+    try:
+        with open(index_path, 'r', encoding='utf-8') as f:
+            return json.load(f).get("tracks", {})
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_index(index_path, tracks):
+    os.makedirs(os.path.dirname(os.path.abspath(index_path)), exist_ok=True)
+    tmp_path = f"{index_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({"updated": time.time(), "tracks": tracks}, f, indent=2)
+    os.replace(tmp_path, index_path)
+
+
+def analyze_track(audio_path, audio_preset="Flat", hop_length=512, cache_root=None, cache_max_bytes=None):
+    """Analyse (ou relit depuis le cache) un morceau et retourne son entrée d'index.
+
+    Exécutée dans un processus worker : les étapes internes de l'analyseur restent séquentielles
+    pour ne pas multiplier les threads par le nombre de processus.
+    """
+    if cache_root is not None or cache_max_bytes is not None:
+        configure_analysis_cache(cache_root, cache_max_bytes)
+    start = time.perf_counter()
+    try:
+        # Pas de PCM conservé : toute une bibliothèque évincerait les pistes réellement ouvertes
+        analyzer = AdvancedAudioAnalyzer(audio_path, hop_length=hop_length, audio_preset=audio_preset,
+                                         logger=lambda msg: None, workers=1, use_pcm_store=False)
+        style, profile = MusicStyleClassifier.classify(analyzer)
+        return {
+            "path": audio_path,
+            "duration": float(analyzer.duration),
+            "tempo": float(analyzer.tempo),
+            "style": style,
+            "profile": profile,
+            "audio_preset": audio_preset,
+            "cached": bool(analyzer.loaded_from_cache),
+            "seconds": time.perf_counter() - start,
+        }
+    except Exception as e:
+        return {"path": audio_path, "error": f"{type(e).__name__}: {e}", "seconds": time.perf_counter() - start}
+
+
+def pre_analyze_library(folder, processes=None, audio_preset="Flat", hop_length=512, index_path=None,
+                        recursive=True, logger=print):
+    """Analyse tous les fichiers audio de folder sur un pool de processus et met à jour l'index.
+
+    processes=1 analyse dans le processus courant. Retourne les entrées produites par ce passage.
+    """
+    files = [os.path.abspath(p) for p in find_audio_files(folder, recursive)]
+    if not files:
+        logger(f"⚠️ Aucun fichier audio dans {folder}")
+        return []
+
+    cache = get_analysis_cache()
+    index_path = index_path or default_index_path()
+    processes = min(processes or os.cpu_count() or 1, len(files))
+    logger(f"📚 Pré-analyse de {len(files)} fichiers ({processes} processus)...")
+
+    job_args = (audio_preset, hop_length, cache.root, cache.max_bytes)
+    entries = []
+
+    def report(entry):
+        entries.append(entry)
+        name = os.path.basename(entry["path"])
+        if "error" in entry:
+            logger(f"[{len(entries)}/{len(files)}] ❌ {name}: {entry['error']}")
+        else:
+            source = "cache" if entry["cached"] else f"{entry['seconds']:.1f}s"
+            logger(f"[{len(entries)}/{len(files)}] 🎵 {name} — {entry['tempo']:.1f} BPM, {entry['style']} ({source})")
+
+    start = time.perf_counter()
+    if processes <= 1:
+        for path in files:
+            report(analyze_track(path, *job_args))
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            futures = [pool.submit(analyze_track, path, *job_args) for path in files]
+            for future in as_completed(futures):
+                report(future.result())
+
+    # Fusion avec l'index existant (les autres dossiers déjà analysés sont conservés)
+    tracks = load_library_index(index_path)
+    tracks.update({entry["path"]: entry for entry in entries if "error" not in entry})
+    _write_index(index_path, tracks)
+
+    failed = sum(1 for entry in entries if "error" in entry)
+    cached = sum(1 for entry in entries if entry.get("cached"))
+    logger(f"✅ Pré-analyse terminée en {time.perf_counter() - start:.1f}s : "
+           f"{len(entries) - failed - cached} analysés, {cached} déjà en cache, {failed} erreurs")
+    logger(f"🗂️ Index: {index_path}")
+    return entries
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pré-analyse d'une bibliothèque audio (remplit le cache d'analyse).")
+    parser.add_argument("folder", help="Dossier contenant les fichiers audio")
+    parser.add_argument("-j", "--processes", type=int, default=None, help="Nombre de processus (défaut: nombre de coeurs)")
+    parser.add_argument("--preset", default="Flat", help="Preset audio utilisé pour l'analyse (Flat, Bass Boost, Vocal Boost)")
+    parser.add_argument("--hop-length", type=int, default=512)
+    parser.add_argument("--index", default=None, help="Chemin de l'index JSON (défaut: dans le dossier du cache)")
+    parser.add_argument("--cache-dir", default=None, help="Dossier du cache d'analyse")
+    parser.add_argument("--cache-max-mb", type=float, default=None, help="Taille maximale du cache (Mo)")
+    parser.add_argument("--no-recursive", action="store_true", help="Ne pas parcourir les sous-dossiers")
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.folder):
+        print(f"Erreur: dossier introuvable - {args.folder}", file=sys.stderr)
+        return 1
+    if args.cache_dir or args.cache_max_mb:
+        configure_analysis_cache(args.cache_dir, args.cache_max_mb * 1024 * 1024 if args.cache_max_mb else None)
+
+    entries = pre_analyze_library(args.folder, processes=args.processes, audio_preset=args.preset,
+                                  hop_length=args.hop_length, index_path=args.index,
+                                  recursive=not args.no_recursive)
+    return 1 if any("error" in entry for entry in entries) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,28 +4,98 @@ from OpenGL.GL import *
 from OpenGL.GL.shaders import compileProgram, compileShader
 import numpy as np
 import ctypes
+import threading
+from collections import deque
+from shader_generator import ProceduralShaderGenerator, ParamsBlock
+
+
+class ParamsUniformBuffer:
+    """UBO du bloc std140 des uniforms float (cf. ParamsBlock) : un seul glBufferSubData par frame"""
+
+    def __init__(self):
+        self.block = ParamsBlock()
+        self.ubo = glGenBuffers(1)
+        glBindBuffer(GL_UNIFORM_BUFFER, self.ubo)
+        glBufferData(GL_UNIFORM_BUFFER, self.block.data.nbytes, None, GL_DYNAMIC_DRAW)
+        glBindBuffer(GL_UNIFORM_BUFFER, 0)
+
+    @staticmethod
+    def bind_program(program):
+        """Relie le bloc du programme au point de liaison commun (le GLSL 330 n'a pas layout(binding))"""
+        index = glGetUniformBlockIndex(program, ProceduralShaderGenerator.PARAMS_BLOCK_NAME)
+        if index != GL_INVALID_INDEX:
+            glUniformBlockBinding(program, index, ProceduralShaderGenerator.PARAMS_BLOCK_BINDING)
+
+    def upload(self, uniforms):
+        """Envoie les champs du bloc ; retourne les uniforms restants (vecteurs, entiers, samplers)"""
+        others = self.block.update(uniforms)
+        data = self.block.data
+        glBindBufferBase(GL_UNIFORM_BUFFER, ProceduralShaderGenerator.PARAMS_BLOCK_BINDING, self.ubo)
+        glBufferSubData(GL_UNIFORM_BUFFER, 0, data.nbytes, data)
+        return others
+
 
 class OpenGLRenderer:
+    # Setter par type GL des uniforms hors bloc
+    _UNIFORM_SETTERS = {
+        GL_FLOAT: glUniform1f,
+        GL_INT: glUniform1i,
+        GL_SAMPLER_2D: glUniform1i,
+        GL_FLOAT_VEC2: lambda loc, value: glUniform2f(loc, *value),
+        GL_FLOAT_VEC4: lambda loc, value: glUniform4f(loc, *value),
+    }
+
     def __init__(self, width, height, window_w=400, window_h=400):
         self.width = width
         self.height = height
         self.window_w = window_w
         self.window_h = window_h
         self.program_cache = {}
+        # Uniforms actifs hors bloc par programme : {nom: (location, setter)}, relevés à l'édition de liens
+        self.uniform_locations = {}
         self.spout_sender = None
         self.pbo_enabled = True
+        self.pbo_depth = 3
+        # PBO en plus de l'anneau : frames zero-copy tenues en aval en même temps (cf. set_pbo_enabled)
+        self.pbo_held = 0
         
         self.pbo_ids = None
-        self.pbo_index = 0
+        self.free_pbos = deque()
+        # Lectures lancées mais pas encore récupérées : (numéro de frame, PBO, fence), plus ancienne en tête
+        self.pending_reads = deque()
+        self.next_frame_num = 0
+        # PBO laissés mappés pour des vues zero-copy : {pbo: (frame_num, Event)}, plus ancien en tête,
+        # Event levé par release_frame
+        self.mapped_pbos = {}
+        self.held_frames = {}
+        # Image lue : retournée (haut en premier) et en BGR (OpenCV) ou RGB (ffmpeg), préparée sur le GPU
+        self.output_flip = True
+        self.output_bgr = False
         
         self._init_pygame()
         self._setup_quad()
         self._setup_fbo()
+        self._setup_output_fbo()
         self._setup_blit_shader()
+        self.params_buffer = ParamsUniformBuffer()
         self._init_spout()
 
-    def set_pbo_enabled(self, enabled):
+    def set_pbo_enabled(self, enabled, depth=None, held=None):
+        """depth : lectures en vol avant qu'une lecture bloque.
+        held : frames zero-copy que l'aval peut tenir en même temps (files d'un FramePipeline...) ;
+        autant de PBO en réserve, pour que le thread GL n'attende pas qu'une vue soit libérée.
+        """
         self.pbo_enabled = enabled
+        depth = max(1, int(depth)) if depth else self.pbo_depth
+        held = max(0, int(held)) if held is not None else self.pbo_held
+        if (depth, held) != (self.pbo_depth, self.pbo_held):
+            self.flush()
+            if self.pbo_ids is not None:
+                for pbo in list(self.mapped_pbos):
+                    self._unmap_pbo(pbo)
+                glDeleteBuffers(len(self.pbo_ids), self.pbo_ids)
+                self.pbo_ids = None
+            self.pbo_depth, self.pbo_held = depth, held
 
     def _init_pygame(self):
         pygame.init()
@@ -67,13 +137,50 @@ class OpenGLRenderer:
             
         glBindFramebuffer(GL_FRAMEBUFFER, 0)
 
+    def set_output_layout(self, flip=True, bgr=False):
+        """Disposition des pixels lus : flip = haut en premier, bgr = ordre OpenCV"""
+        self.output_flip = flip
+        self.output_bgr = bgr
+
+    def _setup_output_fbo(self):
+        """FBO de sortie : copie retournée du rendu, lue à la place du FBO principal"""
+        self.output_fbo = glGenFramebuffers(1)
+        glBindFramebuffer(GL_FRAMEBUFFER, self.output_fbo)
+        
+        self.output_texture = glGenTextures(1)
+        glBindTexture(GL_TEXTURE_2D, self.output_texture)
+        glTexImage2D(GL_TEXTURE_2D, 0, GL_RGB, self.width, self.height, 0, GL_RGB, GL_UNSIGNED_BYTE, None)
+        glFramebufferTexture2D(GL_FRAMEBUFFER, GL_COLOR_ATTACHMENT0, GL_TEXTURE_2D, self.output_texture, 0)
+        
+        if glCheckFramebufferStatus(GL_FRAMEBUFFER) != GL_FRAMEBUFFER_COMPLETE:
+            raise RuntimeError("Framebuffer de sortie incomplet!")
+            
+        glBindFramebuffer(GL_FRAMEBUFFER, 0)
+
+    def _bind_output_for_read(self):
+        """Lie le FBO à lire ; retourne le format GL des pixels (GL_BGR : permutation faite par le GPU)"""
+        if self.output_flip:
+            # Blit à Y inversé : le retournement se fait sur le GPU, pas de cv2.flip par frame
+            glBindFramebuffer(GL_READ_FRAMEBUFFER, self.fbo)
+            glBindFramebuffer(GL_DRAW_FRAMEBUFFER, self.output_fbo)
+            glBlitFramebuffer(0, 0, self.width, self.height, 0, self.height, self.width, 0, GL_COLOR_BUFFER_BIT, GL_NEAREST)
+            glBindFramebuffer(GL_FRAMEBUFFER, self.output_fbo)
+        else:
+            glBindFramebuffer(GL_FRAMEBUFFER, self.fbo)
+        return GL_BGR if self.output_bgr else GL_RGB
+
     def _setup_pbos(self):
-        """Initialise les Pixel Buffer Objects pour la lecture asynchrone"""
-        self.pbo_ids = glGenBuffers(2)
-        for pbo in self.pbo_ids:
+        """Initialise l'anneau de Pixel Buffer Objects pour la lecture asynchrone"""
+        self.pbo_ids = self._allocate_pbos(self.pbo_depth + self.pbo_held)
+        self.free_pbos = deque(self.pbo_ids)
+
+    def _allocate_pbos(self, count):
+        pbos = [int(pbo) for pbo in np.atleast_1d(glGenBuffers(count))]
+        for pbo in pbos:
             glBindBuffer(GL_PIXEL_PACK_BUFFER, pbo)
             glBufferData(GL_PIXEL_PACK_BUFFER, self.width * self.height * 3, None, GL_STREAM_READ)
         glBindBuffer(GL_PIXEL_PACK_BUFFER, 0)
+        return pbos
 
     def _init_spout(self):
         try:
@@ -107,36 +214,50 @@ class OpenGLRenderer:
             """, GL_FRAGMENT_SHADER)
         )
 
-    def get_program(self, shader_code, vertex_code):
-        if shader_code in self.program_cache:
-            return self.program_cache[shader_code]
+    def get_program(self, shader_code, vertex_code, key=None):
+        """Programme compilé, en cache par key (clé compacte du générateur) ou à défaut par le source"""
+        cache_key = shader_code if key is None else key
+        if cache_key in self.program_cache:
+            return self.program_cache[cache_key]
             
         try:
             vs = compileShader(vertex_code, GL_VERTEX_SHADER)
             fs = compileShader(shader_code, GL_FRAGMENT_SHADER)
             program = compileProgram(vs, fs)
-            self.program_cache[shader_code] = program
+            self._reflect_program(program)
+            self.program_cache[cache_key] = program
             return program
         except Exception as e:
             print(f"Erreur compilation shader: {e}")
             raise
 
+    def _reflect_program(self, program):
+        """Relève les uniforms actifs du programme et relie son bloc de paramètres"""
+        locations = {}
+        for i in range(glGetProgramiv(program, GL_ACTIVE_UNIFORMS)):
+            name, size, gl_type = glGetActiveUniform(program, i)
+            name = name.decode() if isinstance(name, bytes) else name
+            loc = glGetUniformLocation(program, name)
+            setter = self._UNIFORM_SETTERS.get(gl_type)
+            # Les membres du bloc n'ont pas de location (-1)
+            if loc != -1 and setter is not None:
+                locations[name] = (loc, setter)
+        ParamsUniformBuffer.bind_program(program)
+        self.uniform_locations[program] = locations
+        return locations
+
     def render_to_fbo(self, program, uniforms):
         glUseProgram(program)
         glBindFramebuffer(GL_FRAMEBUFFER, self.fbo)
         glViewport(0, 0, self.width, self.height)
         
-        for name, value in uniforms.items():
-            loc = glGetUniformLocation(program, name)
-            if loc != -1:
-                if isinstance(value, float):
-                    glUniform1f(loc, value)
-                elif isinstance(value, int):
-                    glUniform1i(loc, value)
-                elif isinstance(value, tuple) and len(value) == 2:
-                    glUniform2f(loc, *value)
-                elif isinstance(value, tuple) and len(value) == 4:
-                    glUniform4f(loc, *value)
+        locations = self.uniform_locations.get(program)
+        if locations is None:
+            locations = self._reflect_program(program)
+        for name, value in self.params_buffer.upload(uniforms).items():
+            entry = locations.get(name)
+            if entry is not None:
+                entry[1](entry[0], value)
         
         glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
         glBindVertexArray(self.vao)
@@ -155,46 +276,138 @@ class OpenGLRenderer:
         glBindVertexArray(self.vao)
         glDrawArrays(GL_TRIANGLE_STRIP, 0, 4)
 
-    def read_pixels(self):
-        """Lit les pixels du FBO. Utilise les PBOs si possible pour la performance."""
+    def read_pixels(self, frame_num=None, zero_copy=False):
+        """Lance la lecture du FBO et retourne les frames dont la lecture est terminée.
+        
+        Retourne une liste [(frame_num, pixels)] dans l'ordre de rendu, éventuellement vide : avec les
+        PBO, une frame ressort quand sa fence est passée, au plus pbo_depth frames plus tard.
+        flush() récupère les dernières. frame_num par défaut : compteur des frames lues.
+        Pixels disposés selon set_output_layout. zero_copy : pixels est une vue numpy (h, w, 3) en
+        lecture seule sur le PBO mappé, valable jusqu'à release_frame(frame_num) (depuis n'importe
+        quel thread) ; sinon une copie en bytes. Une vue tenue garde son PBO : au-delà des pbo_held
+        PBO de réserve, la lecture suivante attend la libération de la plus ancienne vue tenue.
+        """
+        if frame_num is None:
+            frame_num = self.next_frame_num
+        self.next_frame_num = frame_num + 1
+
         if not self.pbo_enabled:
             # Fallback to synchronous read
-            glBindFramebuffer(GL_FRAMEBUFFER, self.fbo)
+            pixel_format = self._bind_output_for_read()
             glPixelStorei(GL_PACK_ALIGNMENT, 1)
-            pixels = glReadPixels(0, 0, self.width, self.height, GL_RGB, GL_UNSIGNED_BYTE)
+            pixels = glReadPixels(0, 0, self.width, self.height, pixel_format, GL_UNSIGNED_BYTE)
             glPixelStorei(GL_PACK_ALIGNMENT, 4)
             glBindFramebuffer(GL_FRAMEBUFFER, 0)
-            return pixels
+            if zero_copy:
+                pixels = np.frombuffer(pixels, dtype=np.uint8).reshape(self.height, self.width, 3)
+            return [(frame_num, pixels)]
 
         if self.pbo_ids is None:
             self._setup_pbos()
 
-        glBindFramebuffer(GL_FRAMEBUFFER, self.fbo)
-        
-        # 1. Lancer la lecture asynchrone vers le PBO actuel
-        glBindBuffer(GL_PIXEL_PACK_BUFFER, self.pbo_ids[self.pbo_index])
-        glReadPixels(0, 0, self.width, self.height, GL_RGB, GL_UNSIGNED_BYTE, 0)
-        
-        # 2. Traiter les données du PBO précédent (Frame N-1)
-        next_index = (self.pbo_index + 1) % 2
-        glBindBuffer(GL_PIXEL_PACK_BUFFER, self.pbo_ids[next_index])
-        
+        ready = []
+        # Anneau plein : la lecture la plus ancienne doit se terminer avant d'en lancer une autre
+        if len(self.pending_reads) >= self.pbo_depth:
+            ready.append(self._finish_read(wait=True, zero_copy=zero_copy))
+
+        # 1. Lancer la lecture asynchrone vers un PBO libre, marquée par une fence
+        pbo = self._acquire_pbo(returning={num for num, _ in ready})
+        pixel_format = self._bind_output_for_read()
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, pbo)
+        glPixelStorei(GL_PACK_ALIGNMENT, 1)
+        glReadPixels(0, 0, self.width, self.height, pixel_format, GL_UNSIGNED_BYTE, 0)
+        glPixelStorei(GL_PACK_ALIGNMENT, 4)
+        fence = glFenceSync(GL_SYNC_GPU_COMMANDS_COMPLETE, 0)
+        self.pending_reads.append((frame_num, pbo, fence))
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, 0)
+        glBindFramebuffer(GL_FRAMEBUFFER, 0)
+
+        # 2. Récupérer sans attendre les lectures déjà terminées côté GPU
+        while self.pending_reads and self._fence_signaled(self.pending_reads[0][2]):
+            ready.append(self._finish_read(wait=False, zero_copy=zero_copy))
+        return ready
+
+    def flush(self, zero_copy=False):
+        """Attend et retourne toutes les lectures en cours [(frame_num, pixels)] (fin de rendu)"""
+        ready = []
+        while self.pending_reads:
+            ready.append(self._finish_read(wait=True, zero_copy=zero_copy))
+        return ready
+
+    def release_frame(self, frame_num):
+        """Libère la vue zero-copy d'une frame : son PBO pourra être démappé et réutilisé"""
+        released = self.held_frames.pop(frame_num, None)
+        if released is not None:
+            released.set()
+
+    def _acquire_pbo(self, returning=()):
+        """PBO libre pour la prochaine lecture (thread GL).
+
+        Les PBO dont la vue a été libérée sont recyclés ; sinon on attend la plus ancienne vue tenue
+        en aval. Jamais une vue que l'appel en cours va retourner (frames de returning) : son appelant
+        ne peut pas la libérer avant le retour, ce serait un interblocage. Faute de mieux, un PBO de
+        plus est alloué.
+        """
+        for pbo, (_, released) in list(self.mapped_pbos.items()):
+            if released.is_set():
+                self._unmap_pbo(pbo)
+        if not self.free_pbos:
+            for pbo, (frame_num, _) in list(self.mapped_pbos.items()):
+                if frame_num not in returning:
+                    self._unmap_pbo(pbo)
+                    break
+            else:
+                self.pbo_ids += self._allocate_pbos(1)
+                return self.pbo_ids[-1]
+        return self.free_pbos.popleft()
+
+    def _unmap_pbo(self, pbo):
+        """Attend que la vue zero-copy du PBO soit libérée, puis le démappe et le rend libre (thread GL)"""
+        _, released = self.mapped_pbos.pop(pbo)
+        released.wait()
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, pbo)
+        glUnmapBuffer(GL_PIXEL_PACK_BUFFER)
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, 0)
+        self.free_pbos.append(pbo)
+
+    @staticmethod
+    def _fence_signaled(fence):
+        return glClientWaitSync(fence, 0, 0) in (GL_ALREADY_SIGNALED, GL_CONDITION_SATISFIED)
+
+    def _finish_read(self, wait, zero_copy=False):
+        """Récupère le PBO de la lecture la plus ancienne ; wait : bloque jusqu'à sa fence"""
+        frame_num, pbo, fence = self.pending_reads.popleft()
+        if wait:
+            # Le premier appel pousse les commandes au GPU, sinon la fence pourrait ne jamais passer
+            while glClientWaitSync(fence, GL_SYNC_FLUSH_COMMANDS_BIT, 100_000_000) == GL_TIMEOUT_EXPIRED:
+                pass
+        glDeleteSync(fence)
+
+        size = self.width * self.height * 3
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, pbo)
         pixels = None
         ptr = glMapBuffer(GL_PIXEL_PACK_BUFFER, GL_READ_ONLY)
-        if ptr:
-            # Copie rapide mémoire à mémoire
-            pixels = ctypes.string_at(ptr, self.width * self.height * 3)
-            glUnmapBuffer(GL_PIXEL_PACK_BUFFER)
-        
+        if ptr and zero_copy:
+            # Vue directe sur la mémoire mappée : le PBO reste mappé jusqu'à release_frame
+            pixels = np.ctypeslib.as_array((ctypes.c_ubyte * size).from_address(ptr))
+            pixels = pixels.reshape(self.height, self.width, 3)
+            pixels.flags.writeable = False
+            released = threading.Event()
+            self.mapped_pbos[pbo] = (frame_num, released)
+            self.held_frames[frame_num] = released
+        else:
+            if ptr:
+                # Copie rapide mémoire à mémoire
+                pixels = ctypes.string_at(ptr, size)
+                glUnmapBuffer(GL_PIXEL_PACK_BUFFER)
+            self.free_pbos.append(pbo)
         glBindBuffer(GL_PIXEL_PACK_BUFFER, 0)
-        glBindFramebuffer(GL_FRAMEBUFFER, 0)
-        
-        self.pbo_index = next_index
         
-        # Si pixels est None (première frame), on retourne un buffer noir
         if pixels is None:
-            return b'\x00' * (self.width * self.height * 3)
-        return pixels
+            pixels = b'\x00' * size
+            if zero_copy:
+                pixels = np.frombuffer(pixels, dtype=np.uint8).reshape(self.height, self.width, 3)
+        return frame_num, pixels
 
     def cleanup(self):
         pygame.quit()
@@ -6,6 +6,7 @@ import cv2
 import ctypes
 from OpenGL.GL import *
 from OpenGL.GL.shaders import compileProgram, compileShader
+from audio_features import DISPLAY_BINS
 
 class OverlayManager:
     def __init__(self, width, height, font_name="Arial"):
@@ -24,9 +25,12 @@ class OverlayManager:
         self.subtitles = []
         self.current_subtitle_text = ""
         
+        # Historique du spectre en anneau : une colonne uint8 (spectre d'affichage log-fréquence, dB)
+        # est envoyée par image, le décalage de lecture est fait dans le shader
         self.spec_width = 512
-        self.spec_height = 256
-        self.spec_data = np.zeros((self.spec_height, self.spec_width), dtype=np.float32)
+        self.spec_height = DISPLAY_BINS
+        self.spec_data = np.zeros((self.spec_height, self.spec_width), dtype=np.uint8)
+        self.spec_column = 0
         self.spectrogram_enabled = False
 
     def _setup_text_shader(self):
@@ -99,6 +103,7 @@ class OverlayManager:
             out vec4 FragColor;
             uniform sampler2D specTex;
             uniform vec4 bgColor;
+            uniform float specOffset;
             
             vec3 heatmap(float v) {
                 vec3 c = vec3(v);
@@ -108,7 +113,7 @@ class OverlayManager:
             }
             
             void main() {
-                float val = texture(specTex, vTexCoord).r;
+                float val = texture(specTex, vec2(fract(vTexCoord.x + specOffset), vTexCoord.y)).r;
                 vec3 heatCol = heatmap(val);
                 vec4 fg = vec4(heatCol, 0.8 * val);
                 float outA = fg.a + bgColor.a * (1.0 - fg.a);
@@ -246,7 +251,11 @@ class OverlayManager:
         glBindTexture(GL_TEXTURE_2D, self.spec_texture)
         glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR)
         glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
-        glTexImage2D(GL_TEXTURE_2D, 0, GL_R32F, self.spec_width, self.spec_height, 0, GL_RED, GL_FLOAT, None)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_REPEAT)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_CLAMP_TO_EDGE)
+        self.spec_data[:] = 0
+        self.spec_column = 0
+        glTexImage2D(GL_TEXTURE_2D, 0, GL_R8, self.spec_width, self.spec_height, 0, GL_RED, GL_UNSIGNED_BYTE, self.spec_data)
         
         h_ndc = 0.35
         if position == "Haut":
@@ -272,6 +281,14 @@ class OverlayManager:
         glVertexAttribPointer(1, 2, GL_FLOAT, GL_FALSE, 4*4, ctypes.c_void_p(8))
         glBindVertexArray(0)
 
+    def _spectrum_column(self, spectrum):
+        """Colonne uint8 de spec_height valeurs : le spectre d'affichage est envoyé tel quel,
+        un spectre linéaire quelconque (magnitudes) est rééchantillonné en repli."""
+        if spectrum.dtype == np.uint8 and len(spectrum) == self.spec_height:
+            return np.ascontiguousarray(spectrum)
+        resized = cv2.resize(np.asarray(spectrum, dtype=np.float32).reshape(-1, 1), (1, self.spec_height), interpolation=cv2.INTER_LINEAR)
+        return (np.clip(resized.ravel(), 0.0, 1.0) * 255.0).astype(np.uint8)
+
     def render(self, time, effect_type, spectrum=None):
         glEnable(GL_BLEND)
         glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
@@ -358,12 +375,17 @@ class OverlayManager:
 
         # Spectrogram
         if self.spectrogram_enabled and spectrum is not None:
-            spec_resized = cv2.resize(spectrum.reshape(-1, 1), (1, self.spec_height), interpolation=cv2.INTER_LINEAR)
-            self.spec_data[:, :-1] = self.spec_data[:, 1:]
-            self.spec_data[:, -1] = spec_resized.flatten()
+            column = self._spectrum_column(spectrum)
+            col = self.spec_column
+            self.spec_data[:, col] = column
             glBindTexture(GL_TEXTURE_2D, self.spec_texture)
-            glTexSubImage2D(GL_TEXTURE_2D, 0, 0, 0, self.spec_width, self.spec_height, GL_RED, GL_FLOAT, self.spec_data)
+            glPixelStorei(GL_UNPACK_ALIGNMENT, 1)
+            glTexSubImage2D(GL_TEXTURE_2D, 0, col, 0, 1, self.spec_height, GL_RED, GL_UNSIGNED_BYTE, column)
+            glPixelStorei(GL_UNPACK_ALIGNMENT, 4)
+            self.spec_column = (col + 1) % self.spec_width
             glUseProgram(self.spec_shader)
+            # La colonne la plus récente s'affiche à droite
+            glUniform1f(glGetUniformLocation(self.spec_shader, "specOffset"), (col + 1) / self.spec_width)
             glUniform4f(glGetUniformLocation(self.spec_shader, "bgColor"), 
                         self.spec_bg_color[0]/255.0, self.spec_bg_color[1]/255.0, 
                         self.spec_bg_color[2]/255.0, self.spec_bg_color[3]/255.0)
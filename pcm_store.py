@@ -0,0 +1,98 @@
+import os
+import threading
+import numpy as np
+import librosa
+
+from analysis_cache import AnalysisCache, DEFAULT_CACHE_DIR
+
+# Magasin d'audio décodé : chaque fichier est décodé une seule fois (float32, fréquence et canaux
+# natifs) puis conservé dans le dossier du cache sous forme de fichier brut memory-mappé.
+# Preview, analyse et VST en tirent des vues rééchantillonnées / mono à la demande.
+DEFAULT_PCM_MAX_BYTES = int(float(os.environ.get("KYMATIX_PCM_CACHE_MB", 4096)) * 1024 * 1024)
+PCM_FORMAT_VERSION = 1
+
+
+class DecodedAudioStore(AnalysisCache):
+    """PCM décodé adressé par contenu, avec son propre budget LRU à côté des analyses."""
+
+    SUFFIX = ".pcm.bin"
+
+    def __init__(self, root=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_PCM_MAX_BYTES):
+        super().__init__(root, max_bytes)
+        # Un verrou par fichier : deux threads qui demandent le même audio ne le décodent qu'une fois
+        self._decode_locks = {}
+        self.decodes = 0
+
+    def _decode(self, audio_path):
+        y, sr = librosa.load(audio_path, sr=None, mono=False)
+        with self._lock:
+            self.decodes += 1
+        return np.atleast_2d(y).astype(np.float32, copy=False), int(sr)
+
+    def native(self, audio_path):
+        """Retourne (pcm, sr) : pcm de forme (canaux, échantillons), memory-mappé en lecture seule."""
+        try:
+            key = self.key(audio_path, {"pcm": PCM_FORMAT_VERSION})
+        except OSError:
+            # Fichier illisible pour le hash (chemin virtuel, flux...) : décodage direct, sans stockage
+            return self._decode(audio_path)
+
+        with self._lock:
+            decode_lock = self._decode_locks.setdefault(key, threading.Lock())
+        with decode_lock:
+            entry = self.load(key)
+            if entry is None:
+                pcm, sr = self._decode(audio_path)
+                try:
+                    self.store(key, {"sr": sr}, {"pcm": pcm})
+                except OSError:
+                    return pcm, sr
+                # L'entrée peut dépasser à elle seule le budget et avoir été évincée aussitôt
+                entry = self.load(key)
+                if entry is None:
+                    return pcm, sr
+        meta, arrays = entry
+        return arrays["pcm"], int(meta["sr"])
+
+    def get(self, audio_path, sr=None, mono=True, res_type='soxr_hq'):
+        """Vue à la demande, équivalente à librosa.load(audio_path, sr=sr, mono=mono, res_type=res_type).
+
+        Le résultat peut être un memmap en lecture seule (pas de conversion nécessaire) : le copier avant
+        de le modifier sur place.
+        """
+        pcm, native_sr = self.native(audio_path)
+        if mono:
+            y = np.mean(pcm, axis=0)
+        elif pcm.shape[0] == 1:
+            y = pcm[0]
+        else:
+            y = pcm
+        if sr is not None and sr != native_sr:
+            y = librosa.resample(y, orig_sr=native_sr, target_sr=sr, res_type=res_type)
+            return y, sr
+        return y, native_sr
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def get_pcm_store():
+    """Instance partagée par la preview, l'analyse et le rendu VST du processus."""
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = DecodedAudioStore()
+        return _default_store
+
+
+def configure_pcm_store(root=None, max_bytes=None):
+    """Change le dossier et/ou la taille maximale du magasin partagé."""
+    store = get_pcm_store()
+    with _default_store_lock:
+        if root is not None:
+            store.root = root
+        if max_bytes is not None:
+            store.max_bytes = int(max_bytes)
+    store.evict()
+    return store
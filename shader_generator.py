@@ -1,9 +1,12 @@
 from dataclasses import dataclass
 from typing import Dict, List, Optional
+import numpy as np
 import os
 import re
 import sys
 
+from audio_features import STEM_NAMES, STEM_CHANNELS, stem_uniform_name
+
 def mix(a, b, x):
     """Interpole linéairement entre a et b."""
     return a * (1.0 - x) + b * x
@@ -120,75 +123,95 @@ class ProceduralShaderGenerator:
     # Bloc commun des uniforms pour éviter la duplication
     UNIFORMS_BLOCK = """
         uniform vec2 resolution;
-        uniform float time;
         uniform sampler2D iChannel0;
         uniform sampler2D userTexture;
-        uniform float hasUserTexture;
-        uniform float distortUserTexture;
         uniform int userTextureBlendMode;
         uniform vec4 iMouse;
         uniform sampler2D maskTexture;
-        uniform float hasMask;
         uniform int maskMode;
-        uniform float sub_bass;
-        uniform float bass;
-        uniform float low_mid;
-        uniform float mid;
-        uniform float high_mid;
-        uniform float presence;
-        uniform float brilliance;
-        uniform float beat_strength;
-        uniform float intensity;
-        uniform float spectral_centroid;
-        uniform float spectral_flux;
-        uniform float glitch_intensity;
-        uniform float bloom_strength;
-        uniform float aberration_strength;
-        uniform float grain_strength;
-        uniform float vignette_strength;
-        uniform float scanline_strength;
-        uniform float contrast_strength;
-        uniform float saturation_strength;
-        uniform float brightness_strength;
-        uniform float gamma_strength;
-        uniform float exposure_strength;
-        uniform float strobe_strength;
-        uniform float light_leak_strength;
-        uniform float mirror_strength;
-        uniform float is_chorus;
-        uniform float pixelate_strength;
-        uniform float posterize_strength;
-        uniform float solarize_strength;
-        uniform float hue_shift_strength;
-        uniform float invert_strength;
-        uniform float sepia_strength;
-        uniform float thermal_strength;
-        uniform float edge_strength;
-        uniform float fisheye_strength;
-        uniform float twist_strength;
-        uniform float ripple_strength;
-        uniform float mirror_quad_strength;
-        uniform float rgb_split_strength;
-        uniform float bleach_strength;
-        uniform float vhs_strength;
-        uniform float neon_strength;
-        uniform float cartoon_strength;
-        uniform float sketch_strength;
-        uniform float vibrate_strength;
-        uniform float drunk_strength;
-        uniform float pinch_strength;
-        uniform float zoom_blur_strength;
-        uniform float aura_strength;
-        uniform float psycho_strength;
-        uniform float feedback_decay;
         uniform sampler2D feedbackTexture;
-        uniform float hasFeedback;
     """
 
+    # Uniforms float mis à jour à chaque frame (temps, audio, FX) : bloc std140 partagé, envoyé
+    # d'un seul glBufferSubData (cf. ParamsBlock). Les membres restent accessibles par leur nom en GLSL.
+    PARAMS_BLOCK_NAME = "KymatixParams"
+    PARAMS_BLOCK_BINDING = 0
+    PARAMS_BLOCK_FIELDS = (
+        "time",
+        "hasUserTexture",
+        "distortUserTexture",
+        "hasMask",
+        "sub_bass",
+        "bass",
+        "low_mid",
+        "mid",
+        "high_mid",
+        "presence",
+        "brilliance",
+        "beat_strength",
+        "beat_phase",
+        "bar_phase",
+        "transition_progress",
+        "intensity",
+        "spectral_centroid",
+        "spectral_flux",
+        "glitch_intensity",
+        "bloom_strength",
+        "aberration_strength",
+        "grain_strength",
+        "vignette_strength",
+        "scanline_strength",
+        "contrast_strength",
+        "saturation_strength",
+        "brightness_strength",
+        "gamma_strength",
+        "exposure_strength",
+        "strobe_strength",
+        "light_leak_strength",
+        "mirror_strength",
+        "is_chorus",
+        "pixelate_strength",
+        "posterize_strength",
+        "solarize_strength",
+        "hue_shift_strength",
+        "invert_strength",
+        "sepia_strength",
+        "thermal_strength",
+        "edge_strength",
+        "fisheye_strength",
+        "twist_strength",
+        "ripple_strength",
+        "mirror_quad_strength",
+        "rgb_split_strength",
+        "bleach_strength",
+        "vhs_strength",
+        "neon_strength",
+        "cartoon_strength",
+        "sketch_strength",
+        "vibrate_strength",
+        "drunk_strength",
+        "pinch_strength",
+        "zoom_blur_strength",
+        "aura_strength",
+        "psycho_strength",
+        "feedback_decay",
+        "hasFeedback",
+    )
+    # Canaux des stems usuels ("drums_beat_strength", ...) : 0 si le morceau est analysé sans stems
+    PARAMS_BLOCK_FIELDS += tuple(stem_uniform_name(f'{stem}.{feature}') for stem in STEM_NAMES for feature in STEM_CHANNELS)
+    UNIFORMS_BLOCK += f"    layout(std140) uniform {PARAMS_BLOCK_NAME} {{\n"
+    UNIFORMS_BLOCK += "".join(f"            float {name};\n" for name in PARAMS_BLOCK_FIELDS)
+    UNIFORMS_BLOCK += "        };\n"
+
     # Stockage des styles (Built-in + Externes)
     _styles_db: Dict[str, StyleConfig] = {}
     _initialized = False
 
+    # Version des gabarits GLSL : fait partie de la clé des shaders mémorisés
+    GENERATOR_VERSION = 3
+    # Shaders déjà générés, par clé compacte (cf. shader_key)
+    _shader_cache: Dict[tuple, str] = {}
+
     @staticmethod
     def get_glsl_dir():
         """Retourne le chemin absolu du dossier glsl (compatible PyInstaller/Dev)"""
@@ -284,11 +307,44 @@ class ProceduralShaderGenerator:
         """Force le rechargement complet des styles depuis le disque"""
         cls._initialized = False
         cls._styles_db.clear()
+        cls._shader_cache.clear()
         cls.initialize()
 
+    @staticmethod
+    def shader_key(style: str, style2: Optional[str] = None, transition_progress: float = 0.0, vr_mode: bool = False, custom_pipeline: Optional[str] = None) -> tuple:
+        """Clé compacte d'un shader généré : tout ce dont dépend le GLSL, et rien d'autre.
+        
+        Pendant une transition, la progression est un uniform (transition_progress) : seule la moitié
+        compte (caméra, éclairage et post du style 2 au-delà de 50%), soit au plus deux programmes
+        par paire de styles. La clé garde une progression représentative de chaque moitié.
+        Le pipeline custom est gardé par référence : son hash de chaîne est calculé une fois par Python.
+        """
+        if not style2 or transition_progress <= 0.0:
+            style2, transition_progress = None, 0.0
+        elif transition_progress >= 1.0:
+            transition_progress = 1.0
+        else:
+            transition_progress = 0.25 if transition_progress <= 0.5 else 0.75
+        return (ProceduralShaderGenerator.GENERATOR_VERSION, style, style2, transition_progress, bool(vr_mode), custom_pipeline)
+
     @staticmethod
     def generate_shader(style: str, features_profile: Dict, style2: Optional[str] = None, transition_progress: float = 0.0, vr_mode: bool = False, custom_pipeline: Optional[str] = None) -> str:
-        """Génère un shader basé sur le style musical détecté, avec morphing optionnel."""
+        """Génère un shader basé sur le style musical détecté, avec morphing optionnel.
+        
+        Le résultat est mémorisé par shader_key : en régime établi, un appel par frame ne coûte qu'une
+        recherche dans un dict (le profil audio n'intervient pas dans le GLSL).
+        """
+        key = ProceduralShaderGenerator.shader_key(style, style2, transition_progress, vr_mode, custom_pipeline)
+        shader_code = ProceduralShaderGenerator._shader_cache.get(key)
+        if shader_code is None:
+            # Généré depuis la clé (progression représentative) : le GLSL est une fonction exacte de la clé
+            shader_code = ProceduralShaderGenerator._build_shader(*key[1:])
+            ProceduralShaderGenerator._shader_cache[key] = shader_code
+        return shader_code
+
+    @staticmethod
+    def _build_shader(style: str, style2: Optional[str], transition_progress: float, vr_mode: bool, custom_pipeline: Optional[str]) -> str:
+        """Assemble le GLSL complet (coûteux : plusieurs Ko de chaînes formatées)"""
         
         if not ProceduralShaderGenerator._initialized:
             ProceduralShaderGenerator.initialize()
@@ -564,14 +620,14 @@ class ProceduralShaderGenerator:
             float scene(vec3 p) {{
                 float d1 = scene1(p);
                 float d2 = scene2(p);
-                return mix(d1, d2, {transition_progress:.4f});
+                return mix(d1, d2, transition_progress);
             }}
             """
 
-            # 2. Mixer les autres paramètres
-            max_iterations = int(mix(config1.max_iter, config2.max_iter, transition_progress))
-            max_distance = mix(config1.max_dist, config2.max_dist, transition_progress)
-            step_size = mix(config1.step_size, config2.step_size, transition_progress)
+            # 2. Mixer les autres paramètres côté GPU : la progression change à chaque frame sans recompiler
+            max_iterations = f"int(mix({float(config1.max_iter):.1f}, {float(config2.max_iter):.1f}, transition_progress))"
+            max_distance = f"mix({float(config1.max_dist):.4f}, {float(config2.max_dist):.4f}, transition_progress)"
+            step_size = f"mix({float(config1.step_size):.4f}, {float(config2.step_size):.4f}, transition_progress)"
 
             # 3. Pour les blocs de code (camera, lighting, post), on utilise ceux du style 2 si la transition a dépassé 50%.
             # active_config est déjà défini plus haut
@@ -955,4 +1011,27 @@ class ProceduralShaderGenerator:
             custom_pipeline_code=custom_code
         )
         
-        return shader
\ No newline at end of file
+        return shader
+
+
+class ParamsBlock:
+    """Contenu CPU du bloc std140 des uniforms float, prêt pour un glBufferSubData.
+    
+    En std140, des float consécutifs sont alignés sur 4 octets : le bloc est un tableau float32
+    dans l'ordre de PARAMS_BLOCK_FIELDS, arrondi à 16 octets. Un champ garde sa dernière valeur.
+    """
+
+    def __init__(self, fields=ProceduralShaderGenerator.PARAMS_BLOCK_FIELDS):
+        self.index = {name: i for i, name in enumerate(fields)}
+        self.data = np.zeros(-(-len(fields) // 4) * 4, dtype=np.float32)
+
+    def update(self, uniforms):
+        """Range les valeurs du bloc ; retourne les autres uniforms (vecteurs, entiers, samplers)"""
+        index, data, others = self.index, self.data, {}
+        for name, value in uniforms.items():
+            slot = index.get(name)
+            if slot is None:
+                others[name] = value
+            else:
+                data[slot] = value
+        return others
\ No newline at end of file
@@ -1,13 +1,32 @@
 import unittest
-from unittest.mock import patch
+from unittest.mock import MagicMock, patch
 import numpy as np
+import ctypes
+import importlib
 import os
+import re
+import subprocess
 import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import types
+import librosa
+import soundfile as sf
 
 # Ensure we can import the module from the current directory
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from audio_analysis import AdvancedAudioAnalyzer, AdvancedAudioFeatures
+from analysis_cache import AnalysisCache, configure_analysis_cache, get_analysis_cache, write_analysis_cache
+from feature_timeline import FeatureTimeline
+from ffmpeg_handler import FFmpegHandler, FFmpegVideoSink
+from frame_pipeline import FramePipeline
+from shader_generator import ProceduralShaderGenerator, ParamsBlock
+from library_analysis import pre_analyze_library, load_library_index
+from pcm_store import DecodedAudioStore, configure_pcm_store, get_pcm_store
+from waveform_peaks import PeakPyramid, zigzag_points
+from audio_analysis import AdvancedAudioAnalyzer, CoarseAudioAnalyzer, MusicStyleClassifier, AdvancedAudioFeatures, FREQUENCY_BANDS, AnalysisStage, run_stage_graph, RealTimeAudioAnalyzer, StreamingBeatTracker, AudioRingBuffer, BeatGrid, estimate_downbeat_offset, STEM_CHANNELS, stem_uniform_name, DISPLAY_BINS, DISPLAY_FMIN, DISPLAY_FMAX, DISPLAY_DB_RANGE
 
 class TestAdvancedAudioAnalyzer(unittest.TestCase):
     def setUp(self):
@@ -25,6 +44,13 @@ class TestAdvancedAudioAnalyzer(unittest.TestCase):
         self.y = self.y.astype(np.float32)
         self.dummy_path = "test_audio.mp3"
 
+        # Keep decoded PCM out of the user's cache directory
+        pcm_tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(pcm_tmp.cleanup)
+        store = get_pcm_store()
+        self.addCleanup(configure_pcm_store, store.root, store.max_bytes)
+        configure_pcm_store(pcm_tmp.name)
+
     @patch('librosa.load')
     def test_initialization(self, mock_load):
         """Test if the analyzer initializes and computes features correctly."""
@@ -64,11 +90,75 @@ class TestAdvancedAudioAnalyzer(unittest.TestCase):
         self.assertTrue(hasattr(features, 'beat_strength'))
         self.assertTrue(hasattr(features, 'segment_type'))
 
+    @patch('librosa.load')
+    def test_shared_spectrogram_matches_direct_features(self, mock_load):
+        """Features derived from the shared STFT/Mel front-end must match librosa's own computation from y."""
+        mock_load.return_value = (self.y, self.sr)
+        analyzer = AdvancedAudioAnalyzer(self.dummy_path, logger=lambda x: None)
+
+        onset_env = librosa.onset.onset_strength(y=self.y, sr=self.sr, hop_length=512)
+        rolloff = librosa.feature.spectral_rolloff(y=self.y, sr=self.sr, hop_length=512, roll_percent=0.85)[0]
+        chroma = librosa.feature.chroma_stft(y=self.y, sr=self.sr, hop_length=512)
+        np.testing.assert_allclose(analyzer.onset_env, onset_env, rtol=1e-4, atol=1e-5)
+        np.testing.assert_allclose(analyzer.spectral_rolloff, rolloff, rtol=1e-4)
+        np.testing.assert_allclose(analyzer.chroma, chroma, rtol=1e-4, atol=1e-5)
+
+    @patch('librosa.load')
+    def test_feature_table_matches_per_frame_computation(self, mock_load):
+        """The precomputed table must give the same values as a direct per-frame computation."""
+        mock_load.return_value = (self.y, self.sr)
+        analyzer = AdvancedAudioAnalyzer(self.dummy_path, logger=lambda x: None, keep_spectrogram=True)
+
+        for t in (0.0, 0.5, 1.0, 1.9):
+            features = analyzer.get_features_at_time(t)
+            frame = min(int(t * analyzer.sr / analyzer.hop_length), len(analyzer.onset_env) - 1)
+            column = analyzer.D[:, frame]
+            max_val = np.max(column) + 1e-6
+            for band, (low, high) in FREQUENCY_BANDS.items():
+                mask = (analyzer.freqs >= low) & (analyzer.freqs < high)
+                self.assertAlmostEqual(getattr(features, band), np.mean(column[mask]) / max_val, places=5)
+            self.assertAlmostEqual(features.intensity, min(analyzer.rms[frame] / (np.max(analyzer.rms) + 1e-6), 1.0), places=5)
+            self.assertAlmostEqual(features.harmonicity, float(np.max(analyzer.chroma[:, frame])), places=5)
+
+            expected_segment = "neutral"
+            for i, seg_time in enumerate(analyzer.segment_times[:-1]):
+                frame_time = frame * analyzer.hop_length / analyzer.sr
+                if seg_time <= frame_time < analyzer.segment_times[i + 1]:
+                    expected_segment = analyzer.segment_types[i]
+                    break
+            self.assertEqual(features.segment_type, expected_segment)
+
+    @patch('librosa.load')
+    def test_features_batch_matches_single_queries(self, mock_load):
+        """Each row of the batch query must equal the matching get_features_at_time result."""
+        mock_load.return_value = (self.y, self.sr)
+        analyzer = AdvancedAudioAnalyzer(self.dummy_path, logger=lambda x: None)
+
+        fps = 30
+        n_frames = int(self.duration * fps) + 5  # Dépasse la fin du morceau
+        batch = analyzer.features_for_fps(fps, n_frames)
+        self.assertEqual(len(batch['bass']), n_frames)
+
+        for frame_num in (0, 7, 31, n_frames - 1):
+            single = analyzer.get_features_at_time(frame_num / fps)
+            for name in AdvancedAudioFeatures.__dataclass_fields__:
+                expected = getattr(single, name)
+                if name == 'stems':
+                    # Per-stem channels are flat batch columns
+                    for channel, stem_value in expected.items():
+                        self.assertAlmostEqual(float(batch[channel][frame_num]), stem_value, places=5, msg=channel)
+                    continue
+                value = batch[name][frame_num]
+                if isinstance(expected, str):
+                    self.assertEqual(str(value), expected)
+                else:
+                    self.assertAlmostEqual(float(value), float(expected), places=5, msg=name)
+
     @patch('librosa.load')
     def test_get_spectrum_at_time(self, mock_load):
         """Test spectrum extraction."""
         mock_load.return_value = (self.y, self.sr)
-        analyzer = AdvancedAudioAnalyzer(self.dummy_path, logger=lambda x: None)
+        analyzer = AdvancedAudioAnalyzer(self.dummy_path, logger=lambda x: None, use_cache=False, keep_spectrogram=True)
         
         spectrum = analyzer.get_spectrum_at_time(1.0)
         
@@ -80,6 +170,28 @@ class TestAdvancedAudioAnalyzer(unittest.TestCase):
         spectrum_oob = analyzer.get_spectrum_at_time(10.0)
         self.assertEqual(np.sum(spectrum_oob), 0.0)
 
+    @patch('librosa.load')
+    def test_display_spectrum(self, mock_load):
+        """The compact log-frequency spectrum puts each tone in its bin at the right level, in 8 bits."""
+        mock_load.return_value = (self.y, self.sr)
+        analyzer = AdvancedAudioAnalyzer(self.dummy_path, logger=lambda x: None, use_cache=False)
+
+        spectrum = analyzer.get_display_spectrum(1.0)
+        self.assertEqual((spectrum.dtype, spectrum.shape), (np.uint8, (DISPLAY_BINS,)))
+        self.assertEqual(analyzer.display_spectrum.shape, (len(analyzer.onset_env), DISPLAY_BINS))
+        edges = np.geomspace(DISPLAY_FMIN, DISPLAY_FMAX, DISPLAY_BINS + 1)
+        live = RealTimeAudioAnalyzer()
+        live.process(self.y[44100:44100 + 1024])
+        live_spectrum = live.get_display_spectrum()
+        for freq, amplitude in ((50, 0.5), (440, 0.3), (5000, 0.2)):
+            index = np.searchsorted(edges, freq) - 1
+            expected = 255 * (1 + 20 * np.log10(amplitude) / DISPLAY_DB_RANGE)
+            self.assertAlmostEqual(int(spectrum[index]), expected, delta=12)
+            # Same scale in live mode
+            self.assertAlmostEqual(int(live_spectrum[index]), int(spectrum[index]), delta=10)
+        self.assertLess(int(spectrum[np.searchsorted(edges, 2000) - 1]), 40)
+        self.assertEqual(int(np.sum(analyzer.get_display_spectrum(10.0))), 0)
+
     @patch('librosa.load')
     def test_audio_presets(self, mock_load):
         """Test if applying EQ presets works without error."""
@@ -97,5 +209,942 @@ class TestAdvancedAudioAnalyzer(unittest.TestCase):
         except Exception as e:
             self.fail(f"Vocal Boost preset raised exception: {e}")
 
+    @patch('librosa.load')
+    def test_binary_cache_roundtrip(self, mock_load):
+        """A cache hit must restore the spectral data, not just the scalar curves."""
+        mock_load.return_value = (self.y, self.sr)
+        with tempfile.TemporaryDirectory() as tmp:
+            audio_path = os.path.join(tmp, "track.wav")
+            with open(audio_path, "wb") as f:
+                f.write(b"dummy")
+
+            cache = AnalysisCache(os.path.join(tmp, "cache"))
+            fresh = AdvancedAudioAnalyzer(audio_path, logger=lambda x: None, cache=cache)
+            self.assertEqual(cache.stats()["entries"], 1)
+            self.assertFalse([f for f in os.listdir(tmp) if f.endswith(".analysis.bin")])
+
+            mock_load.reset_mock()
+            cached = AdvancedAudioAnalyzer(audio_path, logger=lambda x: None, cache=cache)
+            mock_load.assert_not_called()
+            self.assertEqual(cache.stats()["hits"], 1)
+
+            self.assertIsNone(fresh.D)
+            self.assertEqual(cached.display_spectrum.shape, fresh.display_spectrum.shape)
+            np.testing.assert_array_equal(cached.get_display_spectrum(1.0), fresh.get_display_spectrum(1.0))
+            self.assertGreater(float(np.sum(cached.chroma)), 0.0)
+
+            f_fresh = fresh.get_features_at_time(1.0)
+            f_cached = cached.get_features_at_time(1.0)
+            self.assertAlmostEqual(f_cached.harmonicity, f_fresh.harmonicity, places=4)
+            self.assertAlmostEqual(f_cached.bass, f_fresh.bass, places=4)
+            self.assertEqual(f_cached.segment_type, f_fresh.segment_type)
+            del cached
+
+    @patch('librosa.load')
+    def test_cache_is_content_addressed_per_preset(self, mock_load):
+        """Entries follow the audio bytes, not the path, and presets never share an entry."""
+        mock_load.return_value = (self.y, self.sr)
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = AnalysisCache(os.path.join(tmp, "cache"))
+            first, copy = os.path.join(tmp, "a.wav"), os.path.join(tmp, "b.wav")
+            for path in (first, copy):
+                with open(path, "wb") as f:
+                    f.write(b"same bytes")
+
+            AdvancedAudioAnalyzer(first, logger=lambda x: None, cache=cache)
+            mock_load.reset_mock()
+            AdvancedAudioAnalyzer(copy, logger=lambda x: None, cache=cache)
+            mock_load.assert_not_called()
+
+            # New analysis entry, but the decoded PCM is shared across presets
+            AdvancedAudioAnalyzer(first, audio_preset="Bass Boost", logger=lambda x: None, cache=cache)
+            mock_load.assert_not_called()
+            stats = cache.stats()
+            self.assertEqual((stats["hits"], stats["misses"], stats["entries"]), (1, 2, 2))
+
+    def test_cache_lru_eviction(self):
+        """Above the size cap the least recently used entries are evicted first."""
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = AnalysisCache(tmp, max_bytes=10**9)
+            column = {"x": np.zeros(1000, dtype=np.float32)}
+            for i, key in enumerate(("aa01", "bb02", "cc03")):
+                cache.store(key, {}, column)
+                os.utime(cache.path_for(key), (1000 + i, 1000 + i))
+            self.assertIsNotNone(cache.load("aa01"))  # now the most recently used
+
+            entry_size = os.path.getsize(cache.path_for("aa01"))
+            cache.max_bytes = 2 * entry_size
+            self.assertEqual(cache.evict(), 1)
+            self.assertFalse(os.path.exists(cache.path_for("bb02")))
+            self.assertIsNotNone(cache.load("aa01"))
+            self.assertIsNone(cache.load("bb02"))
+            self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_decoded_audio_store_decodes_once(self):
+        """Preview, analysis and VST views come from one persisted decode and match librosa.load."""
+        with tempfile.TemporaryDirectory() as tmp:
+            audio_path = os.path.join(tmp, "stereo.wav")
+            stereo = np.stack([self.y, 0.5 * self.y[::-1]])
+            sf.write(audio_path, stereo.T, 32000)
+            store = DecodedAudioStore(os.path.join(tmp, "cache"))
+
+            y, sr = store.get(audio_path, sr=44100, res_type='soxr_hq')
+            ref, _ = librosa.load(audio_path, sr=44100, res_type='soxr_hq')
+            self.assertEqual(sr, 44100)
+            np.testing.assert_allclose(y, ref, atol=1e-6)
+
+            preview, sr = store.get(audio_path, sr=22050, mono=False)
+            self.assertEqual((preview.shape[0], sr), (2, 22050))
+            native, sr = store.get(audio_path, mono=False)
+            self.assertEqual((native.shape, sr), ((2, stereo.shape[1]), 32000))
+            self.assertEqual(store.decodes, 1)
+
+            reopened = DecodedAudioStore(os.path.join(tmp, "cache"))
+            reopened.get(audio_path)
+            self.assertEqual(reopened.decodes, 0)
+            # PCM entries have their own budget and are not counted as analyses
+            self.assertEqual(AnalysisCache(os.path.join(tmp, "cache")).stats()["entries"], 0)
+            self.assertEqual(reopened.stats()["entries"], 1)
+            del native, preview
+
+    def test_coarse_analysis_tracks_full_analysis(self):
+        """The 11 kHz preview pass exposes the same queries and follows the full-quality bands and energy."""
+        with tempfile.TemporaryDirectory() as tmp:
+            audio_path = os.path.join(tmp, "track.wav")
+            sf.write(audio_path, self.y, self.sr)
+
+            full = AdvancedAudioAnalyzer(audio_path, logger=lambda x: None, use_cache=False)
+            coarse = CoarseAudioAnalyzer(audio_path, logger=lambda x: None)
+
+            self.assertEqual(coarse.sr, 11025)
+            self.assertEqual(coarse.n_frames, full.n_frames)
+            self.assertAlmostEqual(coarse.duration, full.duration, places=2)
+            times = np.linspace(0.1, 1.9, 20)
+            coarse_batch = coarse.get_features_batch(times)
+            full_batch = full.get_features_batch(times)
+            for name in ('sub_bass', 'bass', 'low_mid', 'intensity'):
+                np.testing.assert_allclose(coarse_batch[name], full_batch[name], atol=0.05)
+            self.assertIsInstance(coarse.get_features_at_time(1.0), AdvancedAudioFeatures)
+            self.assertEqual(coarse.get_features_at_time(1.0).spectral_centroid, 0.0)
+
+    def test_library_pre_analysis_fills_cache_and_index(self):
+        """Pre-analysis writes one index entry per track and leaves the cache warm for later loads."""
+        default_cache = get_analysis_cache()
+        previous = (default_cache.root, default_cache.max_bytes)
+        with tempfile.TemporaryDirectory() as tmp:
+            library = os.path.join(tmp, "library")
+            os.makedirs(os.path.join(library, "album"))
+            sf.write(os.path.join(library, "one.wav"), self.y, self.sr)
+            sf.write(os.path.join(library, "album", "two.wav"), self.y[::-1], self.sr)
+            index_path = os.path.join(tmp, "index.json")
+            try:
+                configure_analysis_cache(os.path.join(tmp, "cache"))
+                entries = pre_analyze_library(library, processes=1, index_path=index_path, logger=lambda x: None)
+                self.assertEqual(len(entries), 2)
+                self.assertFalse(any(entry["cached"] for entry in entries))
+
+                index = load_library_index(index_path)
+                self.assertEqual(set(index), {entry["path"] for entry in entries})
+                for entry in index.values():
+                    self.assertAlmostEqual(entry["duration"], self.duration, places=2)
+                    self.assertIn("style", entry)
+                    self.assertIn("onset_density", entry["profile"])
+
+                again = pre_analyze_library(library, processes=1, index_path=index_path, logger=lambda x: None)
+                self.assertTrue(all(entry["cached"] for entry in again))
+            finally:
+                configure_analysis_cache(*previous)
+
+    def test_stems_are_analyzed_in_processes_and_aligned(self):
+        """Each stem gets its own feature channels on the mix frame grid, shared through the content-hash cache."""
+        t = np.arange(int(self.duration * self.sr)) / self.sr
+        drums = (0.8 * np.sin(2 * np.pi * 60 * t) * np.exp(-((t * 2.0) % 1.0) * 20)).astype(np.float32)
+        vocals = (0.3 * np.sin(2 * np.pi * 440 * t) * (t >= 1.0)).astype(np.float32)
+        with tempfile.TemporaryDirectory() as tmp:
+            paths = {name: os.path.join(tmp, f"{name}.wav") for name in ("mix", "drums", "vocals")}
+            sf.write(paths["mix"], drums + vocals, self.sr)
+            sf.write(paths["drums"], drums, self.sr)
+            # Shorter stem: silent channels past its end
+            sf.write(paths["vocals"], vocals[:int(1.5 * self.sr)], self.sr)
+            cache = AnalysisCache(os.path.join(tmp, "cache"))
+            stems = {"drums": paths["drums"], "vocals": paths["vocals"]}
+
+            analyzer = AdvancedAudioAnalyzer(paths["mix"], logger=lambda x: None, cache=cache, use_pcm_store=False,
+                                             stems=stems, stem_processes=2)
+            self.assertEqual(len(analyzer.stem_channels), 2 * len(STEM_CHANNELS))
+            self.assertEqual(cache.stats()["entries"], 3)
+
+            times = np.array([0.5, 1.25, 1.75])
+            batch = analyzer.get_features_batch(times)
+            vocal_energy = batch["vocals.rms_energy"]
+            self.assertLess(vocal_energy[0], 1e-3)
+            self.assertGreater(vocal_energy[1], 0.05)
+            self.assertEqual(vocal_energy[2], 0.0)
+            self.assertGreater(batch["drums.rms_energy"][0], 0.01)
+            single = analyzer.get_features_at_time(1.25)
+            self.assertAlmostEqual(single.stems["vocals.rms_energy"], float(vocal_energy[1]), places=6)
+            self.assertEqual(stem_uniform_name("drums.beat_strength"), "drums_beat_strength")
+
+            again = AdvancedAudioAnalyzer(paths["mix"], logger=lambda x: None, cache=cache, use_pcm_store=False,
+                                          stems=stems, stem_processes=1)
+            self.assertTrue(again.loaded_from_cache)
+            for channel in analyzer.stem_channels:
+                np.testing.assert_array_equal(again.feature_table[channel], analyzer.feature_table[channel])
+
+        with self.assertRaises(ValueError):
+            AdvancedAudioAnalyzer(self.dummy_path, stems={"lead vocals": "x.wav"})
+
+    @patch('librosa.load')
+    def test_feature_timeline_roundtrip(self, mock_load):
+        """An exported feature timeline answers every render query like the analyzer, without librosa."""
+        mock_load.return_value = (self.y, self.sr)
+        analyzer = AdvancedAudioAnalyzer(self.dummy_path, logger=lambda x: None, use_cache=False)
+        style, profile = MusicStyleClassifier.classify(analyzer)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "track.features.bin")
+            analyzer.export_feature_timeline(path)
+            timeline = FeatureTimeline(path)
+
+            self.assertEqual((timeline.style, timeline.profile), (style, profile))
+            self.assertEqual(timeline.duration, analyzer.duration)
+            expected = analyzer.features_for_fps(30, 70)
+            batch = timeline.features_for_fps(30, 70)
+            self.assertEqual(set(batch), set(expected))
+            for name, column in expected.items():
+                np.testing.assert_array_equal(batch[name], column, err_msg=name)
+            self.assertEqual(timeline.get_features_at_time(1.3), analyzer.get_features_at_time(1.3))
+            np.testing.assert_array_equal(timeline.get_display_spectrum(0.7), analyzer.get_display_spectrum(0.7))
+            self.assertEqual(timeline.beat_grid.next_downbeat(0.4), analyzer.beat_grid.next_downbeat(0.4))
+
+            cache_path = os.path.join(tmp, "entry.bin")
+            write_analysis_cache(cache_path, {"sr": 44100}, {"pcm": np.zeros(4, dtype=np.float32)})
+            with self.assertRaises(ValueError):
+                FeatureTimeline(cache_path)
+
+        # Render machines load timelines without importing the analysis stack
+        probe = "import sys, feature_timeline; print('librosa' in sys.modules)"
+        result = subprocess.run([sys.executable, "-c", probe], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+        self.assertEqual(result.stdout.strip(), "False", result.stderr)
+
+    def test_streaming_matches_full_analysis(self):
+        """Block-wise streaming analysis must reproduce the in-memory curves without keeping the STFT."""
+        with tempfile.TemporaryDirectory() as tmp:
+            audio_path = os.path.join(tmp, "track.wav")
+            sf.write(audio_path, self.y, self.sr)
+
+            full = AdvancedAudioAnalyzer(audio_path, logger=lambda x: None, use_cache=False)
+            stream = AdvancedAudioAnalyzer(audio_path, logger=lambda x: None, use_cache=False,
+                                           streaming=True, block_seconds=0.37)
+
+            self.assertEqual(stream.n_frames, full.n_frames)
+            self.assertIsNone(stream.D)
+            self.assertEqual(stream.display_spectrum.shape, full.display_spectrum.shape)
+            self.assertLessEqual(int(np.abs(stream.display_spectrum.astype(int) - full.display_spectrum).max()), 1)
+            np.testing.assert_allclose(stream.rms, full.rms, rtol=1e-4, atol=1e-6)
+            np.testing.assert_allclose(stream.spectral_centroid, full.spectral_centroid, rtol=1e-3)
+            np.testing.assert_allclose(stream.band_energies, full.band_energies, atol=1e-4)
+            np.testing.assert_allclose(stream.chroma, full.chroma, atol=1e-3)
+            self.assertAlmostEqual(stream.duration, full.duration, places=3)
+
+    @patch('librosa.load')
+    def test_parallel_stages_match_sequential(self, mock_load):
+        """Running the analysis DAG on several workers must give the same result as one worker."""
+        mock_load.return_value = (self.y, self.sr)
+        sequential = AdvancedAudioAnalyzer(self.dummy_path, logger=lambda x: None, use_cache=False, workers=1)
+        parallel = AdvancedAudioAnalyzer(self.dummy_path, logger=lambda x: None, use_cache=False, workers=4)
+
+        self.assertIn('spectrogram', parallel.stage_timings)
+        self.assertEqual(parallel.tempo, sequential.tempo)
+        np.testing.assert_array_equal(parallel.beat_frames, sequential.beat_frames)
+        np.testing.assert_array_equal(parallel.segment_boundaries, sequential.segment_boundaries)
+        np.testing.assert_array_equal(parallel.band_energies, sequential.band_energies)
+        for name in ('intensity', 'harmonicity', 'glitch_intensity', 'spectral_flux'):
+            np.testing.assert_array_equal(parallel.feature_table[name], sequential.feature_table[name])
+
+    def test_stage_graph_order_and_errors(self):
+        """Stages run once, after their dependencies; unknown dependencies are rejected."""
+        order = []
+        stages = [
+            AnalysisStage('c', 'c', lambda: order.append('c'), ('a', 'b')),
+            AnalysisStage('a', 'a', lambda: order.append('a')),
+            AnalysisStage('b', 'b', lambda: order.append('b'), ('a',)),
+        ]
+        timings = run_stage_graph(stages, workers=3, logger=lambda x: None)
+        self.assertEqual(order, ['a', 'b', 'c'])
+        self.assertEqual(set(timings), {'a', 'b', 'c'})
+
+        with self.assertRaises(ValueError):
+            run_stage_graph([AnalysisStage('a', 'a', lambda: None, ('missing',))], logger=lambda x: None)
+        with self.assertRaises(ValueError):
+            run_stage_graph([AnalysisStage('a', 'a', lambda: None, ('b',)),
+                             AnalysisStage('b', 'b', lambda: None, ('a',))], logger=lambda x: None)
+
+class TestRealTimeAudioAnalyzer(unittest.TestCase):
+    def setUp(self):
+        t = np.arange(1024) / 44100
+        self.buffer = (0.5 * np.sin(2 * np.pi * 100 * t) + 0.2 * np.sin(2 * np.pi * 3000 * t)).astype(np.float32)
+
+    def test_band_energies_match_masked_means(self):
+        """The matrix reduction must give the per-band masked means (with gains) of the normalized spectrum."""
+        analyzer = RealTimeAudioAnalyzer()
+        features = analyzer.process(self.buffer)
+        magnitude = np.abs(np.fft.rfft(self.buffer / np.max(np.abs(self.buffer))))
+        for gain, (band, (low, high)) in zip(RealTimeAudioAnalyzer.BAND_GAINS, FREQUENCY_BANDS.items()):
+            mask = (analyzer.freqs >= low) & (analyzer.freqs < high)
+            expected = min(float(np.mean(magnitude[mask])) * float(gain), 1.0)
+            self.assertAlmostEqual(getattr(features, band), expected, places=4)
+        np.testing.assert_allclose(analyzer.current_magnitude, magnitude, rtol=1e-5)
+
+    def test_smoothing_and_reused_output(self):
+        """process() smooths the state vector and always returns the same features object."""
+        analyzer = RealTimeAudioAnalyzer()
+        first = analyzer.process(self.buffer)
+        loud_bass = first.bass
+        second = analyzer.process(np.zeros(1024, dtype=np.float32))
+        self.assertIs(first, second)
+        self.assertAlmostEqual(second.bass, loud_bass * analyzer.smooth_factor, places=5)
+
+    def test_steady_state_does_not_allocate_arrays(self):
+        """After warm-up a buffer must not allocate anything the size of a sample buffer."""
+        analyzer = RealTimeAudioAnalyzer()
+        analyzer.process(self.buffer)
+        tracemalloc.start()
+        try:
+            analyzer.process(self.buffer)
+            before, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            for _ in range(20):
+                analyzer.process(self.buffer)
+            peak = tracemalloc.get_traced_memory()[1] - before
+        finally:
+            tracemalloc.stop()
+        self.assertLess(peak, 1024 * 4)
+
+    def test_runtime_band_changes_are_applied(self):
+        """Edits to FREQUENCY_BANDS (FFT config dialog) are picked up by the next buffer."""
+        analyzer = RealTimeAudioAnalyzer()
+        before = analyzer.process(self.buffer).high_mid
+        original = FREQUENCY_BANDS['high_mid']
+        try:
+            FREQUENCY_BANDS['high_mid'] = (10000, 12000)
+            analyzer.prev_features = None
+            after = analyzer.process(self.buffer).high_mid
+            magnitude = np.abs(np.fft.rfft(self.buffer / np.max(np.abs(self.buffer))))
+            mask = (analyzer.freqs >= 10000) & (analyzer.freqs < 12000)
+            self.assertAlmostEqual(after, float(np.mean(magnitude[mask])), places=4)
+            self.assertLess(after, before)
+        finally:
+            FREQUENCY_BANDS['high_mid'] = original
+
+class TestPeakPyramid(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(2)
+        self.y = (0.1 * rng.standard_normal(22050 * 30)).astype(np.float32)
+        self.y[123457] = 0.9
+
+    def test_columns_match_brute_force_on_block_boundaries(self):
+        """Block-aligned columns give the exact min, max and RMS of the samples they cover."""
+        pyramid = PeakPyramid(np.stack([self.y, self.y]), base_block=32)
+        for per_column in (32, 128, 4096):
+            n_columns = len(self.y) // per_column
+            mins, maxs, rms = pyramid.columns(0, n_columns * per_column, n_columns)
+            blocks = self.y[:n_columns * per_column].reshape(n_columns, per_column).astype(np.float64)
+            np.testing.assert_allclose(mins, blocks.min(axis=1), atol=1e-6)
+            np.testing.assert_allclose(maxs, blocks.max(axis=1), atol=1e-6)
+            np.testing.assert_allclose(rms, np.sqrt((blocks ** 2).mean(axis=1)), atol=1e-6)
+
+    def test_peaks_survive_every_zoom_level(self):
+        """Unlike strided decimation, no zoom level may alias away an isolated peak."""
+        pyramid = PeakPyramid(self.y)
+        self.assertAlmostEqual(pyramid.peak, 0.9, places=6)
+        for n_columns in (50, 333, 1000, 7777, 40000):
+            _, maxs, _ = pyramid.columns(0, len(self.y), n_columns)
+            self.assertAlmostEqual(float(maxs.max()), 0.9, places=6)
+        _, maxs, _ = pyramid.columns_for_time(5.0, 6.0, 200)
+        self.assertAlmostEqual(float(maxs.max()), 0.9, places=6)
+
+        mins, maxs, _ = pyramid.columns(-1000, 1000, 4)
+        self.assertEqual((maxs[0], mins[1]), (0.0, 0.0))
+        self.assertNotEqual(maxs[3], 0.0)
+
+    def test_zigzag_points(self):
+        points = zigzag_points(10.0, 4.0, np.array([1.0, 2.0]), np.array([-1.0, -2.0]))
+        np.testing.assert_array_equal(points, [[11.0, 1.0], [11.0, -1.0], [13.0, 2.0], [13.0, -2.0]])
+
+class TestAudioRingBuffer(unittest.TestCase):
+    def test_overlapping_windows_and_counters(self):
+        """Windows advance by one hop, overlap, skip ahead on overrun and count empty polls as underruns."""
+        ring = AudioRingBuffer(capacity=8192, window_size=1024, hop_size=512)
+        signal = np.arange(20000, dtype=np.float32)
+        out = np.zeros(1024, dtype=np.float32)
+
+        self.assertFalse(ring.next_window(out))
+        self.assertFalse(ring.next_window(out))
+        self.assertEqual(ring.underruns, 1)
+
+        for start in range(0, 2048, 300):   # callback blocks of arbitrary size
+            ring.write(signal[start:min(start + 300, 2048)])
+        windows = []
+        while ring.next_window(out):
+            windows.append(out.copy())
+        self.assertEqual(len(windows), 4)
+        np.testing.assert_array_equal(windows[1], signal[0:1024])
+        np.testing.assert_array_equal(windows[3], signal[1024:2048])
+        self.assertEqual(ring.underruns, 1)
+
+        ring.write(signal[2048:9000])       # render hitch: far more than half the ring
+        self.assertTrue(ring.next_window(out))
+        np.testing.assert_array_equal(out, signal[9000 - 1024:9000])
+        self.assertEqual(ring.overruns, 1)
+        self.assertEqual(ring.dropped_samples, 9000 - 2560)
+        self.assertEqual(ring.available, 0)
+
+    def test_analyzer_feeds_only_new_samples_to_tracker(self):
+        """With overlapping windows the beat tracker must see each sample exactly once."""
+        ring = AudioRingBuffer(capacity=8192, window_size=1024, hop_size=512)
+        analyzer = RealTimeAudioAnalyzer()
+        reference = StreamingBeatTracker()
+        y = np.random.default_rng(1).standard_normal(44100).astype(np.float32) * 0.1
+        out = np.zeros(1024, dtype=np.float32)
+        for start in range(0, len(y), 512):
+            ring.write(y[start:start + 512])
+            reference.process(y[start:start + 512])
+            while ring.next_window(out):
+                analyzer.process(out, new_samples=ring.hop_size)
+        self.assertEqual(analyzer.beat_tracker._frame_index, reference._frame_index)
+        self.assertAlmostEqual(analyzer.beat_tracker.flux, reference.flux)
+
+class TestStreamingBeatTracker(unittest.TestCase):
+    def test_locks_tempo_and_beat_phase(self):
+        """Fed 1024-sample buffers of a 128 BPM loop, the tracker finds the tempo and fires beats on the kicks."""
+        sr, bpm = 44100, 128.0
+        t = np.arange(int(20 * sr)) / sr
+        beat_phase = (t * bpm / 60.0) % 1.0
+        kick = np.sin(2 * np.pi * 55 * t) * np.exp(-beat_phase * 12)
+        hats = 0.05 * np.random.default_rng(0).standard_normal(len(t)) * (((t * 2 * bpm / 60.0) % 1.0) < 0.1)
+        y = (0.6 * kick + hats).astype(np.float32)
+
+        tracker = StreamingBeatTracker(sr)
+        onsets, beats = 0, []
+        for start in range(0, len(y) - 1024, 1024):
+            onsets += tracker.process(y[start:start + 1024])
+            if tracker.beat:
+                beats.append((start + 1024) / sr)
+
+        self.assertAlmostEqual(tracker.tempo, bpm, delta=2.0)
+        self.assertGreater(onsets, 20)
+        period = 60.0 / bpm
+        late = [b for b in beats if b > 10.0]
+        self.assertGreater(len(late), 15)
+        for b in late:
+            error = (b + period / 2) % period - period / 2
+            self.assertLess(abs(error), 0.03)
+
+    def test_published_phases_wrap_after_negative_correction(self):
+        """A PLL pull-back below 0 stays internal: the analyzer publishes beat/bar phases in [0, 1)."""
+        analyzer = RealTimeAudioAnalyzer()
+        tracker = analyzer.beat_tracker
+        tracker.phase = 0.05
+        tracker.beat_count = 4
+        tracker._correct_phase(0.2)
+        self.assertAlmostEqual(tracker.phase, -0.15)
+
+        with patch.object(tracker, 'process', return_value=False):
+            features = analyzer.process(np.zeros(1024, dtype=np.float32))
+        self.assertAlmostEqual(tracker.phase, -0.15)
+        self.assertAlmostEqual(features.beat_phase, 0.85)
+        self.assertAlmostEqual(features.bar_phase, 1.0 - 0.15 / 4.0)
+
+        # x % 1.0 is 1.0 for a tiny negative x
+        tracker.phase = -1e-17
+        with patch.object(tracker, 'process', return_value=False):
+            features = analyzer.process(np.zeros(1024, dtype=np.float32))
+        self.assertEqual(features.beat_phase, 0.0)
+        self.assertEqual(features.bar_phase, 0.0)
+
+class TestBeatGrid(unittest.TestCase):
+    def test_phases_and_next_downbeat(self):
+        """Beat/bar phases interpolate between detected beats and extrapolate at the median tempo."""
+        beats = np.arange(16) * 0.5 + 0.25  # 120 BPM, first beat at 0.25s
+        grid = BeatGrid(beats, beats_per_bar=4, downbeat_offset=1)
+        self.assertAlmostEqual(grid.period, 0.5)
+        np.testing.assert_allclose(grid.downbeat_times, beats[1::4])
+
+        beat_phase, bar_phase, bar = grid.phases(np.array([0.75, 1.0, 1.25 + 0.125, 0.0, 20.0]))
+        np.testing.assert_allclose(beat_phase, [0.0, 0.5, 0.25, 0.5, 0.5])
+        np.testing.assert_allclose(bar_phase, [0.0, 0.125, 0.3125, 0.625, 0.625])
+        np.testing.assert_array_equal(bar, [0, 0, 0, -1, 9])
+
+        self.assertAlmostEqual(grid.next_beat(1.0), 1.25)
+        self.assertAlmostEqual(grid.next_downbeat(1.0), 2.75)
+        self.assertAlmostEqual(grid.next_downbeat(1.0, bars=2), 4.75)
+        self.assertAlmostEqual(grid.next_downbeat(8.0), 8.75)  # past the last detected beat
+        np.testing.assert_allclose(grid.time_at(grid.beat_position([0.1, 3.3, 12.0])), [0.1, 3.3, 12.0])
+
+    def test_downbeat_offset_follows_accents(self):
+        """The most accented beat position in the bar becomes the downbeat."""
+        accent = np.full(400, 0.1)
+        beat_frames = np.arange(2, 400, 10)
+        accent[beat_frames] = 0.5
+        accent[beat_frames[3::4]] = 1.0
+        self.assertEqual(estimate_downbeat_offset(beat_frames, accent, 4), 3)
+        self.assertEqual(estimate_downbeat_offset(beat_frames[:3], accent, 4), 0)
+
+    @patch('librosa.load')
+    def test_analyzer_features_carry_beat_and_bar_phase(self, mock_load):
+        """Single and batch queries expose the same phases as the analyzer's beat grid."""
+        sr = 22050
+        t = np.arange(int(8 * sr)) / sr
+        kick = np.sin(2 * np.pi * 60 * t) * np.exp(-((t * 2.0) % 1.0) * 20)
+        mock_load.return_value = ((0.8 * kick).astype(np.float32), sr)
+        analyzer = AdvancedAudioAnalyzer("kick.wav", use_cache=False, use_pcm_store=False)
+
+        times = np.linspace(0.5, 7.5, 9)
+        beat_phase, bar_phase, _ = analyzer.beat_grid.phases(times)
+        batch = analyzer.get_features_batch(times)
+        np.testing.assert_allclose(batch['beat_phase'], beat_phase, atol=1e-6)
+        np.testing.assert_allclose(batch['bar_phase'], bar_phase, atol=1e-6)
+        single = analyzer.get_features_at_time(times[4])
+        self.assertAlmostEqual(single.beat_phase, float(beat_phase[4]), places=5)
+        self.assertAlmostEqual(single.bar_phase, float(bar_phase[4]), places=5)
+        self.assertAlmostEqual(analyzer.beat_grid.period, 0.5, delta=0.03)
+
+class TestShaderGenerator(unittest.TestCase):
+    def test_generation_is_memoized_on_compact_key(self):
+        """Repeated calls return the cached GLSL; the key ignores what the shader does not depend on."""
+        gen = ProceduralShaderGenerator
+        styles = gen.get_available_styles()
+        style, other = (styles + ["fractal", "fractal"])[:2]
+
+        code = gen.generate_shader(style, {'tempo': 120})
+        self.assertIs(gen.generate_shader(style, {'tempo': 90}, other, 0.0), code)
+        self.assertEqual(gen.shader_key(style, other, 0.0), gen.shader_key(style))
+        self.assertNotEqual(gen.shader_key(style, vr_mode=True), gen.shader_key(style))
+        self.assertNotEqual(gen.shader_key(style, custom_pipeline="col *= 0.5;"), gen.shader_key(style))
+
+        morph = gen.generate_shader(style, {}, other, 0.123456)
+        self.assertIs(gen.generate_shader(style, {}, other, 0.4), morph)
+        self.assertEqual(morph, gen._build_shader(style, other, 0.25, False, None))
+
+        gen.reload()
+        self.assertIsNot(gen.generate_shader(style, {}), code)
+        self.assertEqual(gen.generate_shader(style, {}), code)
+
+    def test_transition_uses_progress_uniform(self):
+        """A crossfade yields at most two shaders per style pair; progress is a uniform, not baked in."""
+        gen = ProceduralShaderGenerator
+        styles = [s for s in gen.get_available_styles() if not gen._styles_db[s].shadertoy]
+        style, other = (styles + ["fractal", "fractal"])[:2]
+
+        progresses = np.linspace(0.0, 1.0, 121)
+        keys = {gen.shader_key(style, other, p) for p in progresses if 0.0 < p < 1.0}
+        self.assertEqual(len(keys), 2)
+        shaders = {gen.generate_shader(style, {}, other, p) for p in progresses if 0.0 < p < 1.0}
+        self.assertLessEqual(len(shaders), 2)
+        for code in shaders:
+            self.assertIn("float transition_progress;", code)
+            self.assertIn("mix(d1, d2, transition_progress)", code)
+
+    def test_params_block_packs_std140_floats(self):
+        """Per-frame floats live in one std140 block; other uniforms are handed back to the caller."""
+        gen = ProceduralShaderGenerator
+        declared = re.findall(r"^\s*float (\w+);", gen.UNIFORMS_BLOCK, re.M)
+        self.assertEqual(tuple(declared), gen.PARAMS_BLOCK_FIELDS)
+        self.assertNotIn("uniform float", gen.UNIFORMS_BLOCK)
+
+        block = ParamsBlock()
+        self.assertEqual(block.data.nbytes % 16, 0)
+        others = block.update({'bass': 0.5, 'drums_bass': np.float32(0.25), 'resolution': (640.0, 360.0), 'iChannel0': 0})
+        self.assertEqual(others, {'resolution': (640.0, 360.0), 'iChannel0': 0})
+        # std140: float i sits at byte offset 4 * i
+        offset = 4 * gen.PARAMS_BLOCK_FIELDS.index('bass')
+        self.assertEqual(np.frombuffer(block.data.tobytes()[offset:offset + 4], np.float32)[0], 0.5)
+        self.assertEqual(block.data[block.index['drums_bass']], 0.25)
+
+class TestFFmpegVideoSink(unittest.TestCase):
+    def test_codec_args_map_ui_settings(self):
+        """Codec and bitrate strings map to encoder options; extra filters run before the codec's own."""
+        args = FFmpegHandler.codec_args("H.265 (MP4)", "High Quality (CRF 18)")
+        self.assertEqual(args[args.index('-c:v') + 1], 'libx265')
+        self.assertEqual(args[args.index('-crf') + 1], '18')
+        args = FFmpegHandler.codec_args("H.264 (MP4)", "20 Mbps", ['vflip'])
+        self.assertEqual(args[args.index('-b:v') + 1], '20M')
+        self.assertEqual(args[args.index('-vf') + 1], 'vflip')
+        args = FFmpegHandler.codec_args("GIF", "High Quality (CRF 18)", ['vflip'])
+        self.assertTrue(args[args.index('-vf') + 1].startswith('vflip,fps=15'))
+        self.assertNotIn('-shortest', args)
+
+    def test_raw_frames_stream_into_a_single_ffmpeg(self):
+        """One ffmpeg reads raw RGB frames on stdin plus the audio track, and flips the image itself."""
+        with patch('subprocess.Popen') as popen:
+            popen.return_value.wait.return_value = 0
+            sink = FFmpegVideoSink("out.mp4", 64, 36, 30, "song.wav", logger=lambda *_: None)
+            frame = bytes(64 * 36 * 3)
+            sink.write(frame)
+            self.assertTrue(sink.close())
+
+        cmd = popen.call_args[0][0]
+        self.assertEqual(cmd[cmd.index('-f') + 1], 'rawvideo')
+        self.assertEqual(cmd[cmd.index('-pix_fmt') + 1], 'rgb24')
+        self.assertEqual(cmd[cmd.index('-s') + 1], '64x36')
+        self.assertEqual(cmd[cmd.index('-i') + 1], '-')
+        self.assertIn('song.wav', cmd)
+        self.assertEqual(cmd[cmd.index('-vf') + 1], 'vflip')
+        self.assertEqual(cmd[-1], 'out.mp4')
+        popen.return_value.stdin.write.assert_called_once_with(frame)
+        popen.return_value.stdin.close.assert_called_once()
+
+class TestFramePipeline(unittest.TestCase):
+    def test_frames_keep_order_with_bounded_backlog(self):
+        """Frames leave the last stage in submit order, and the producer never runs far ahead."""
+        written, backlog = [], []
+        submitted = [0]
+        lock = threading.Lock()
+
+        def convert(frame_num, data):
+            time.sleep(0.001 * (frame_num % 3))
+            return data * 2
+
+        def encode(frame_num, data):
+            with lock:
+                backlog.append(submitted[0] - frame_num)
+            written.append((frame_num, data))
+
+        pipeline = FramePipeline([("convert", convert), ("encode", encode)], max_pending=2)
+        for i in range(50):
+            pipeline.record("render", 0.001)
+            pipeline.submit(i, i)
+            with lock:
+                submitted[0] = i + 1
+        pipeline.close()
+
+        self.assertEqual(written, [(i, 2 * i) for i in range(50)])
+        # Two queues of 2 plus one frame in each stage
+        self.assertLessEqual(max(backlog), 2 + 2 + 2 + 1)
+        self.assertEqual(set(pipeline.throughput()), {"convert", "encode", "render"})
+        self.assertGreater(pipeline.throughput()["render"], 0.0)
+
+    def test_stage_error_surfaces_and_cancel_stops_workers(self):
+        """A failing stage is re-raised to the producer; cancel drops pending frames."""
+        def fail(frame_num, data):
+            if frame_num == 3:
+                raise ValueError("encoder died")
+            return data
+
+        dropped = []
+        pipeline = FramePipeline([("encode", fail)], max_pending=1, discard=lambda n, d: dropped.append(n))
+        submitted = 0
+        with self.assertRaises(ValueError):
+            for i in range(100):
+                pipeline.submit(i, i)
+                submitted += 1
+            pipeline.close()
+        pipeline.cancel()
+        self.assertTrue(all(not t.is_alive() for t in pipeline._threads))
+        # The failing frame and everything queued behind it are handed to discard
+        self.assertEqual(dropped, list(range(3, submitted)))
+
+        seen = []
+        pipeline = FramePipeline([("encode", lambda n, d: seen.append(n))], max_pending=1)
+        pipeline.submit(0, None)
+        pipeline.cancel()
+        self.assertTrue(all(not t.is_alive() for t in pipeline._threads))
+        self.assertLessEqual(len(seen), 1)
+
+class FakeGL:
+    """Stand-in for the OpenGL calls of the readback path: PBOs in host memory, fences signaled by the test.
+
+    A blocking glClientWaitSync (timeout > 0) signals its fence, like a GPU that catches up.
+    """
+    SOURCES = ("opengl_renderer.py", "overlay_manager.py", "video_exporter.py")
+
+    def __init__(self):
+        self.next_id = 100
+        self.bound = {}
+        self.storage = {}
+        self.mapped = set()
+        self.fences = []
+        self.signaled = set()
+        self.calls = []
+        # GL names used by the modules under test; the ones not faked below become no-ops
+        here = os.path.dirname(os.path.abspath(__file__))
+        names = set()
+        for source in self.SOURCES:
+            with open(os.path.join(here, source), encoding="utf-8") as f:
+                names.update(re.findall(r"\b(GL_\w+|gl[A-Z]\w*)\b", f.read()))
+        self.gl = types.ModuleType("OpenGL.GL")
+        for index, symbol in enumerate(sorted(names)):
+            setattr(self.gl, symbol, 0x1000 + index if symbol.startswith("GL_") else (lambda *args: 0))
+        for symbol, func in self.functions().items():
+            setattr(self.gl, symbol, func)
+
+    def functions(self):
+        return {
+            'glGenBuffers': self.gen_buffers, 'glDeleteBuffers': lambda n, ids: None,
+            'glBindBuffer': self.bind_buffer, 'glBufferData': self.buffer_data,
+            'glReadPixels': self.read_pixels, 'glFenceSync': self.fence_sync,
+            'glClientWaitSync': self.client_wait_sync, 'glDeleteSync': lambda fence: None,
+            'glMapBuffer': self.map_buffer, 'glUnmapBuffer': self.unmap_buffer,
+            'glPixelStorei': lambda name, value: None,
+            'glBindFramebuffer': lambda *args: self.calls.append(('bind_fbo',) + args),
+            'glBlitFramebuffer': lambda *args: self.calls.append(('blit',) + args),
+        }
+
+    def gen_buffers(self, count):
+        ids = list(range(self.next_id, self.next_id + count))
+        self.next_id += count
+        return ids
+
+    def bind_buffer(self, target, buffer):
+        self.bound[target] = buffer
+
+    def buffer_data(self, target, size, data, usage):
+        self.storage[self.bound[target]] = (ctypes.c_ubyte * size)()
+
+    def read_pixels(self, x, y, width, height, pixel_format, pixel_type, offset=None):
+        # Each read fills its target with its fence number + 1, so frames can be told apart
+        self.calls.append(('read', pixel_format))
+        value = (len(self.fences) + 1) % 256
+        pbo = self.bound.get(self.gl.GL_PIXEL_PACK_BUFFER, 0)
+        if not pbo:
+            return bytes([value]) * (width * height * 3)
+        if pbo in self.mapped:
+            raise AssertionError(f"glReadPixels into mapped PBO {pbo}")
+        ctypes.memset(self.storage[pbo], value, len(self.storage[pbo]))
+
+    def fence_sync(self, condition, flags):
+        self.fences.append(len(self.fences))
+        return self.fences[-1]
+
+    def client_wait_sync(self, fence, flags, timeout):
+        if fence in self.signaled:
+            return self.gl.GL_ALREADY_SIGNALED
+        if timeout > 0:
+            self.signaled.add(fence)
+            return self.gl.GL_CONDITION_SATISFIED
+        return self.gl.GL_TIMEOUT_EXPIRED
+
+    def map_buffer(self, target, access):
+        pbo = self.bound[target]
+        if pbo in self.mapped:
+            raise AssertionError(f"PBO {pbo} mapped twice")
+        self.mapped.add(pbo)
+        return ctypes.addressof(self.storage[pbo])
+
+    def unmap_buffer(self, target):
+        self.mapped.remove(self.bound[target])
+        self.calls.append(('unmap', self.bound[target]))
+        return True
+
+    def import_module(self, name):
+        """Imports name against stub OpenGL/pygame/cv2 modules"""
+        shaders = types.ModuleType("OpenGL.GL.shaders")
+        shaders.compileProgram = shaders.compileShader = lambda *args: 0
+        stubs = {"OpenGL": types.ModuleType("OpenGL"), "OpenGL.GL": self.gl, "OpenGL.GL.shaders": shaders,
+                 "pygame": MagicMock(), "pygame.locals": types.ModuleType("pygame.locals"), "cv2": MagicMock()}
+        with patch.dict(sys.modules, stubs):
+            for module in ("opengl_renderer", "overlay_manager", "ai_style", name):
+                sys.modules.pop(module, None)
+            return importlib.import_module(name)
+
+    def renderer(self, width=4, height=2, depth=3, held=0, cls=None):
+        """OpenGLRenderer whose pygame/GL setup is skipped; only the readback path runs."""
+        cls = cls or self.import_module("opengl_renderer").OpenGLRenderer
+        with patch.object(cls, "_init_pygame"), patch.object(cls, "_setup_quad"), \
+                patch.object(cls, "_setup_fbo"), patch.object(cls, "_setup_output_fbo"), \
+                patch.object(cls, "_setup_blit_shader"), patch.object(cls, "_init_spout"), \
+                patch.dict(cls.__init__.__globals__, {"ParamsUniformBuffer": MagicMock()}):
+            renderer = cls(width, height)
+        renderer.fbo, renderer.output_fbo = 1, 2
+        renderer.set_pbo_enabled(True, depth, held)
+        return renderer
+
+    def run(self, test, func, timeout=10.0):
+        """Runs func on a thread and fails the test instead of hanging if it deadlocks"""
+        result, errors = [], []
+        def target():
+            try:
+                result.append(func())
+            except BaseException as e:
+                errors.append(e)
+        thread = threading.Thread(target=target, daemon=True)
+        thread.start()
+        thread.join(timeout)
+        test.assertFalse(thread.is_alive(), "deadlocked")
+        if errors:
+            raise errors[0]
+        return result[0]
+
+class TestPboReadback(unittest.TestCase):
+    def setUp(self):
+        self.fake = FakeGL()
+        self.renderer = self.fake.renderer(depth=3)
+
+    def frame_values(self, ready):
+        """[(frame_num, fill value)] of read_pixels/flush results"""
+        return [(num, bytes(pixels)[0]) for num, pixels in ready]
+
+    def test_first_frames_wait_in_the_ring_then_come_out_tagged(self):
+        """With unsignaled fences the first pbo_depth reads return nothing, then each read returns the oldest frame."""
+        for frame_num in range(3):
+            self.assertEqual(self.renderer.read_pixels(10 + frame_num), [])
+        self.assertEqual(self.frame_values(self.renderer.read_pixels(13)), [(10, 1)])
+        self.assertEqual(self.frame_values(self.renderer.read_pixels(14)), [(11, 2)])
+        # flush() returns the frames still in the ring, in order
+        self.assertEqual(self.frame_values(self.renderer.flush()), [(12, 3), (13, 4), (14, 5)])
+        self.assertEqual(self.renderer.flush(), [])
+        # Default numbering continues from the last frame
+        self.renderer.read_pixels()
+        self.assertEqual([num for num, _ in self.renderer.flush()], [15])
+
+    def test_frames_stay_in_order_when_fences_signal_out_of_order(self):
+        """A later fence passing first does not let its frame overtake an older one."""
+        self.assertEqual(self.renderer.read_pixels(0), [])
+        self.assertEqual(self.renderer.read_pixels(1), [])
+        self.fake.signaled.add(1)
+        self.assertEqual(self.renderer.read_pixels(2), [])
+        self.fake.signaled.update({0, 2})
+        self.assertEqual(self.frame_values(self.renderer.read_pixels(3)), [(0, 1), (1, 2), (2, 3)])
+        self.assertEqual(self.frame_values(self.renderer.flush()), [(3, 4)])
+
+    def test_signaled_reads_come_out_without_waiting(self):
+        """When the GPU keeps up, each frame comes back from the same read_pixels call."""
+        results = []
+        for frame_num in range(5):
+            self.fake.signaled.add(frame_num)
+            results += self.frame_values(self.renderer.read_pixels(frame_num))
+        self.assertEqual(results, [(n, n + 1) for n in range(5)])
+        self.assertEqual(self.renderer.flush(), [])
+
+class TestZeroCopyReadback(unittest.TestCase):
+    def setUp(self):
+        self.fake = FakeGL()
+
+    def test_full_ring_does_not_wait_on_the_view_it_returns(self):
+        """Regression: with every read in flight and no spare PBO, the frame a zero-copy read returns must not block it."""
+        renderer = self.fake.renderer(depth=3, held=0)
+        for frame_num in range(3):
+            self.assertEqual(renderer.read_pixels(frame_num, zero_copy=True), [])
+        ready = self.fake.run(self, lambda: renderer.read_pixels(3, zero_copy=True))
+        self.assertEqual([num for num, _ in ready], [0])
+        view = ready[0][1]
+        self.assertEqual(view.shape, (2, 4, 3))
+        self.assertFalse(view.flags.writeable)
+        self.assertTrue((view == 1).all())
+        # The returned view keeps its PBO mapped; the read went to an extra PBO
+        self.assertEqual(len(renderer.pbo_ids), 4)
+        renderer.release_frame(0)
+
+        for frame_num in range(4, 10):
+            ready = self.fake.run(self, lambda: renderer.read_pixels(frame_num, zero_copy=True))
+            for num, view in ready:
+                self.assertTrue((view == num + 1).all())
+                renderer.release_frame(num)
+        self.assertEqual(len(renderer.pbo_ids), 4)
+
+    def test_view_stays_mapped_until_released(self):
+        """A held view is neither unmapped nor overwritten; the GL thread waits for release_frame from another thread."""
+        renderer = self.fake.renderer(depth=1, held=1)
+        self.fake.signaled.update(range(10))
+        (num, first), = renderer.read_pixels(0, zero_copy=True)
+        (num, second), = renderer.read_pixels(1, zero_copy=True)
+        self.assertEqual(len(self.fake.mapped), 2)
+
+        # Both PBOs are held by frames returned earlier: the next read waits for the oldest one
+        releaser = threading.Timer(0.1, renderer.release_frame, args=(0,))
+        releaser.start()
+        start = time.perf_counter()
+        ready = self.fake.run(self, lambda: renderer.read_pixels(2, zero_copy=True))
+        self.assertGreaterEqual(time.perf_counter() - start, 0.05)
+        self.assertEqual([n for n, _ in ready], [2])
+        self.assertTrue((second == 2).all())
+        self.assertTrue((ready[0][1] == 3).all())
+        self.assertEqual([call for call in self.fake.calls if call[0] == 'unmap'], [('unmap', 100)])
+
+        # An already released view is recycled without waiting
+        renderer.release_frame(1)
+        renderer.release_frame(2)
+        ready = self.fake.run(self, lambda: renderer.read_pixels(3, zero_copy=True), timeout=1.0)
+        self.assertEqual([n for n, _ in ready], [3])
+
+    def test_flush_drains_every_pending_read(self):
+        """flush(zero_copy=True) waits for all in-flight reads and returns their views in order."""
+        renderer = self.fake.renderer(depth=4, held=0)
+        for frame_num in range(3):
+            self.assertEqual(renderer.read_pixels(frame_num, zero_copy=True), [])
+        ready = renderer.flush(zero_copy=True)
+        self.assertEqual([num for num, _ in ready], [0, 1, 2])
+        for num, view in ready:
+            self.assertTrue((view == num + 1).all())
+            renderer.release_frame(num)
+        self.assertEqual(len(renderer.pending_reads), 0)
+        self.assertEqual(len(renderer.held_frames), 0)
+        self.assertEqual(renderer.flush(zero_copy=True), [])
+
+    def test_output_layout_selects_flip_blit_and_bgr(self):
+        """Flip reads a Y-inverted blit of the FBO; bgr asks the GPU for GL_BGR."""
+        renderer = self.fake.renderer(width=4, height=2)
+        gl = self.fake.gl
+
+        renderer.set_output_layout(flip=True, bgr=False)
+        self.fake.calls.clear()
+        self.assertEqual(renderer._bind_output_for_read(), gl.GL_RGB)
+        self.assertIn(('blit', 0, 0, 4, 2, 0, 2, 4, 0, gl.GL_COLOR_BUFFER_BIT, gl.GL_NEAREST), self.fake.calls)
+        self.assertEqual(self.fake.calls[-1], ('bind_fbo', gl.GL_FRAMEBUFFER, renderer.output_fbo))
+
+        renderer.set_output_layout(flip=False, bgr=True)
+        self.fake.calls.clear()
+        self.assertEqual(renderer._bind_output_for_read(), gl.GL_BGR)
+        self.assertEqual(self.fake.calls, [('bind_fbo', gl.GL_FRAMEBUFFER, renderer.fbo)])
+
+        renderer.read_pixels(0)
+        self.assertIn(('read', gl.GL_BGR), self.fake.calls)
+
+    def test_export_with_slow_encoder_does_not_deadlock(self):
+        """A slow encode stage holds zero-copy frames while the GPU lags behind; export still writes every frame in order."""
+        video_exporter = self.fake.import_module("video_exporter")
+        written = []
+
+        class SlowSink:
+            def __init__(self, *args, **kwargs):
+                self.kwargs = kwargs
+            def write(self, frame):
+                time.sleep(0.005)
+                written.append((frame.shape, int(frame[0, 0, 0])))
+            def close(self):
+                pass
+            def abort(self):
+                pass
+
+        exporter = object.__new__(video_exporter.AdvancedVideoExporter)
+        exporter.config = video_exporter.RenderConfig(audio_path="song.wav", output_path=os.path.join(tempfile.gettempdir(), "out.mp4"),
+                                                      width=4, height=2, fps=30)
+        exporter.width, exporter.height = 4, 2
+        exporter.logger = lambda message: None
+        exporter.style, exporter.style_mapping, exporter.available_styles = "fractal", {}, ["fractal"]
+        exporter.params = {'glitch_strength': 0.0}
+        exporter.ai_engine = exporter.user_texture_id = None
+        exporter.overlay = MagicMock()
+        exporter._program_for = lambda *args, **kwargs: 1
+        total = 40
+        columns = ('sub_bass', 'bass', 'low_mid', 'mid', 'high_mid', 'presence', 'brilliance', 'beat_strength',
+                   'beat_phase', 'bar_phase', 'intensity', 'spectral_centroid', 'spectral_flux', 'glitch_intensity')
+        features = {name: np.zeros(total, dtype=np.float32) for name in columns}
+        features['segment_type'] = np.array(['verse'] * total)
+        exporter.analyzer = MagicMock(duration=total / 30, stem_channels=[])
+        exporter.analyzer.features_for_fps.return_value = features
+        renderer = self.fake.renderer(depth=3, cls=video_exporter.OpenGLRenderer)
+        renderer.render_to_fbo = lambda program, uniforms: None
+        renderer.blit_to_screen = lambda: None
+        exporter.renderer = renderer
+
+        with patch.object(video_exporter, "FFmpegVideoSink", SlowSink):
+            self.fake.run(self, exporter.export, timeout=30.0)
+        self.assertEqual(written, [((2, 4, 3), (n + 1) % 256) for n in range(total)])
+        self.assertEqual(len(renderer.held_frames), 0)
+        # The spare PBOs cover everything the pipeline can hold: no read waited or grew the pool
+        self.assertEqual(len(renderer.pbo_ids), renderer.pbo_depth + renderer.pbo_held)
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
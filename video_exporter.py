@@ -1,19 +1,22 @@
 import os
 import json
 from dataclasses import dataclass, field
-from typing import List, Optional, Tuple
+from typing import Dict, List, Optional, Tuple
 import cv2
 import pygame
 import wave
 import numpy as np
+from time import perf_counter
 from pygame.locals import *
 from OpenGL.GL import *
 
-from audio_analysis import AdvancedAudioAnalyzer, MusicStyleClassifier, RealTimeAudioAnalyzer
+from audio_features import stem_uniform_name
+from feature_timeline import FeatureTimeline
 from shader_generator import ProceduralShaderGenerator
 from opengl_renderer import OpenGLRenderer
 from overlay_manager import OverlayManager
-from ffmpeg_handler import FFmpegHandler
+from ffmpeg_handler import FFmpegHandler, FFmpegVideoSink
+from frame_pipeline import FramePipeline
 from ai_style import StyleTransferEngine
 
 @dataclass
@@ -87,6 +90,9 @@ class RenderConfig:
     text_effect: str = "Scroll"
     allowed_styles: Optional[List[str]] = None
     audio_preset: str = "Flat"
+    streaming_analysis: bool = False
+    feature_timeline: Optional[str] = None  # Timeline de features pré-calculée : le rendu saute l'analyse audio
+    stems: Dict[str, str] = field(default_factory=dict)  # {"drums": chemin, ...} pour des canaux par stem
     srt_path: Optional[str] = None
     spectrogram_bg_color: Tuple[int, int, int, int] = (0, 0, 0, 128)
     spectrogram_position: str = "Bas"
@@ -94,6 +100,7 @@ class RenderConfig:
     spectrogram_enabled: bool = False
     video_source: Optional[str] = None
     pbo_enabled: bool = True
+    pbo_depth: int = 3  # PBO de l'anneau de lecture
     vr_mode: bool = False
     user_texture_path: Optional[str] = None
     distort_user_texture: bool = False
@@ -150,15 +157,15 @@ class AdvancedVideoExporter:
         audio_path_for_analysis = config.audio_path
 
         # VST Processing before analysis
-        if config.vst_enabled and config.vst_model:
+        if config.vst_enabled and config.vst_model and not config.feature_timeline:
             from vst_manager import VSTManager
             import soundfile as sf
-            import librosa
+            from pcm_store import get_pcm_store
             self.logger("🎧 Applying VST effect for render...")
             vst_manager = VSTManager(logger=self.logger)
             vst_path = vst_manager.scan_plugins().get(config.vst_model)
             if vst_path and vst_manager.load_plugin(vst_path):
-                y, sr = librosa.load(config.audio_path, sr=44100, mono=False)
+                y, sr = get_pcm_store().get(config.audio_path, sr=44100, mono=False)
                 y_processed = vst_manager.process_buffer(y, sr, config.vst_mix)
                 
                 temp_vst_path = "temp_render_vst.wav"
@@ -168,12 +175,20 @@ class AdvancedVideoExporter:
             else:
                 self.logger("❌ Could not load VST plugin for render.")
 
-        if config.audio_path:
+        if config.audio_path or config.feature_timeline:
             self.logger("=" * 50)
             self.logger("🎬 DÉMARRAGE DU MOTEUR DE RENDU")
             self.logger("=" * 50)
-            self.analyzer = AdvancedAudioAnalyzer(audio_path_for_analysis, audio_preset=config.audio_preset, logger=self.logger)
-            computed_style, computed_profile = MusicStyleClassifier.classify(self.analyzer)
+            if config.feature_timeline:
+                # Features, grille de beats, segments et style viennent du fichier : ni décodage ni librosa
+                self.analyzer = FeatureTimeline(config.feature_timeline)
+                computed_style, computed_profile = self.analyzer.style, self.analyzer.profile
+                self.logger(f"🗂️ Timeline de features: {config.feature_timeline}")
+            else:
+                from audio_analysis import AdvancedAudioAnalyzer, MusicStyleClassifier
+                self.analyzer = AdvancedAudioAnalyzer(audio_path_for_analysis, audio_preset=config.audio_preset, logger=self.logger,
+                                                      streaming=config.streaming_analysis, stems=config.stems)
+                computed_style, computed_profile = MusicStyleClassifier.classify(self.analyzer)
             if config.auto_detect_style and config.forced_style is None:
                 self.style = computed_style
                 self.profile = computed_profile
@@ -197,7 +212,7 @@ class AdvancedVideoExporter:
         self.logger("🖥️  Initialisation OpenGL...")
         try:
             self.renderer = OpenGLRenderer(self.width, self.height)
-            self.renderer.set_pbo_enabled(config.pbo_enabled)
+            self.renderer.set_pbo_enabled(config.pbo_enabled, config.pbo_depth)
             self.overlay = OverlayManager(self.width, self.height)
             
             scroller_text = f"   +++   {config.artist_name.upper()} - {config.song_title.upper()}   +++   " if config.song_title or config.artist_name else ""
@@ -245,14 +260,10 @@ class AdvancedVideoExporter:
 
     def export(self, preview_window: bool = False, progress_callback=None, check_cancel=None, merge_callback=None, max_duration=None, macro_data=None):
         is_sequence = self.config.export_format in ["png_seq", "exr_seq"]
-        out = None
-        temp_video = None
+        sink = None
+        rendered = False
 
-        if not is_sequence:
-            temp_video = "temp_visual.mp4"
-            fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-            out = cv2.VideoWriter(temp_video, fourcc, self.config.fps, (self.width, self.height))
-        else:
+        if is_sequence:
             if not os.path.exists(self.config.output_path):
                 os.makedirs(self.config.output_path, exist_ok=True)
             self.logger(f"📁 Export Séquence Images vers: {self.config.output_path}")
@@ -262,6 +273,27 @@ class AdvancedVideoExporter:
         total_frames = int(duration * self.config.fps)
         
         self.logger(f"🎥 Rendu de {total_frames} frames ({duration:.1f}s)...")
+        
+        # Features de toutes les frames en un seul appel vectorisé.
+        # Conversion en listes : l'accès par frame renvoie directement des float Python.
+        frame_features = self.analyzer.features_for_fps(self.config.fps, total_frames)
+        audio_uniforms = {
+            'sub_bass': frame_features['sub_bass'], 'bass': frame_features['bass'],
+            'low_mid': frame_features['low_mid'], 'mid': frame_features['mid'],
+            'high_mid': frame_features['high_mid'], 'presence': frame_features['presence'],
+            'brilliance': frame_features['brilliance'], 'beat_strength': frame_features['beat_strength'],
+            'beat_phase': frame_features['beat_phase'], 'bar_phase': frame_features['bar_phase'],
+            'intensity': frame_features['intensity'],
+            'spectral_centroid': frame_features['spectral_centroid'] / 22050.0,
+            'spectral_flux': np.minimum(frame_features['spectral_flux'] / 10.0, 1.0),
+            'is_chorus': (frame_features['segment_type'] == 'chorus').astype(np.float32)
+        }
+        for channel in self.analyzer.stem_channels:
+            audio_uniforms[stem_uniform_name(channel)] = frame_features[channel]
+        audio_uniforms = {k: v.tolist() for k, v in audio_uniforms.items()}
+        frame_features = {k: v.tolist() for k, v in frame_features.items()}
+        glitch_column = frame_features['glitch_intensity']
+        
         macro_idx = 0
         last_autopilot_time = -100.0
         
@@ -274,15 +306,56 @@ class AdvancedVideoExporter:
                 cap = cv2.VideoCapture(self.config.video_source)
             self.logger(f"📹 Video Input: {self.config.video_source}")
         
+        # Le GPU livre des images déjà retournées : en BGR si OpenCV les consomme (IA, séquences), en RGB pour ffmpeg
+        opencv_frames = is_sequence or self.ai_engine is not None
+        self.renderer.set_output_layout(flip=True, bgr=opencv_frames)
+        if not is_sequence:
+            sink = FFmpegVideoSink(self.config.output_path, self.width, self.height, self.config.fps,
+                                   self.config.audio_path, self.config.video_bitrate, self.config.codec,
+                                   pix_fmt="bgr24" if opencv_frames else "rgb24", flip=False, logger=self.logger)
+        
+        thumbnail_frame = total_frames // 2 if not max_duration else -1
+
+        def convert_frame(frame_num, pixels):
+            # pixels : vue (h, w, 3) sur le PBO mappé, sans copie
+            # Apply AI Style Transfer
+            if self.ai_engine:
+                return self.ai_engine.process_frame(pixels, self.config.ai_strength)
+            return pixels
+
+        def encode_frame(frame_num, frame):
+            try:
+                if is_sequence:
+                    ext = "png" if self.config.export_format == "png_seq" else "exr"
+                    filename = os.path.join(self.config.output_path, f"frame_{frame_num:05d}.{ext}")
+                    cv2.imwrite(filename, frame)
+                else:
+                    sink.write(np.ascontiguousarray(frame))
+                
+                if frame_num == thumbnail_frame:
+                    thumb_path = os.path.join(self.config.output_path if is_sequence else os.path.dirname(self.config.output_path), "thumbnail.jpg")
+                    cv2.imwrite(thumb_path, frame if opencv_frames else cv2.cvtColor(frame, cv2.COLOR_RGB2BGR))
+            finally:
+                self.renderer.release_frame(frame_num)
+
+        # Le thread GL rend et lit les pixels ; conversion et encodage suivent sur leurs threads.
+        # Une frame abandonnée libère aussi son PBO, sinon le thread GL l'attendrait.
+        pipeline = FramePipeline([("convert", convert_frame), ("encode", encode_frame)], max_pending=4,
+                                 discard=lambda frame_num, _: self.renderer.release_frame(frame_num))
+        # PBO de réserve pour les frames tenues en aval : le pipeline plein, plus celle que la lecture
+        # en cours retourne. Le thread GL n'attend alors jamais qu'un encodeur libère un PBO.
+        self.renderer.set_pbo_enabled(self.config.pbo_enabled, self.config.pbo_depth, held=pipeline.capacity + 1)
+        
         try:
             for frame_num in range(total_frames):
+                render_start = perf_counter()
                 if check_cancel and check_cancel():
                     self.logger("\n⚠️  Export annulé par l'utilisateur")
                     return
 
                 time = frame_num / self.config.fps
-                features = self.analyzer.get_features_at_time(time)
-                spectrum = self.analyzer.get_spectrum_at_time(time)
+                glitch_feature = glitch_column[frame_num]
+                spectrum = self.analyzer.get_display_spectrum(time) if self.config.spectrogram_enabled else None
                 
                 # Style Logic
                 # Macro Playback override
@@ -308,48 +381,28 @@ class AdvancedVideoExporter:
 
                 # Auto-Pilot Logic
                 if self.config.autopilot:
-                    should_change = False
-                    
-                    # Timer based
-                    if self.config.autopilot_timer > 0 and (time - last_autopilot_time) >= self.config.autopilot_timer:
-                        should_change = True
-                        self.logger(f"🤖 Auto-Pilot: Timer trigger at {time:.2f}s")
-
-                    # Drop based
-                    if self.config.autopilot_on_drop:
-                        if features.glitch_intensity > 0.7 and (time - last_autopilot_time) > 4.0:
-                            should_change = True
-                            self.logger(f"🤖 Auto-Pilot: Drop detected at {time:.2f}s")
-
-                    if should_change:
-                        import random
-                        new_style = random.choice(self.available_styles)
-                        if len(self.available_styles) > 1:
-                            while new_style == self.style:
-                                new_style = random.choice(self.available_styles)
-                        self.style = new_style
-                        last_autopilot_time = time
+                    last_autopilot_time = self._autopilot_step(time, glitch_feature, last_autopilot_time,
+                                                               beat_grid=self.analyzer.beat_grid)
 
+                progress = 0.0
                 if self.config.dynamic_style and not self.config.autopilot:
                     style_duration = 10.0
                     style_index = int(time / style_duration)
                     style1 = self.available_styles[style_index % len(self.available_styles)]
                     style2 = self.available_styles[(style_index + 1) % len(self.available_styles)]
                     progress = max(0.0, (time % style_duration - 8.0) / 2.0)
-                    shader_code = ProceduralShaderGenerator.generate_shader(style1, self.profile, style2, progress, vr_mode=self.config.vr_mode)
+                    program = self._program_for(style1, style2, progress)
                 else:
                     base = self.style_mapping.get(self.style, self.style) if self.style in self.style_mapping or self.style in self.available_styles else "fractal"
-                    shader_code = ProceduralShaderGenerator.generate_shader(base, self.profile, vr_mode=self.config.vr_mode)
+                    program = self._program_for(base)
                 
                 # Apply Modulations
                 current_params = self.params.copy()
                 for mod in self.config.modulations:
-                    if hasattr(features, mod['source']) and mod['target'] in current_params:
-                        source_val = getattr(features, mod['source'])
+                    if mod['source'] in frame_features and mod['target'] in current_params:
+                        source_val = frame_features[mod['source']][frame_num]
                         current_params[mod['target']] += source_val * mod['amount']
 
-                program = self.renderer.get_program(shader_code, ProceduralShaderGenerator.VERTEX_SHADER)
-                
                 # Update iChannel0
                 if cap and cap.isOpened():
                     ret, frame = cap.read()
@@ -364,16 +417,10 @@ class AdvancedVideoExporter:
                         glTexImage2D(GL_TEXTURE_2D, 0, GL_RGB, frame.shape[1], frame.shape[0], 0, GL_BGR, GL_UNSIGNED_BYTE, frame)
 
                 # Uniforms
-                uniforms = {
-                    'resolution': (float(self.width), float(self.height)), 'time': time,
-                    'sub_bass': features.sub_bass, 'bass': features.bass, 'low_mid': features.low_mid,
-                    'mid': features.mid, 'high_mid': features.high_mid, 'presence': features.presence,
-                    'brilliance': features.brilliance, 'beat_strength': features.beat_strength,
-                    'intensity': features.intensity, 'spectral_centroid': features.spectral_centroid / 22050.0,
-                    'spectral_flux': min(features.spectral_flux / 10.0, 1.0),
-                    'glitch_intensity': min(1.0, features.glitch_intensity + current_params['glitch_strength']),
-                    'is_chorus': 1.0 if features.segment_type == 'chorus' else 0.0
-                }
+                uniforms = {'resolution': (float(self.width), float(self.height)), 'time': time}
+                for k, column in audio_uniforms.items(): uniforms[k] = column[frame_num]
+                uniforms['glitch_intensity'] = min(1.0, glitch_feature + current_params['glitch_strength'])
+                uniforms['transition_progress'] = float(progress)
                 for k, v in current_params.items(): uniforms[k] = v
                 
                 if hasattr(self, 'video_texture'):
@@ -396,7 +443,8 @@ class AdvancedVideoExporter:
                 self.renderer.render_to_fbo(program, uniforms)
                 self.overlay.render(time, self.config.text_effect, spectrum)
                 
-                pixels = self.renderer.read_pixels()
+                # Lectures asynchrones : les frames ressortent numérotées, quelques frames plus tard
+                ready = self.renderer.read_pixels(frame_num, zero_copy=True)
                 self.renderer.blit_to_screen()
                 
                 if preview_window:
@@ -406,43 +454,80 @@ class AdvancedVideoExporter:
                 else:
                     pygame.event.pump()
                 
-                frame = np.frombuffer(pixels, dtype=np.uint8).reshape(self.height, self.width, 3)
-                frame = cv2.flip(frame, 0)
-                frame = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
-                
-                # Apply AI Style Transfer
-                if self.ai_engine:
-                    frame = self.ai_engine.process_frame(frame, self.config.ai_strength)
-                
-                if is_sequence:
-                    ext = "png" if self.config.export_format == "png_seq" else "exr"
-                    filename = os.path.join(self.config.output_path, f"frame_{frame_num:05d}.{ext}")
-                    cv2.imwrite(filename, frame)
-                else:
-                    out.write(frame)
-                
-                if frame_num == total_frames // 2 and not max_duration:
-                    thumb_path = os.path.join(self.config.output_path if is_sequence else os.path.dirname(self.config.output_path), "thumbnail.jpg")
-                    cv2.imwrite(thumb_path, frame)
+                pipeline.record("render", perf_counter() - render_start)
+                for done_num, pixels in ready:
+                    pipeline.submit(done_num, pixels)
                 
                 if progress_callback and (frame_num % self.config.fps == 0 or frame_num == total_frames - 1):
                     progress_callback((frame_num + 1) / total_frames * 100)
             
+            # Dernières frames encore dans l'anneau de lecture
+            for done_num, pixels in self.renderer.flush(zero_copy=True):
+                pipeline.submit(done_num, pixels)
+            pipeline.close()
             self.logger("\n✅ Rendu visuel terminé!")
+            self.logger(f"⏱️ Débit par étape: {pipeline.summary()}")
+            rendered = True
         finally:
-            if out: out.release()
+            # Annulation ou erreur : pas de vidéo partielle
+            if not rendered: pipeline.cancel()
+            if sink and not rendered: sink.abort()
             if cap: cap.release()
             self.renderer.cleanup()
         
         if not is_sequence:
             if merge_callback: merge_callback()
-            FFmpegHandler.merge_audio_video(temp_video, self.config.audio_path, self.config.output_path, self.config.video_bitrate, self.config.codec, self.logger)
+            sink.close()
         elif self.config.export_audio and self.config.audio_path:
             # Export audio séparé pour les séquences d'images
             ext = os.path.splitext(self.config.audio_path)[1]
             audio_out = os.path.join(self.config.output_path, f"audio{ext}")
             FFmpegHandler.export_audio_segment(self.config.audio_path, audio_out, duration if max_duration else None, self.logger)
 
+    def _program_for(self, style, style2=None, transition_progress=0.0):
+        """Programme GL d'un style : recherche par clé compacte, GLSL généré et compilé au premier usage seulement.
+
+        En transition, la progression passe par l'uniform transition_progress : au plus deux
+        programmes par paire de styles, aucune compilation une fois la paire vue.
+        """
+        key = ProceduralShaderGenerator.shader_key(style, style2, transition_progress, vr_mode=self.config.vr_mode)
+        program = self.renderer.program_cache.get(key)
+        if program is None:
+            shader_code = ProceduralShaderGenerator.generate_shader(style, self.profile, style2, transition_progress, vr_mode=self.config.vr_mode)
+            program = self.renderer.get_program(shader_code, ProceduralShaderGenerator.VERTEX_SHADER, key=key)
+        return program
+
+    def _autopilot_step(self, time, glitch_feature, last_autopilot_time, beat_grid=None):
+        """Change de style sur timer ou sur drop ; retourne l'instant du dernier changement.
+        
+        Avec une grille de beats, le changement sur timer attend le premier temps fort suivant l'échéance.
+        """
+        should_change = False
+        
+        # Timer based
+        next_change = last_autopilot_time + self.config.autopilot_timer
+        if beat_grid is not None:
+            next_change = beat_grid.bar_start(int(np.ceil(beat_grid.bar_position(next_change) - 1e-6)))
+        if self.config.autopilot_timer > 0 and time >= next_change:
+            should_change = True
+            self.logger(f"🤖 Auto-Pilot: Timer trigger at {time:.2f}s")
+
+        # Drop based
+        if self.config.autopilot_on_drop:
+            if glitch_feature > 0.7 and (time - last_autopilot_time) > 4.0:
+                should_change = True
+                self.logger(f"🤖 Auto-Pilot: Drop detected at {time:.2f}s")
+
+        if should_change:
+            import random
+            new_style = random.choice(self.available_styles)
+            if len(self.available_styles) > 1:
+                while new_style == self.style:
+                    new_style = random.choice(self.available_styles)
+            self.style = new_style
+            return time
+        return last_autopilot_time
+
     def visualize(self, check_cancel=None, output_path=None, input_device_index=None, merge_callback=None):
         try: import pyaudio
         except ImportError:
@@ -450,23 +535,46 @@ class AdvancedVideoExporter:
             return
 
         self.logger("🎤 Démarrage du Visualiseur Temps Réel...")
+        from audio_analysis import RealTimeAudioAnalyzer, AudioRingBuffer
+        # Capture en mode callback : le thread audio remplit l'anneau, le rendu n'attend jamais l'audio
+        ring = AudioRingBuffer(capacity=44100, window_size=1024, hop_size=512)
+        audio_frames = []
+        
+        def audio_callback(in_data, frame_count, time_info, status):
+            ring.write(np.frombuffer(in_data, dtype=np.float32))
+            if status & pyaudio.paInputOverflow:
+                ring.input_overflows += 1
+            if output_path:
+                audio_frames.append(in_data)
+            return (None, pyaudio.paContinue)
+        
         p = pyaudio.PyAudio()
         try:
-            stream = p.open(format=pyaudio.paFloat32, channels=1, rate=44100, input=True, input_device_index=input_device_index, frames_per_buffer=1024)
+            stream = p.open(format=pyaudio.paFloat32, channels=1, rate=44100, input=True, input_device_index=input_device_index,
+                            frames_per_buffer=ring.hop_size, stream_callback=audio_callback)
+            stream.start_stream()
         except Exception as e:
             self.logger(f"❌ Erreur Audio: {e}")
+            p.terminate()
             return
 
-        rt_analyzer = RealTimeAudioAnalyzer(sr=44100, buffer_size=1024)
+        rt_analyzer = RealTimeAudioAnalyzer(sr=44100, buffer_size=ring.window_size)
+        audio_buffer = np.zeros(ring.window_size, dtype=np.float32)
+        features = rt_analyzer.process(audio_buffer)
+        reported_losses = 0
         recorder = None
-        audio_frames = []
         if output_path:
             fourcc = cv2.VideoWriter_fourcc(*'mp4v')
             recorder = cv2.VideoWriter("temp_rt.mp4", fourcc, self.config.fps, (self.width, self.height))
+            # Images retournées et en BGR dès la lecture GPU : écrites telles quelles
+            self.renderer.set_output_layout(flip=True, bgr=True)
+            # Chaque frame est libérée dès son écriture : seule celle que la lecture retourne est tenue
+            self.renderer.set_pbo_enabled(self.config.pbo_enabled, self.config.pbo_depth, held=1)
             self.logger(f"🔴 Enregistrement activé vers: {output_path}")
 
         clock = pygame.time.Clock()
         start_time = pygame.time.get_ticks()
+        last_autopilot_time = -100.0
         
         try:
             running = True
@@ -475,57 +583,73 @@ class AdvancedVideoExporter:
                 for event in pygame.event.get():
                     if event.type == QUIT or (event.type == KEYDOWN and event.key == K_ESCAPE): running = False
                 
-                try:
-                    data = stream.read(1024, exception_on_overflow=False)
-                    audio_buffer = np.frombuffer(data, dtype=np.float32)
-                except: continue
-                    
-                features = rt_analyzer.process(audio_buffer)
+                # Tous les hops arrivés depuis la dernière image (fenêtres chevauchantes) ;
+                # sans nouveau hop, on garde les features précédentes plutôt que d'attendre
+                while ring.next_window(audio_buffer):
+                    features = rt_analyzer.process(audio_buffer, new_samples=ring.hop_size)
+                
+                losses = ring.overruns + ring.input_overflows
+                if losses != reported_losses:
+                    self.logger(f"⚠️ Audio perdu: {ring.overruns} overrun(s) ({ring.dropped_samples} échantillons), "
+                                f"{ring.input_overflows} débordement(s) d'entrée")
+                    reported_losses = losses
                 time = (pygame.time.get_ticks() - start_time) / 1000.0
                 
-                shader_code = ProceduralShaderGenerator.generate_shader(self.style, self.profile, vr_mode=self.config.vr_mode)
-                program = self.renderer.get_program(shader_code, ProceduralShaderGenerator.VERTEX_SHADER)
+                # Auto-Pilot (les drops viennent du suivi live)
+                if self.config.autopilot:
+                    last_autopilot_time = self._autopilot_step(time, features.glitch_intensity, last_autopilot_time)
+                
+                program = self._program_for(self.style)
                 
                 uniforms = {
                     'resolution': (float(self.width), float(self.height)), 'time': time,
                     'sub_bass': features.sub_bass, 'bass': features.bass, 'low_mid': features.low_mid,
                     'mid': features.mid, 'high_mid': features.high_mid, 'presence': features.presence,
                     'brilliance': features.brilliance, 'beat_strength': features.beat_strength,
-                    'intensity': features.intensity, 'spectral_centroid': 0.5, 'spectral_flux': 0.0,
+                    'beat_phase': features.beat_phase, 'bar_phase': features.bar_phase,
+                    'intensity': features.intensity, 'spectral_centroid': 0.5,
+                    'spectral_flux': min(features.spectral_flux / 10.0, 1.0),
                     'glitch_intensity': min(1.0, features.glitch_intensity + self.params['glitch_strength']),
                     'is_chorus': 0.0
                 }
                 for k, v in self.params.items(): uniforms[k] = v
                 
                 self.renderer.render_to_fbo(program, uniforms)
-                self.overlay.render(time, self.config.text_effect, rt_analyzer.current_magnitude)
+                self.overlay.render(time, self.config.text_effect, rt_analyzer.get_display_spectrum() if self.config.spectrogram_enabled else None)
                 
                 if recorder:
-                    pixels = self.renderer.read_pixels()
-                    frame = np.frombuffer(pixels, dtype=np.uint8).reshape(self.height, self.width, 3)
-                    frame = cv2.flip(frame, 0)
-                    frame = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
-                    recorder.write(frame)
-                    audio_frames.append((audio_buffer * 32767).astype(np.int16).tobytes())
+                    for done_num, frame in self.renderer.read_pixels(zero_copy=True):
+                        recorder.write(frame)
+                        self.renderer.release_frame(done_num)
 
                 self.renderer.blit_to_screen()
                 clock.tick(self.config.fps)
                 pygame.display.flip()
+
+            if recorder:
+                for done_num, frame in self.renderer.flush(zero_copy=True):
+                    recorder.write(frame)
+                    self.renderer.release_frame(done_num)
         finally:
             stream.stop_stream()
             stream.close()
             p.terminate()
             self.renderer.cleanup()
             if recorder: recorder.release()
+            stats = ring.stats()
+            self.logger(f"🎤 Capture: {stats['written'] / 44100:.1f}s, {stats['overruns']} overrun(s), "
+                        f"{stats['underruns']} underrun(s), {stats['input_overflows']} débordement(s) d'entrée")
         
         if recorder:
             self.logger("💾 Sauvegarde de l'audio temporaire...")
             try:
+                # L'audio enregistré vient du callback : continu même si le rendu a pris du retard
+                pcm = np.frombuffer(b''.join(audio_frames), dtype=np.float32)
                 with wave.open("temp_rt.wav", 'wb') as wf:
                     wf.setnchannels(1)
                     wf.setsampwidth(2)
                     wf.setframerate(44100)
-                    wf.writeframes(b''.join(audio_frames))
+                    wf.writeframes((np.clip(pcm, -1.0, 1.0) * 32767).astype(np.int16).tobytes())
                 if merge_callback: merge_callback()
                 FFmpegHandler.merge_rt_recording("temp_rt.mp4", "temp_rt.wav", output_path, self.logger)
             except Exception as e: self.logger(f"❌ Erreur finalisation: {e}")
@@ -0,0 +1,121 @@
+import numpy as np
+
+# Pyramide de crêtes pour l'affichage des formes d'onde : min / max / somme des carrés par bloc,
+# niveau 0 en blocs de base_block échantillons, chaque niveau suivant fusionnant les blocs deux à deux.
+# Une requête d'affichage choisit le niveau dont le bloc est juste sous la résolution demandée :
+# au plus deux blocs par colonne, donc un coût proportionnel au nombre de pixels, pas à la durée.
+
+
+def _merge_pairs(values, ufunc, pad):
+    if len(values) % 2:
+        values = np.append(values, pad if pad is not None else values[-1])
+    return ufunc(values[0::2], values[1::2])
+
+
+class PeakPyramid:
+    """Min / max / RMS multi-résolution (puissances de deux) d'un signal mono ou stéréo."""
+
+    def __init__(self, data, sr=22050, base_block=32):
+        y = np.asarray(data, dtype=np.float32)
+        if y.ndim == 2:
+            y = y.mean(axis=0)
+        self.sr = sr
+        self.n_samples = len(y)
+        self.base_block = base_block
+
+        n_full = self.n_samples // base_block
+        full = y[:n_full * base_block].reshape(n_full, base_block)
+        mins, maxs = full.min(axis=1), full.max(axis=1)
+        sumsq = np.einsum('ij,ij->i', full, full, dtype=np.float64)
+        counts = np.full(n_full, base_block, dtype=np.int64)
+        tail = y[n_full * base_block:]
+        if len(tail):
+            mins = np.append(mins, tail.min())
+            maxs = np.append(maxs, tail.max())
+            sumsq = np.append(sumsq, np.dot(tail.astype(np.float64), tail))
+            counts = np.append(counts, len(tail))
+
+        self.levels = [(mins, maxs, sumsq, counts)]
+        while len(mins) > 1:
+            mins = _merge_pairs(mins, np.minimum, None)
+            maxs = _merge_pairs(maxs, np.maximum, None)
+            sumsq = _merge_pairs(sumsq, np.add, 0.0)
+            counts = _merge_pairs(counts, np.add, 0)
+            self.levels.append((mins, maxs, sumsq, counts))
+
+        top_min, top_max = self.levels[-1][0], self.levels[-1][1]
+        self.peak = float(max(-top_min.min(), top_max.max())) if self.n_samples else 0.0
+
+    @property
+    def duration(self):
+        return self.n_samples / self.sr
+
+    def level_for(self, samples_per_column):
+        """Niveau le plus grossier dont le bloc ne dépasse pas samples_per_column"""
+        ratio = samples_per_column / self.base_block
+        if ratio < 2.0:
+            return 0
+        return min(int(np.log2(ratio)), len(self.levels) - 1)
+
+    def columns(self, start, end, n_columns):
+        """Réduit l'intervalle d'échantillons [start, end) en n_columns colonnes (min, max, rms).
+
+        Les colonnes hors du signal valent 0. Aucun pic n'est perdu : chaque colonne couvre
+        tous les blocs qui la recoupent.
+        """
+        n_columns = max(int(n_columns), 1)
+        empty = np.zeros(n_columns, dtype=np.float32)
+        if self.n_samples == 0 or end <= start:
+            return empty, empty.copy(), empty.copy()
+
+        spp = (end - start) / n_columns
+        level = self.level_for(spp)
+        mins, maxs, sumsq, counts = self.levels[level]
+        block = self.base_block << level
+
+        edges = start + spp * np.arange(n_columns + 1)
+        valid = (edges[1:] > 0) & (edges[:-1] < self.n_samples)
+        first = np.clip(np.floor(edges[:-1] / block).astype(np.int64), 0, len(mins) - 1)
+        last = np.clip(np.ceil(edges[-1] / block).astype(np.int64), first[-1] + 1, len(mins))
+
+        # reduceat sur la tranche [first[0], last) : la colonne i couvre first[i] .. first[i+1] - 1
+        lo = first[0]
+        offsets = first - lo
+        col_min = np.minimum.reduceat(mins[lo:last], offsets)
+        col_max = np.maximum.reduceat(maxs[lo:last], offsets)
+        col_rms = np.sqrt(np.add.reduceat(sumsq[lo:last], offsets) / np.add.reduceat(counts[lo:last], offsets))
+
+        col_min = np.where(valid, col_min, 0.0).astype(np.float32)
+        col_max = np.where(valid, col_max, 0.0).astype(np.float32)
+        col_rms = np.where(valid, col_rms, 0.0).astype(np.float32)
+        return col_min, col_max, col_rms
+
+    def columns_for_time(self, start_sec, end_sec, n_columns):
+        return self.columns(start_sec * self.sr, end_sec * self.sr, n_columns)
+
+
+def zigzag_points(left, width, upper, lower):
+    """Points (x, y) d'une polyligne qui trace un trait vertical upper -> lower par colonne"""
+    n = len(upper)
+    points = np.empty((2 * n, 2), dtype=np.float64)
+    xs = left + (np.arange(n) + 0.5) * (width / max(n, 1))
+    points[0::2, 0] = xs
+    points[1::2, 0] = xs
+    points[0::2, 1] = upper
+    points[1::2, 1] = lower
+    return points
+
+
+def polygon_from_points(points):
+    """QPolygonF rempli directement depuis un tableau (N, 2) float64, sans boucle Python"""
+    from PyQt6.QtCore import QPointF
+    from PyQt6.QtGui import QPolygonF
+    polygon = QPolygonF()
+    n = len(points)
+    if n == 0:
+        return polygon
+    polygon.fill(QPointF(), n)
+    buffer = polygon.data()
+    buffer.setsize(n * 2 * 8)
+    np.frombuffer(buffer, dtype=np.float64).reshape(n, 2)[:] = points
+    return polygon